@@ -3,7 +3,8 @@ Web interface for ADHISHTA NANDY - A lightweight Telegram music bot
 """
 import os
 import asyncio
-from flask import Flask, render_template, request, redirect, url_for, flash
+import time
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, g
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from dotenv import load_dotenv
@@ -11,6 +12,17 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Metrics are shared with the bot when both run in this process (python main.py)
+try:
+    from bot.metrics import metrics as metrics_registry
+except ImportError:
+    metrics_registry = None
+
+try:
+    from bot.tracing import tracer
+except ImportError:
+    tracer = None
+
 class Base(DeclarativeBase):
     pass
 
@@ -47,6 +59,44 @@ class SearchHistory(db.Model):
 with app.app_context():
     db.create_all()
 
+if metrics_registry is not None:
+    WEB_REQUESTS = metrics_registry.counter('web_requests_total', 'Web requests by endpoint and status', ('endpoint', 'status'))
+    WEB_LATENCY = metrics_registry.histogram('web_request_seconds', 'Web request handling time', ('endpoint',))
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        endpoint = request.endpoint or 'unknown'
+        WEB_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+        started = g.get('request_started')
+        if started is not None:
+            WEB_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint)
+        return response
+
+@app.route('/metrics')
+def metrics():
+    """Metrics of the bot and web app in Prometheus text format"""
+    if metrics_registry is None:
+        return Response("Metrics are not available\n", status=503, mimetype='text/plain')
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/traces')
+def traces():
+    """Slow /play traces and per-stage latency percentiles of the bot"""
+    # Under gunicorn the bot runs in another process and nothing is traced here
+    if tracer is None or not tracer.active:
+        return render_template('traces.html', available=False, traces=[], stages={}, slow_seconds=None)
+    return render_template(
+        'traces.html',
+        available=True,
+        traces=tracer.slow_traces_list(),
+        stages=tracer.stage_percentiles(),
+        slow_seconds=tracer.slow_seconds
+    )
+
 @app.route('/')
 def index():
     """Home page"""
@@ -77,38 +127,33 @@ def search():
         try:
             # Import the YouTube search function
             try:
-                from bot.ytdl import get_video_info
+                from bot.ytdl import search as youtube_search
                 
-                # Run the async function
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                info = loop.run_until_complete(get_video_info(query))
+                # Run the async function; the extraction itself runs on the shared extractor pool
+                results = asyncio.run(youtube_search(query))
             except ImportError:
                 app.logger.error("Could not import necessary modules. Please install yt-dlp package.")
                 flash('YouTube search functionality is not available. Required packages are not installed.', 'danger')
                 return render_template('search.html', result=False, query=query, error="Missing required packages")
             
-            if info:
-                title, duration, thumbnail, video_url = info
+            if results:
+                top = results[0]
                 
-                # Save to search history
+                # Save the top result to search history
                 search_record = SearchHistory(
                     query=query,
-                    title=title,
-                    duration=duration,
-                    video_url=video_url
+                    title=top['title'],
+                    duration=top['duration'],
+                    video_url=top['video_url']
                 )
                 db.session.add(search_record)
                 db.session.commit()
                 
-                flash(f'Found video: {title}', 'success')
+                flash(f'Found {len(results)} videos', 'success')
                 return render_template('search.html', 
                                        result=True, 
                                        query=query,
-                                       title=title,
-                                       duration=duration,
-                                       thumbnail=thumbnail,
-                                       video_url=video_url,
+                                       results=results,
                                        bot_username=bot_username)
             else:
                 flash('No results found', 'warning')
@@ -0,0 +1,75 @@
+"""
+Benchmark the MP3 transcode download against the native audio download.
+
+Downloads each track once per mode and reports wall time and CPU seconds
+(this process plus child processes such as ffmpeg) per track.
+
+Usage:
+    python benchmarks/bench_audio_format.py "<query or URL>" ["<query or URL>" ...]
+"""
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp as youtube_dl
+from bot.ytdl import get_download_opts, downloaded_file_path
+
+MODES = ('mp3', 'native')
+
+def cpu_seconds():
+    """Get user+system CPU seconds of this process and its finished children"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def download(query, audio_format):
+    """
+    Download one track in the given mode
+
+    Returns:
+        tuple: (wall_seconds, cpu_seconds, file_size)
+    """
+    temp_dir = tempfile.mkdtemp()
+    try:
+        opts = get_download_opts(audio_format)
+        opts['outtmpl'] = os.path.join(temp_dir, '%(id)s.%(ext)s')
+
+        cpu_start = cpu_seconds()
+        wall_start = time.perf_counter()
+        with youtube_dl.YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(query, download=True)
+            if 'entries' in info:
+                info = info['entries'][0]
+        wall = time.perf_counter() - wall_start
+        cpu = cpu_seconds() - cpu_start
+
+        path = downloaded_file_path(info, temp_dir, audio_format)
+        return wall, cpu, os.path.getsize(path)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def main(queries):
+    totals = {mode: [0.0, 0.0] for mode in MODES}
+
+    print(f"{'mode':<8} {'wall s':>8} {'cpu s':>8} {'size KB':>9}  track")
+    for query in queries:
+        for mode in MODES:
+            wall, cpu, size = download(query, mode)
+            totals[mode][0] += wall
+            totals[mode][1] += cpu
+            print(f"{mode:<8} {wall:>8.2f} {cpu:>8.2f} {size // 1024:>9}  {query}")
+
+    print()
+    for mode, (wall, cpu) in totals.items():
+        print(f"{mode:<8} avg wall {wall / len(queries):.2f}s, avg cpu {cpu / len(queries):.2f}s per track")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1:])
@@ -0,0 +1,84 @@
+"""
+Load-test the resolve + download pipeline offline with the fake extractor backend.
+
+Runs the given number of concurrent requests for distinct tracks, then the
+same requests again (served from the caches), and reports latency
+percentiles and the backend, scheduler and cache counters. Latencies of
+the fake backend come from FAKE_EXTRACT_LATENCY / FAKE_DOWNLOAD_LATENCY.
+
+Usage:
+    python benchmarks/bench_pipeline.py [requests] [distinct_tracks]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Must be set before bot modules read the configuration
+os.environ.setdefault("EXTRACTOR_BACKEND", "fake")
+os.environ.setdefault("AUDIO_CACHE_DIR", tempfile.mkdtemp(prefix="bench-audio-"))
+
+from bot.extractors import extractor_backend
+from bot.scheduler import download_scheduler
+from bot.audio_cache import audio_cache
+from bot.ytdl import download_and_extract_audio, get_info_cache_stats
+
+def percentile(values, pct):
+    """Get the pct-th percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def timed_request(query):
+    """
+    Resolve and download one track
+
+    Returns:
+        float: Seconds until the audio file was ready, or None on failure
+    """
+    start = time.perf_counter()
+    result = await download_and_extract_audio(query)
+    if not result:
+        return None
+    return time.perf_counter() - start
+
+async def run_round(name, queries):
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(timed_request(query) for query in queries))
+    wall = time.perf_counter() - start
+
+    ok = [latency for latency in latencies if latency is not None]
+    failed = len(latencies) - len(ok)
+    if not ok:
+        print(f"{name:<6} all {failed} requests failed")
+        return
+
+    print(
+        f"{name:<6} {len(ok):>5} ok {failed:>3} failed  wall {wall:6.2f}s  "
+        f"p50 {percentile(ok, 50):6.3f}s  p95 {percentile(ok, 95):6.3f}s  "
+        f"p99 {percentile(ok, 99):6.3f}s  max {max(ok):6.3f}s"
+    )
+
+async def main(requests, tracks):
+    queries = [f"benchmark track {i % tracks}" for i in range(requests)]
+
+    print(f"backend {extractor_backend.name}, {requests} requests over {tracks} tracks")
+    await run_round("cold", queries)
+    await run_round("warm", queries)
+
+    print()
+    print(f"backend   {extractor_backend.stats()}")
+    print(f"scheduler {download_scheduler.stats()}")
+    print(f"metadata  {get_info_cache_stats()}")
+    print(f"audio     {audio_cache.stats()}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 or any(not arg.isdigit() for arg in sys.argv[1:]):
+        print(__doc__)
+        sys.exit(1)
+    request_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    track_count = int(sys.argv[2]) if len(sys.argv) > 2 else request_count
+    asyncio.run(main(request_count, max(1, track_count)))
@@ -0,0 +1,77 @@
+"""
+Measure memory per queued track: the old dict-in-list queue against Track records in a deque.
+
+Both layouts hold the same strings; the difference is the per-track
+container overhead.
+
+Usage:
+    python benchmarks/bench_queue_memory.py [tracks]
+"""
+import os
+import sys
+import tracemalloc
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.state import Track
+
+def make_fields(i):
+    """Build the distinct field values of one track"""
+    video_id = f"{i:011d}"
+    return (
+        f"Some Artist - Some Song Title {i}",
+        "3:45",
+        225,
+        f"https://www.youtube.com/watch?v={video_id}",
+        f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+        f"some song title {i}",
+    )
+
+def dict_queue(count):
+    """Queue layout before: list of dicts, file_path added by the prefetcher"""
+    queue = []
+    for i in range(count):
+        title, duration, _, video_url, thumbnail, query = make_fields(i)
+        song = {
+            'title': title,
+            'duration': duration,
+            'video_url': video_url,
+            'thumbnail': thumbnail,
+            'query': query
+        }
+        song['file_path'] = None
+        queue.append(song)
+    return queue
+
+def track_queue(count):
+    """Queue layout after: Track records in a deque"""
+    queue = deque()
+    for i in range(count):
+        queue.append(Track(*make_fields(i)))
+    return queue
+
+def measure(build, count):
+    """Get bytes allocated per track by a queue builder"""
+    tracemalloc.start()
+    queue = build(count)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del queue
+    return size / count
+
+def main(count):
+    before = measure(dict_queue, count)
+    after = measure(track_queue, count)
+
+    print(f"{count} queued tracks")
+    print(f"{'layout':<16} {'bytes/track':>12}")
+    print(f"{'dict in list':<16} {before:>12.0f}")
+    print(f"{'Track in deque':<16} {after:>12.0f}")
+    print(f"saved {before - after:.0f} bytes per track ({(before - after) / before:.0%})")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 or (len(sys.argv) == 2 and not sys.argv[1].isdigit()):
+        print(__doc__)
+        sys.exit(1)
+    main(int(sys.argv[1]) if len(sys.argv) == 2 else 100000)
@@ -0,0 +1,208 @@
+"""
+Pool of assistant accounts that join voice chats, with least-loaded placement and sticky routing.
+"""
+import logging
+from pyrogram import Client
+from pytgcalls import PyTgCalls
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+class NoAssistantAvailable(Exception):
+    """Raised when every assistant is serving its maximum number of chats"""
+
+class Assistant:
+    """A Pyrogram account with its own PyTgCalls instance"""
+    def __init__(self, index: int, client: Client):
+        """
+        Initialize the assistant
+
+        Args:
+            index (int): Position in the pool, used in logs and stats
+            client (pyrogram.Client): Account that joins the voice chats
+        """
+        self.index = index
+        self.client = client
+        self.calls = PyTgCalls(client)
+
+        # Chats whose voice chat this assistant is serving
+        self.chats = set()
+
+        # Total chats ever placed on this assistant
+        self.placed = 0
+
+    @property
+    def load(self):
+        """Number of chats assigned to this assistant"""
+        return len(self.chats)
+
+class AssistantPool:
+    """
+    Spreads voice chats over several assistants. A chat is placed on the
+    least-loaded assistant when playback starts and stays there until it is
+    released, so all calls for one chat go through the same PyTgCalls.
+    """
+    def __init__(self, clients, max_calls: int):
+        """
+        Initialize the pool
+
+        Args:
+            clients (list): Pyrogram clients, one per assistant
+            max_calls (int): Maximum chats per assistant (0 for no limit)
+        """
+        self.assistants = [Assistant(index, client) for index, client in enumerate(clients)]
+        self.max_calls = max_calls
+
+        # chat_id -> Assistant
+        self._placement = {}
+
+        # Placements refused because every assistant was full
+        self.rejected = 0
+
+    def on_update(self, on_update):
+        """
+        Route the PyTgCalls updates of every assistant to one handler
+
+        Args:
+            on_update (callable): Coroutine function called with each PyTgCalls update
+        """
+        async def _handler(_, update):
+            await on_update(update)
+
+        for assistant in self.assistants:
+            assistant.calls.on_update()(_handler)
+
+    async def start(self):
+        """
+        Start every assistant's PyTgCalls, which also connects its Pyrogram client
+
+        Assistants that fail to start are left out of the pool.
+
+        Raises:
+            RuntimeError: If no assistant could be started
+        """
+        started = []
+        for assistant in self.assistants:
+            try:
+                await assistant.calls.start()
+                started.append(assistant)
+                logger.info(f"Assistant {assistant.index} started")
+            except Exception as e:
+                logger.error(f"Failed to start assistant {assistant.index}: {e}")
+
+        if not started:
+            raise RuntimeError("No assistant could be started")
+        self.assistants = started
+
+    async def stop(self, skip=None):
+        """
+        Disconnect the assistants' Pyrogram clients
+
+        Args:
+            skip (pyrogram.Client, optional): Client stopped by its owner, i.e.
+                the bot's own client when it is also the only assistant
+        """
+        for assistant in self.assistants:
+            if assistant.client is skip or not assistant.client.is_connected:
+                continue
+            try:
+                await assistant.client.stop()
+                logger.info(f"Assistant {assistant.index} stopped")
+            except Exception as e:
+                logger.error(f"Error stopping assistant {assistant.index}: {e}")
+
+    def _has_room(self, assistant):
+        return self.max_calls <= 0 or assistant.load < self.max_calls
+
+    def get(self, chat_id):
+        """
+        Get the assistant a chat is placed on
+
+        Args:
+            chat_id (int): Chat ID
+
+        Returns:
+            Assistant: Placed assistant or None
+        """
+        return self._placement.get(chat_id)
+
+    def assign(self, chat_id):
+        """
+        Get the assistant serving a chat, placing the chat on the
+        least-loaded assistant with room if it has none yet
+
+        Args:
+            chat_id (int): Chat ID
+
+        Returns:
+            Assistant: Assistant for the chat, or None if every assistant is full
+        """
+        assistant = self._placement.get(chat_id)
+        if assistant is not None:
+            return assistant
+
+        candidates = [assistant for assistant in self.assistants if self._has_room(assistant)]
+        if not candidates:
+            self.rejected += 1
+            logger.warning(f"No assistant has room for chat {chat_id}")
+            return None
+
+        assistant = min(candidates, key=lambda candidate: (candidate.load, candidate.index))
+        assistant.chats.add(chat_id)
+        assistant.placed += 1
+        self._placement[chat_id] = assistant
+        logger.info(f"Placed chat {chat_id} on assistant {assistant.index} (load {assistant.load})")
+        return assistant
+
+    def release(self, chat_id):
+        """
+        Free a chat's place once the assistant left its voice chat
+
+        Args:
+            chat_id (int): Chat ID
+        """
+        assistant = self._placement.pop(chat_id, None)
+        if assistant is not None:
+            assistant.chats.discard(chat_id)
+            logger.info(f"Released chat {chat_id} from assistant {assistant.index} (load {assistant.load})")
+
+    def stats(self):
+        """
+        Get the load of every assistant
+
+        Returns:
+            dict: Pool capacity and per-assistant chat counts
+        """
+        return {
+            'max_calls': self.max_calls,
+            'chats': len(self._placement),
+            'rejected': self.rejected,
+            'assistants': [
+                {'index': assistant.index, 'chats': assistant.load, 'placed': assistant.placed}
+                for assistant in self.assistants
+            ],
+        }
+
+def create_assistant_clients(bot_client: Client):
+    """
+    Create the Pyrogram clients of the assistant pool
+
+    Args:
+        bot_client (pyrogram.Client): Bot client, used when no assistant sessions are configured
+
+    Returns:
+        list: Pyrogram clients
+    """
+    if not Config.ASSISTANT_SESSIONS:
+        return [bot_client]
+
+    return [
+        Client(
+            f"LuminousAssistant{index}",
+            api_id=Config.API_ID,
+            api_hash=Config.API_HASH,
+            session_string=session,
+            in_memory=True
+        )
+        for index, session in enumerate(Config.ASSISTANT_SESSIONS)
+    ]
@@ -0,0 +1,414 @@
+"""
+Size-bounded on-disk cache of downloaded audio files, keyed by video id and format.
+"""
+import logging
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from bot.config import Config
+from bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class AudioCache:
+    """
+    Keeps downloaded audio files in one directory as <video_id>-<format>.<ext>
+    and evicts the least recently used files once the byte budget is exceeded.
+    Files reported as in use by a registered provider are never evicted.
+
+    A background reaper also deletes files nothing has used for a grace
+    period, frees space while the disk is above its high-water mark, and
+    removes download directories that no download owns anymore.
+    """
+    def __init__(self, directory: str, max_bytes: int, grace_seconds: float = 0,
+                 high_water_percent: float = 0, reap_interval: float = 60):
+        """
+        Initialize the audio cache and rebuild its index from disk
+
+        Args:
+            directory (str): Directory holding the cached files
+            max_bytes (int): Byte budget for all cached files
+            grace_seconds (float): Delete files unused for this long (0 to keep them until evicted)
+            high_water_percent (float): Disk usage percent above which unused files are deleted (0 to ignore)
+            reap_interval (float): Seconds between reaper passes
+        """
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.grace_seconds = grace_seconds
+        self.high_water_percent = high_water_percent
+        self.reap_interval = max(1, reap_interval)
+
+        # Downloads are written here first and moved into place when complete
+        self.tmp_dir = os.path.join(self.directory, '.tmp')
+
+        # (video_id, fmt) -> (path, size), least recently used first
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        # (video_id, fmt) -> when the file was last looked up, stored or in use
+        self._last_used = {}
+
+        # Download directories from make_temp_dir that are still in use
+        self._temp_dirs = set()
+
+        self._reaper = None
+        self._reap_requested = None
+
+        # Callables returning paths that must not be evicted
+        self._in_use_providers = []
+
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.reaped_files = 0
+        self.reaped_bytes = 0
+        self.reaped_temp_dirs = 0
+
+        self.rebuild_index()
+
+    def rebuild_index(self):
+        """Scan the cache directory so a restarted worker reuses existing files"""
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Partial downloads from a previous run are never valid
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+        found = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            key = self._parse_filename(entry.name)
+            if key is None:
+                continue
+            stat = entry.stat()
+            found.append((stat.st_mtime, key, entry.path, stat.st_size))
+
+        with self._lock:
+            self._entries.clear()
+            self._last_used.clear()
+            self._total_bytes = 0
+            # Oldest modification time first; hits refresh the mtime
+            for mtime, key, path, size in sorted(found):
+                self._entries[key] = (path, size)
+                self._last_used[key] = mtime
+                self._total_bytes += size
+
+        logger.info(f"Audio cache index rebuilt: {len(found)} files, {self._total_bytes} bytes")
+        self.evict()
+
+    @staticmethod
+    def _parse_filename(name):
+        """Get (video_id, fmt) from a cache file name or None"""
+        stem, dot, _ = name.rpartition('.')
+        if not dot:
+            return None
+        video_id, dash, fmt = stem.rpartition('-')
+        if not dash or not video_id or not fmt:
+            return None
+        return video_id, fmt
+
+    def register_in_use(self, provider):
+        """
+        Register a callable returning file paths that are currently in use
+
+        Args:
+            provider (callable): Returns an iterable of file paths
+        """
+        self._in_use_providers.append(provider)
+
+    def _paths_in_use(self):
+        paths = set()
+        for provider in self._in_use_providers:
+            try:
+                paths.update(os.path.abspath(path) for path in provider() if path)
+            except Exception as e:
+                logger.error(f"Error collecting in-use audio files: {e}")
+        return paths
+
+    def lookup(self, video_id, fmt):
+        """
+        Get the cached file for a video
+
+        Args:
+            video_id (str): YouTube video id
+            fmt (str): Audio format key
+
+        Returns:
+            str: Path to the cached file or None on a miss
+        """
+        key = (video_id, fmt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            path, size = entry
+            if not os.path.exists(path):
+                del self._entries[key]
+                self._last_used.pop(key, None)
+                self._total_bytes -= size
+                return None
+
+            self._entries.move_to_end(key)
+            self._last_used[key] = time.time()
+
+        # Refresh the mtime so the LRU order survives a restart
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def make_temp_dir(self):
+        """
+        Create a private working directory for a download
+
+        Returns:
+            str: Path of the new directory inside the cache; pass it to
+                remove_temp_dir when the download is over
+        """
+        self._ensure_reaper()
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        # Registered under the lock so the reaper never sees it unowned
+        with self._lock:
+            temp_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+            self._temp_dirs.add(temp_dir)
+        return temp_dir
+
+    def remove_temp_dir(self, temp_dir):
+        """
+        Delete a download directory from make_temp_dir and everything left in it
+
+        Args:
+            temp_dir (str): Directory returned by make_temp_dir
+        """
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        with self._lock:
+            self._temp_dirs.discard(temp_dir)
+
+    def store(self, video_id, fmt, src_path, ext=None):
+        """
+        Atomically move a finished download into the cache
+
+        Args:
+            video_id (str): YouTube video id
+            fmt (str): Audio format key
+            src_path (str): Finished file inside a directory from make_temp_dir
+            ext (str, optional): File extension to use instead of the source's
+
+        Returns:
+            str: Final path of the cached file
+        """
+        ext = f".{ext}" if ext else (os.path.splitext(src_path)[1] or '.audio')
+        path = os.path.join(self.directory, f"{video_id}-{fmt}{ext}")
+        size = os.path.getsize(src_path)
+
+        # Same filesystem, so readers see either no file or the complete file
+        os.replace(src_path, path)
+
+        key = (video_id, fmt)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+                if old[0] != path and os.path.exists(old[0]):
+                    os.remove(old[0])
+            self._entries[key] = (path, size)
+            self._last_used[key] = time.time()
+            self._total_bytes += size
+
+        self.evict()
+        return path
+
+    def _remove(self, key):
+        """
+        Delete a cached file and drop it from the index (caller holds the lock)
+
+        Returns:
+            int: Bytes freed, or None if the file could not be deleted
+        """
+        path, size = self._entries[key]
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error deleting cached audio {path}: {e}")
+            return None
+
+        del self._entries[key]
+        self._last_used.pop(key, None)
+        self._total_bytes -= size
+        return size
+
+    def evict(self):
+        """Remove least recently used files until the cache fits its byte budget"""
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        in_use = self._paths_in_use()
+        with self._lock:
+            for key in list(self._entries):
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+                path = self._entries[key][0]
+                if path in in_use:
+                    continue
+
+                size = self._remove(key)
+                if size is None:
+                    continue
+
+                self.evicted_files += 1
+                self.evicted_bytes += size
+                logger.info(f"Evicted cached audio: {path}")
+
+        if self._total_bytes > self.max_bytes:
+            logger.warning(f"Audio cache over budget ({self._total_bytes} bytes), remaining files are in use")
+
+    def _bytes_over_high_water(self):
+        """Get how many bytes must be freed to bring the disk below the high-water mark"""
+        if self.high_water_percent <= 0:
+            return 0
+        usage = shutil.disk_usage(self.directory)
+        return max(0, usage.used - usage.total * self.high_water_percent / 100)
+
+    @staticmethod
+    def _tree_size(path):
+        size = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    size += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return size
+
+    def reap(self, in_use=None):
+        """
+        Delete audio files and download directories that are no longer needed
+
+        Unused files go once nothing has used them for the grace period, or
+        least recently used first while the disk is above the high-water
+        mark. Files that are playing or queued are never touched. Blocking;
+        the background reaper runs it in a thread.
+
+        Args:
+            in_use (set, optional): Absolute paths in use; collected from the providers if omitted
+
+        Returns:
+            int: Bytes reclaimed
+        """
+        if in_use is None:
+            in_use = self._paths_in_use()
+        now = time.time()
+        files = dirs = reclaimed = 0
+
+        # Directories left behind by downloads that never cleaned up; list
+        # first so a directory created meanwhile is already registered
+        try:
+            found = [entry.path for entry in os.scandir(self.tmp_dir) if entry.is_dir()]
+        except FileNotFoundError:
+            found = []
+        with self._lock:
+            owned = set(self._temp_dirs)
+        for temp_dir in found:
+            if temp_dir in owned:
+                continue
+            size = self._tree_size(temp_dir)
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            dirs += 1
+            reclaimed += size
+
+        over = self._bytes_over_high_water()
+        with self._lock:
+            for key in list(self._entries):
+                path = self._entries[key][0]
+                if path in in_use:
+                    self._last_used[key] = now
+                    continue
+
+                expired = self.grace_seconds > 0 and now - self._last_used.get(key, now) >= self.grace_seconds
+                if not expired and over <= 0:
+                    continue
+
+                size = self._remove(key)
+                if size is None:
+                    continue
+                files += 1
+                reclaimed += size
+                over -= size
+
+            self.reaped_files += files
+            self.reaped_bytes += reclaimed
+            self.reaped_temp_dirs += dirs
+
+        if over > 0:
+            logger.warning(f"Disk above {self.high_water_percent}% with no unused audio left to delete")
+        if reclaimed or dirs:
+            logger.info(f"Reaper reclaimed {reclaimed} bytes ({files} files, {dirs} temp dirs)")
+        return reclaimed
+
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reap_requested = asyncio.Event()
+            self._reaper = asyncio.ensure_future(self._reap_loop())
+
+    def reap_soon(self):
+        """Run a reaper pass now instead of at the next interval, e.g. after playback stopped"""
+        if self._reap_requested is not None:
+            self._reap_requested.set()
+
+    async def _reap_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._reap_requested.wait(), self.reap_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._reap_requested.clear()
+
+            # Collected on the event loop, where the providers' state lives
+            in_use = self._paths_in_use()
+            try:
+                await asyncio.to_thread(self.reap, in_use)
+            except Exception as e:
+                logger.error(f"Error reaping audio files: {e}")
+
+    def stats(self):
+        """
+        Get cache usage
+
+        Returns:
+            dict: File count, bytes used, budget and eviction counters
+        """
+        with self._lock:
+            return {
+                'files': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'evicted_files': self.evicted_files,
+                'evicted_bytes': self.evicted_bytes,
+                'reaped_files': self.reaped_files,
+                'reaped_bytes': self.reaped_bytes,
+                'reaped_temp_dirs': self.reaped_temp_dirs,
+                'temp_dirs': len(self._temp_dirs),
+            }
+
+# Shared cache used by bot.ytdl
+audio_cache = AudioCache(
+    Config.AUDIO_CACHE_DIR,
+    Config.AUDIO_CACHE_MAX_MB * 1024 * 1024,
+    Config.AUDIO_CACHE_GRACE_SECONDS,
+    Config.DISK_HIGH_WATER_PERCENT,
+    Config.AUDIO_CACHE_REAP_INTERVAL
+)
+
+metrics.register_stats('audio_cache', audio_cache.stats, counters=(
+    'evicted_files', 'evicted_bytes', 'reaped_files', 'reaped_bytes', 'reaped_temp_dirs'
+))
@@ -0,0 +1,117 @@
+"""
+Small in-memory cache with TTL expiry and LRU eviction.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """
+    Thread-safe mapping whose entries expire after a fixed time-to-live and
+    where the least recently used entry is evicted once the cache is full
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        Initialize the cache
+
+        Args:
+            maxsize (int): Maximum number of entries kept
+            ttl (float): Seconds an entry stays valid after it was stored
+        """
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        Get a value from the cache
+
+        Args:
+            key: Cache key
+            default: Value returned on a miss
+
+        Returns:
+            Any: Cached value or default
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Store a value in the cache
+
+        Args:
+            key: Cache key
+            value: Value to store
+        """
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """
+        Remove a key from the cache
+
+        Args:
+            key: Cache key
+            default: Value returned if the key is not cached
+
+        Returns:
+            Any: Removed value or default
+        """
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[0] if item else default
+
+    def clear(self):
+        """Remove every entry from the cache"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """
+        Get cache counters
+
+        Returns:
+            dict: Size, hit/miss/eviction counts and hit rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
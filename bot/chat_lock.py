@@ -0,0 +1,76 @@
+"""
+Per-chat locks that order player operations within a chat while chats run in parallel.
+"""
+import logging
+import asyncio
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+class ChatLocks:
+    """
+    One FIFO asyncio lock per chat, created on demand and dropped once
+    nobody holds or waits for it, so idle chats cost nothing
+    """
+    def __init__(self):
+        # chat_id -> [lock, holders and waiters]
+        self._locks = {}
+
+        # Counters
+        self.acquired = 0
+        self.contended = 0
+
+    @asynccontextmanager
+    async def hold(self, chat_id):
+        """
+        Hold a chat's lock for the duration of an operation
+
+        Operations of the same chat run one at a time in arrival order.
+
+        Args:
+            chat_id (int): Chat the operation belongs to
+        """
+        entry = self._locks.get(chat_id)
+        if entry is None:
+            entry = self._locks[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+
+        lock = entry[0]
+        if lock.locked():
+            self.contended += 1
+            logger.info(f"Waiting for previous operation in chat {chat_id}")
+
+        try:
+            async with lock:
+                self.acquired += 1
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self._locks.get(chat_id) is entry:
+                del self._locks[chat_id]
+
+    def is_busy(self, chat_id):
+        """
+        Check whether an operation is running in a chat
+
+        Args:
+            chat_id (int): Chat to check
+
+        Returns:
+            bool: True while the chat's lock is held
+        """
+        entry = self._locks.get(chat_id)
+        return entry is not None and entry[0].locked()
+
+    def stats(self):
+        """
+        Get lock counters
+
+        Returns:
+            dict: Chats with pending operations, acquisitions and contended acquisitions
+        """
+        return {
+            'chats': len(self._locks),
+            'acquired': self.acquired,
+            'contended': self.contended,
+        }
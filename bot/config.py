@@ -17,11 +17,116 @@ class Config:
     API_ID = os.getenv("API_ID")
     API_HASH = os.getenv("API_HASH")
     BOT_TOKEN = os.getenv("BOT_TOKEN")
+
+    # Number of worker threads used for blocking yt-dlp extraction calls
+    EXTRACTOR_WORKERS = int(os.getenv("EXTRACTOR_WORKERS", "4"))
+
+    # In-memory video metadata cache (entries, seconds)
+    INFO_CACHE_SIZE = int(os.getenv("INFO_CACHE_SIZE", "1024"))
+    INFO_CACHE_TTL = int(os.getenv("INFO_CACHE_TTL", "3600"))
+
+    # On-disk audio cache location and size budget in megabytes
+    AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "downloads")
+    AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "2048"))
+    # Delete cached audio unused for this many seconds (0 keeps it until evicted),
+    # and unused audio while the disk is fuller than this percent (0 to ignore)
+    AUDIO_CACHE_GRACE_SECONDS = int(os.getenv("AUDIO_CACHE_GRACE_SECONDS", "21600"))
+    DISK_HIGH_WATER_PERCENT = float(os.getenv("DISK_HIGH_WATER_PERCENT", "90"))
+    AUDIO_CACHE_REAP_INTERVAL = int(os.getenv("AUDIO_CACHE_REAP_INTERVAL", "60"))
+
+    # Downloaded audio format: "mp3" (transcode) or "native" (keep YouTube's Opus/M4A stream)
+    AUDIO_FORMAT = os.getenv("AUDIO_FORMAT", "mp3").lower()
+
+    # Playback mode: "download" (play after the download finishes),
+    # "progressive" (start playing the native audio while it downloads) or
+    # "direct" (stream the YouTube audio URL without downloading)
+    PLAYBACK_MODE = os.getenv("PLAYBACK_MODE", "download").lower()
+    # Audio that must be buffered before progressive playback starts, and how long to wait for it
+    STREAM_MIN_BUFFER_KB = int(os.getenv("STREAM_MIN_BUFFER_KB", "256"))
+    STREAM_BUFFER_TIMEOUT = float(os.getenv("STREAM_BUFFER_TIMEOUT", "15"))
+    # Direct mode: refresh stream URLs that expire within this many seconds
+    STREAM_URL_REFRESH_MARGIN = int(os.getenv("STREAM_URL_REFRESH_MARGIN", "600"))
+
+    # Number of results returned by /search and the web search page
+    SEARCH_RESULTS = int(os.getenv("SEARCH_RESULTS", "5"))
+
+    # Maximum number of tracks enqueued from one playlist
+    PLAYLIST_MAX_TRACKS = int(os.getenv("PLAYLIST_MAX_TRACKS", "500"))
+
+    # Upcoming songs kept downloaded per chat, and concurrent prefetch downloads overall
+    PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "2"))
+    PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "3"))
+
+    # Maximum audio downloads running at once across all chats
+    DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "4"))
+
+    # Database for persisted player state (shared with the web app; Heroku's
+    # postgres:// URLs are rewritten for SQLAlchemy)
+    DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///instance/bot.db")
+    if DATABASE_URL.startswith("postgres://"):
+        DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+    # Save queues and now-playing so a restart resumes every chat, and how often to write changes
+    PERSIST_STATE = os.getenv("PERSIST_STATE", "true").lower() in ("1", "true", "yes")
+    PERSIST_INTERVAL = float(os.getenv("PERSIST_INTERVAL", "2"))
+
+    # Audio quality of streams: "studio", "high", "medium" or "low". New streams
+    # step down to medium and then low quality when process CPU (percent of one
+    # core) or the number of active calls reach these thresholds (0 ignores calls)
+    AUDIO_QUALITY = os.getenv("AUDIO_QUALITY", "high").lower()
+    QUALITY_CPU_MEDIUM = float(os.getenv("QUALITY_CPU_MEDIUM", "70"))
+    QUALITY_CPU_LOW = float(os.getenv("QUALITY_CPU_LOW", "90"))
+    QUALITY_CALLS_MEDIUM = int(os.getenv("QUALITY_CALLS_MEDIUM", "25"))
+    QUALITY_CALLS_LOW = int(os.getenv("QUALITY_CALLS_LOW", "50"))
+
+    # Pyrogram session strings of the assistant accounts that join voice chats
+    # (comma separated; the bot account itself is used when empty), and the
+    # maximum voice chats per assistant (0 for no limit)
+    ASSISTANT_SESSIONS = [session.strip() for session in os.getenv("ASSISTANT_SESSIONS", "").split(",") if session.strip()]
+    ASSISTANT_MAX_CALLS = int(os.getenv("ASSISTANT_MAX_CALLS", "0"))
+
+    # Seconds to stay in the voice chat after the queue runs out, so the next
+    # /play reuses the call instead of joining again (0 leaves immediately)
+    IDLE_LEAVE_SECONDS = int(os.getenv("IDLE_LEAVE_SECONDS", "60"))
+
+    # Extractor backend: "ytdlp" (YouTube) or "fake" (offline synthetic tracks for tests and benchmarks)
+    EXTRACTOR_BACKEND = os.getenv("EXTRACTOR_BACKEND", "ytdlp").lower()
+    # Fake backend: seconds per extraction and per download, reported track length,
+    # and the directory whose audio files are served (a tone is generated if empty)
+    FAKE_EXTRACT_LATENCY = float(os.getenv("FAKE_EXTRACT_LATENCY", "0.5"))
+    FAKE_DOWNLOAD_LATENCY = float(os.getenv("FAKE_DOWNLOAD_LATENCY", "2"))
+    FAKE_TRACK_SECONDS = int(os.getenv("FAKE_TRACK_SECONDS", "60"))
+    FAKE_AUDIO_DIR = os.getenv("FAKE_AUDIO_DIR", "fake_audio")
+
+    # /play traces taking at least this many seconds are kept for the /traces page, and how many are kept
+    TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "5"))
+    TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "50"))
+
+    # Telegram user ids allowed to use admin commands such as /stats (comma separated)
+    ADMIN_IDS = {
+        int(user_id) for user_id in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",")
+        if user_id.lstrip("-").isdigit()
+    }
     
     # Check if required variables are set
     @classmethod
     def validate(cls):
         """Validate that all required environment variables are set"""
+        if cls.AUDIO_FORMAT not in ("mp3", "native"):
+            logger.warning(f"Unknown AUDIO_FORMAT '{cls.AUDIO_FORMAT}', falling back to mp3")
+            cls.AUDIO_FORMAT = "mp3"
+
+        if cls.PLAYBACK_MODE not in ("download", "progressive", "direct"):
+            logger.warning(f"Unknown PLAYBACK_MODE '{cls.PLAYBACK_MODE}', falling back to download")
+            cls.PLAYBACK_MODE = "download"
+
+        if cls.AUDIO_QUALITY not in ("studio", "high", "medium", "low"):
+            logger.warning(f"Unknown AUDIO_QUALITY '{cls.AUDIO_QUALITY}', falling back to high")
+            cls.AUDIO_QUALITY = "high"
+
+        if cls.EXTRACTOR_BACKEND not in ("ytdlp", "fake"):
+            logger.warning(f"Unknown EXTRACTOR_BACKEND '{cls.EXTRACTOR_BACKEND}', falling back to ytdlp")
+            cls.EXTRACTOR_BACKEND = "ytdlp"
+
         required_vars = ["API_ID", "API_HASH", "BOT_TOKEN"]
         missing_vars = [var for var in required_vars if not getattr(cls, var)]
         
@@ -0,0 +1,118 @@
+"""
+Bounded thread pool for blocking yt-dlp calls so they never run on the event loop.
+"""
+import logging
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bot.config import Config
+from bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Log a warning when a job waits longer than this (seconds) for a free worker
+SLOW_WAIT_THRESHOLD = 2.0
+
+class ExtractorPool:
+    """
+    Runs blocking extraction functions on a fixed number of worker threads
+    and keeps track of queue depth and time spent waiting for a worker.
+    """
+    def __init__(self, max_workers: int):
+        """
+        Initialize the extractor pool
+
+        Args:
+            max_workers (int): Maximum number of concurrent extraction threads
+        """
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="extractor"
+        )
+        self._lock = threading.Lock()
+
+        # Jobs waiting for a worker / currently running
+        self._queued = 0
+        self._running = 0
+
+        # Wait-time statistics
+        self._started = 0
+        self._completed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def run(self, func, *args):
+        """
+        Run a blocking function on the pool and await its result
+
+        Args:
+            func (callable): Blocking function to run
+            *args: Positional arguments for the function
+
+        Returns:
+            Any: Return value of the function
+        """
+        loop = asyncio.get_running_loop()
+        submitted = time.monotonic()
+        started = threading.Event()
+
+        with self._lock:
+            self._queued += 1
+            depth = self._queued
+
+        if depth > self.max_workers:
+            logger.info(f"Extractor pool busy: {depth} jobs waiting for {self.max_workers} workers")
+
+        def _call():
+            waited = time.monotonic() - submitted
+            with self._lock:
+                started.set()
+                self._queued -= 1
+                self._running += 1
+                self._started += 1
+                self._total_wait += waited
+                self._max_wait = max(self._max_wait, waited)
+
+            if waited > SLOW_WAIT_THRESHOLD:
+                logger.warning(f"Extraction job waited {waited:.2f}s for a free worker")
+
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+
+        try:
+            return await loop.run_in_executor(self._executor, _call)
+        except asyncio.CancelledError:
+            # A job cancelled before it started never reaches _call
+            with self._lock:
+                if not started.is_set():
+                    self._queued -= 1
+            raise
+
+    def stats(self):
+        """
+        Get a snapshot of the pool state
+
+        Returns:
+            dict: Worker count, queue depth and wait-time statistics
+        """
+        with self._lock:
+            avg_wait = self._total_wait / self._started if self._started else 0.0
+            return {
+                'workers': self.max_workers,
+                'queued': self._queued,
+                'running': self._running,
+                'completed': self._completed,
+                'avg_wait': round(avg_wait, 3),
+                'max_wait': round(self._max_wait, 3),
+            }
+
+# Shared pool used by every caller of bot.ytdl
+extractor_pool = ExtractorPool(Config.EXTRACTOR_WORKERS)
+
+metrics.register_stats('extractor_pool', extractor_pool.stats, counters=('completed',))
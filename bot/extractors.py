@@ -0,0 +1,372 @@
+"""
+Extractor backends: the real yt-dlp backend and an offline fake for tests and benchmarks.
+"""
+import logging
+import hashlib
+import math
+import os
+import re
+import struct
+import threading
+import time
+import wave
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse, parse_qs
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+class ExtractorBackend(ABC):
+    """
+    Creates YoutubeDL-compatible extractors.
+
+    Extractors are context managers providing extract_info(query, download)
+    and process_ie_result(info, download) and honoring the yt-dlp options used
+    by bot.ytdl (outtmpl, nopart, progress_hooks, extract_flat, playlistend
+    and the FFmpegExtractAudio postprocessor).
+    """
+    name = None
+
+    @abstractmethod
+    def create(self, opts):
+        """
+        Create an extractor for a set of yt-dlp options
+
+        Args:
+            opts (dict): yt-dlp options
+
+        Returns:
+            Extractor usable as "with backend.create(opts) as ydl:"
+        """
+
+    def stats(self):
+        """
+        Get backend counters
+
+        Returns:
+            dict: Backend name and counters
+        """
+        return {'backend': self.name}
+
+class YtDlpBackend(ExtractorBackend):
+    """Backend that talks to YouTube through yt-dlp"""
+    name = 'ytdlp'
+
+    def create(self, opts):
+        import yt_dlp as youtube_dl
+        return youtube_dl.YoutubeDL(opts)
+
+class FakeBackend(ExtractorBackend):
+    """
+    Offline backend serving synthetic metadata and audio files from disk
+    after configurable delays, so the play pipeline can be load-tested
+    without YouTube access.
+
+    Every query maps to a stable fake video id. Audio is copied from the
+    files in audio_dir; when it has none a tone of track_seconds is
+    generated there first.
+    """
+    name = 'fake'
+
+    AUDIO_EXTENSIONS = ('.wav', '.mp3', '.ogg', '.opus', '.webm', '.m4a')
+
+    # Sample rate of the generated tone (mono, 16-bit)
+    SAMPLE_RATE = 16000
+
+    # Chunks per simulated download; progress hooks run after each
+    DOWNLOAD_CHUNKS = 20
+
+    # Entries returned for a playlist URL when playlistend is not set
+    PLAYLIST_SIZE = 25
+
+    def __init__(self, extract_latency: float, download_latency: float,
+                 track_seconds: int, audio_dir: str):
+        """
+        Initialize the fake backend
+
+        Args:
+            extract_latency (float): Seconds each metadata extraction takes
+            download_latency (float): Seconds each audio download takes
+            track_seconds (int): Duration reported for every track and of the generated tone
+            audio_dir (str): Directory with the audio files to serve
+        """
+        self.extract_latency = max(0.0, extract_latency)
+        self.download_latency = max(0.0, download_latency)
+        self.track_seconds = max(1, track_seconds)
+        self.audio_dir = os.path.abspath(audio_dir)
+        self._sources = None
+        self._lock = threading.Lock()
+
+        # Counters
+        self.extractions = 0
+        self.downloads = 0
+        self.aborted = 0
+
+    def create(self, opts):
+        return FakeYoutubeDL(self, opts)
+
+    def count(self, counter):
+        """
+        Increment a counter; extractors run on the extractor pool's threads
+
+        Args:
+            counter (str): 'extractions', 'downloads' or 'aborted'
+        """
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def audio_sources(self):
+        """
+        Get the audio files served by this backend, generating a tone if there are none
+
+        Returns:
+            list: Sorted file paths
+        """
+        with self._lock:
+            if self._sources is None:
+                os.makedirs(self.audio_dir, exist_ok=True)
+                sources = sorted(
+                    entry.path for entry in os.scandir(self.audio_dir)
+                    if entry.is_file() and entry.name.lower().endswith(self.AUDIO_EXTENSIONS)
+                )
+                if not sources:
+                    sources = [self._generate_tone()]
+                self._sources = sources
+            return self._sources
+
+    def _generate_tone(self):
+        """Write a sine tone of track_seconds to the audio directory"""
+        path = os.path.join(self.audio_dir, f"tone-{self.track_seconds}s.wav")
+        frames = bytearray()
+        for i in range(self.SAMPLE_RATE):
+            sample = int(12000 * math.sin(2 * math.pi * 440 * i / self.SAMPLE_RATE))
+            frames += struct.pack('<h', sample)
+
+        with wave.open(path, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.SAMPLE_RATE)
+            # One second of tone repeated for the whole track
+            for _ in range(self.track_seconds):
+                wav.writeframes(frames)
+
+        logger.info(f"Generated fake audio: {path}")
+        return path
+
+    def source_for(self, video_id):
+        """
+        Get the audio file served for a video
+
+        Args:
+            video_id (str): Fake video id
+
+        Returns:
+            str: Path of the source audio file
+        """
+        sources = self.audio_sources()
+        index = int(hashlib.sha1(video_id.encode()).hexdigest(), 16) % len(sources)
+        return sources[index]
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'extractions': self.extractions,
+            'downloads': self.downloads,
+            'aborted': self.aborted,
+        }
+
+YOUTUBE_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+SEARCH_RE = re.compile(r'^ytsearch(\d*):(.*)$', re.S)
+
+def fake_video_id(key):
+    """
+    Get a stable YouTube-like video id for a query
+
+    Args:
+        key (str): Query, search term or URL
+
+    Returns:
+        str: 11 character id
+    """
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return digest[:11]
+
+class FakeYoutubeDL:
+    """YoutubeDL stand-in created by FakeBackend"""
+    def __init__(self, backend, opts):
+        self.backend = backend
+        self.params = opts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def _video(self, video_id, title=None):
+        """Build a full info dict for a fake video"""
+        source = self.backend.source_for(video_id)
+        return {
+            'id': video_id,
+            'title': title or f"Fake Track {video_id}",
+            'duration': self.backend.track_seconds,
+            'thumbnail': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+            # Direct playback streams the local source file
+            'url': source,
+            'http_headers': {},
+            'ext': os.path.splitext(source)[1].lstrip('.') or 'wav',
+        }
+
+    def _flat(self, info):
+        """Reduce an info dict to a flat playlist entry"""
+        return {
+            '_type': 'url',
+            'id': info['id'],
+            'title': info['title'],
+            'duration': info['duration'],
+            'url': info['webpage_url'],
+            'thumbnails': [{'url': info['thumbnail']}],
+        }
+
+    def _playlist(self, playlist_id, title, videos):
+        if self.params.get('extract_flat'):
+            videos = [self._flat(video) for video in videos]
+        return {'_type': 'playlist', 'id': playlist_id, 'title': title, 'entries': videos}
+
+    def extract_info(self, query, download=True, **kwargs):
+        """
+        Resolve a URL, search or plain query to synthetic metadata
+
+        Args:
+            query (str): URL, "ytsearchN:terms" or search terms
+            download (bool): Whether to also download the audio
+
+        Returns:
+            dict: Info dict shaped like yt-dlp's
+        """
+        time.sleep(self.backend.extract_latency)
+        self.backend.count('extractions')
+
+        search = SEARCH_RE.match(query)
+        if search:
+            count = int(search.group(1) or 1)
+            terms = search.group(2).strip()
+            videos = [
+                self._video(fake_video_id(f"{terms.lower()}#{i}"), f"{terms.title()} ({i + 1})")
+                for i in range(count)
+            ]
+            return self._playlist(f"search:{terms}", terms, videos)
+
+        parsed = urlparse(query.strip())
+        if parsed.scheme in ('http', 'https'):
+            params = parse_qs(parsed.query)
+            if parsed.path == '/playlist' and params.get('list') and not self.params.get('noplaylist'):
+                playlist_id = params['list'][0]
+                count = self.params.get('playlistend') or FakeBackend.PLAYLIST_SIZE
+                videos = [
+                    self._video(fake_video_id(f"{playlist_id}#{i}"), f"Fake Playlist Track {i + 1}")
+                    for i in range(count)
+                ]
+                return self._playlist(playlist_id, f"Fake Playlist {playlist_id}", videos)
+
+            if parsed.hostname == 'youtu.be':
+                video_id = parsed.path.lstrip('/').split('/')[0]
+            else:
+                video_id = params.get('v', [''])[0]
+            if not YOUTUBE_ID_RE.match(video_id):
+                video_id = fake_video_id(query)
+            info = self._video(video_id)
+        else:
+            # Plain search terms resolve to the top hit of the same search
+            terms = " ".join(query.split())
+            info = self._video(fake_video_id(f"{terms.lower()}#0"), f"{terms.title()} (1)")
+
+        return self.process_ie_result(info, download=download)
+
+    def process_ie_result(self, info, download=True):
+        """
+        Download the audio of an info dict returned by extract_info
+
+        Args:
+            info (dict): Info dict of one video
+            download (bool): Whether to write the audio file
+
+        Returns:
+            dict: The info dict, with requested_downloads when downloaded
+        """
+        if download:
+            self._download(info)
+        return info
+
+    def _download(self, info):
+        """Copy the source audio to the output template, pacing chunks over download_latency"""
+        ext = info['ext']
+        for postprocessor in self.params.get('postprocessors') or []:
+            if postprocessor.get('key') == 'FFmpegExtractAudio':
+                # The content stays as is; ffmpeg probes the real container
+                ext = postprocessor.get('preferredcodec', ext)
+
+        outtmpl = self.params.get('outtmpl') or '%(id)s.%(ext)s'
+        path = outtmpl % {'id': info['id'], 'ext': ext, 'title': info['title']}
+        target = path if self.params.get('nopart') else f"{path}.part"
+
+        with open(info['url'], 'rb') as source:
+            data = source.read()
+
+        chunk_size = max(1, math.ceil(len(data) / FakeBackend.DOWNLOAD_CHUNKS))
+        delay = self.backend.download_latency / FakeBackend.DOWNLOAD_CHUNKS
+        status = {
+            'status': 'downloading',
+            'filename': path,
+            'total_bytes': len(data),
+            'downloaded_bytes': 0,
+            'info_dict': info,
+        }
+
+        try:
+            with open(target, 'wb') as out:
+                for offset in range(0, len(data), chunk_size):
+                    time.sleep(delay)
+                    out.write(data[offset:offset + chunk_size])
+                    out.flush()
+                    status['downloaded_bytes'] = min(len(data), offset + chunk_size)
+                    for hook in self.params.get('progress_hooks') or []:
+                        hook(dict(status))
+        except BaseException:
+            self.backend.count('aborted')
+            raise
+
+        if target != path:
+            os.replace(target, path)
+
+        status['status'] = 'finished'
+        for hook in self.params.get('progress_hooks') or []:
+            hook(dict(status))
+
+        self.backend.count('downloads')
+        info['ext'] = ext
+        info['requested_downloads'] = [{'filepath': path, 'ext': ext}]
+
+def create_backend(name):
+    """
+    Create the extractor backend selected by name
+
+    Args:
+        name (str): 'ytdlp' or 'fake'
+
+    Returns:
+        ExtractorBackend: Backend instance
+    """
+    if name == 'fake':
+        logger.warning("Using the fake extractor backend; no audio is fetched from YouTube")
+        return FakeBackend(
+            Config.FAKE_EXTRACT_LATENCY,
+            Config.FAKE_DOWNLOAD_LATENCY,
+            Config.FAKE_TRACK_SECONDS,
+            Config.FAKE_AUDIO_DIR
+        )
+    return YtDlpBackend()
+
+# Backend used by bot.ytdl and bot.stream_urls
+extractor_backend = create_backend(Config.EXTRACTOR_BACKEND)
@@ -3,10 +3,15 @@ Helper functions and command handlers for ADHISHTA NANDY Telegram music bot.
 """
 import logging
 import re
+import functools
 from pyrogram import filters
-from pyrogram.types import Message
-from bot.ytdl import get_video_info
+from pyrogram.errors import MessageNotModified
+from pyrogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from bot.config import Config
+from bot.ytdl import get_video_info, is_playlist_url, search
 from bot.music_player import MusicPlayer
+from bot.metrics import COMMANDS, COMMAND_ERRORS, COMMAND_LATENCY
+from bot.tracing import tracer
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -23,6 +28,53 @@ RESUME_COMMAND = filters.command(["resume", "r"])
 QUEUE_COMMAND = filters.command(["queue", "q"])
 LYRICS_COMMAND = filters.command(["lyrics", "ly"])
 VOLUME_COMMAND = filters.command(["volume", "vol", "v"])
+SEARCH_COMMAND = filters.command(["search", "find"])
+QUALITY_COMMAND = filters.command(["quality"])
+REMOVE_COMMAND = filters.command(["remove", "rm"])
+MOVE_COMMAND = filters.command(["move", "mv"])
+SHUFFLE_COMMAND = filters.command(["shuffle"])
+STATS_COMMAND = filters.command(["stats"])
+
+# Inline buttons of the paginated /queue view carry "queue:<page>" ("queue:current" for the page indicator)
+QUEUE_PAGE_CALLBACK = filters.regex(r"^queue:(\d+|current)$")
+
+def instrumented(command):
+    """
+    Count and time the calls of a handler
+
+    Args:
+        command (str): Command name used as the metric label
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(client, update):
+            COMMANDS.inc(command=command)
+            with COMMAND_LATENCY.time(command=command):
+                return await handler(client, update)
+        return wrapper
+    return decorator
+
+def queue_keyboard(page, pages):
+    """
+    Build the paging buttons of a /queue message
+
+    Args:
+        page (int): Page shown
+        pages (int): Number of pages
+
+    Returns:
+        InlineKeyboardMarkup: Buttons, or None if the queue fits on one page
+    """
+    if pages <= 1:
+        return None
+    buttons = []
+    if page > 1:
+        buttons.append(InlineKeyboardButton("◀️ Prev", callback_data=f"queue:{page - 1}"))
+    # The page indicator is a button too; pressing it changes nothing
+    buttons.append(InlineKeyboardButton(f"{page}/{pages}", callback_data="queue:current"))
+    if page < pages:
+        buttons.append(InlineKeyboardButton("Next ▶️", callback_data=f"queue:{page + 1}"))
+    return InlineKeyboardMarkup([buttons])
 
 def register_handlers(client):
     """
@@ -36,6 +88,7 @@ def register_handlers(client):
     music_player = MusicPlayer(client, None)  # No session string needed
     
     @client.on_message(PLAY_COMMAND)
+    @instrumented('play')
     async def play_handler(_, message: Message):
         """Handle /play command"""
         try:
@@ -60,20 +113,31 @@ See /help for setup instructions.
             # Get the query (everything after the command)
             query = " ".join(message.command[1:])
             
-            # Send a processing message
-            processing_msg = await message.reply(f"🔍 Searching for: `{query}`...")
-            
             # Get chat ID
             chat_id = message.chat.id
             
-            # Try to play the song in the voice chat
-            result = await music_player.play(chat_id, query, message)
-            
-            # Update the processing message with the result
-            await processing_msg.edit(result)
+            # Trace every stage of the request, from the first reply to the final edit.
+            # The traces page is public, so traces carry no chat ids or queries.
+            kind = 'playlist' if is_playlist_url(query) else 'song'
+            with tracer.trace('play', kind=kind):
+                # Send a processing message
+                with tracer.span('reply'):
+                    if is_playlist_url(query):
+                        processing_msg = await message.reply("📃 Loading playlist...")
+                    else:
+                        processing_msg = await message.reply(f"🔍 Searching for: `{query}`...")
+                
+                # Try to play the song in the voice chat
+                result = await music_player.play(chat_id, query, message, processing_msg)
+                
+                # Update the processing message with the result (unless the player already does)
+                if result:
+                    with tracer.span('edit_reply'):
+                        await processing_msg.edit(result)
                 
         except Exception as e:
             logger.error(f"Error in play_handler: {e}")
+            COMMAND_ERRORS.inc(command='play')
             await message.reply(f"❌ An error occurred: {str(e)}")
     
     # Helper function to check if chat is private
@@ -92,6 +156,7 @@ See /help for setup instructions.
         return False
             
     @client.on_message(STOP_COMMAND)
+    @instrumented('stop')
     async def stop_handler(_, message: Message):
         """Handle /stop command"""
         try:
@@ -104,9 +169,11 @@ See /help for setup instructions.
             await message.reply(result)
         except Exception as e:
             logger.error(f"Error in stop_handler: {e}")
+            COMMAND_ERRORS.inc(command='stop')
             await message.reply(f"❌ Error stopping playback: {str(e)}")
     
     @client.on_message(SKIP_COMMAND)
+    @instrumented('skip')
     async def skip_handler(_, message: Message):
         """Handle /skip command"""
         try:
@@ -122,9 +189,11 @@ See /help for setup instructions.
                 await message.reply("⏭️ Skip functionality is not available in this version.")
         except Exception as e:
             logger.error(f"Error in skip_handler: {e}")
+            COMMAND_ERRORS.inc(command='skip')
             await message.reply(f"❌ Error skipping: {str(e)}")
     
     @client.on_message(PAUSE_COMMAND)
+    @instrumented('pause')
     async def pause_handler(_, message: Message):
         """Handle /pause command"""
         try:
@@ -140,9 +209,11 @@ See /help for setup instructions.
                 await message.reply("⏸️ Pause functionality is not available in this version.")
         except Exception as e:
             logger.error(f"Error in pause_handler: {e}")
+            COMMAND_ERRORS.inc(command='pause')
             await message.reply(f"❌ Error pausing: {str(e)}")
     
     @client.on_message(RESUME_COMMAND)
+    @instrumented('resume')
     async def resume_handler(_, message: Message):
         """Handle /resume command"""
         try:
@@ -158,9 +229,11 @@ See /help for setup instructions.
                 await message.reply("▶️ Resume functionality is not available in this version.")
         except Exception as e:
             logger.error(f"Error in resume_handler: {e}")
+            COMMAND_ERRORS.inc(command='resume')
             await message.reply(f"❌ Error resuming: {str(e)}")
     
     @client.on_message(QUEUE_COMMAND)
+    @instrumented('queue')
     async def queue_handler(_, message: Message):
         """Handle /queue command"""
         try:
@@ -170,15 +243,121 @@ See /help for setup instructions.
                 
             chat_id = message.chat.id
             if hasattr(music_player, 'queue'):
-                result = await music_player.queue(chat_id)
-                await message.reply(result)
+                result, page, pages = await music_player.queue(chat_id)
+                await message.reply(result, reply_markup=queue_keyboard(page, pages))
             else:
                 await message.reply("📋 Queue functionality is not available in this version.")
         except Exception as e:
             logger.error(f"Error in queue_handler: {e}")
+            COMMAND_ERRORS.inc(command='queue')
             await message.reply(f"❌ Error getting queue: {str(e)}")
+
+    @client.on_callback_query(QUEUE_PAGE_CALLBACK)
+    @instrumented('queue_page')
+    async def queue_page_handler(_, callback_query: CallbackQuery):
+        """Handle the paging buttons of /queue"""
+        try:
+            requested = callback_query.matches[0].group(1)
+            if requested != 'current':
+                # Pages past the end (the queue shrank since) show the last page
+                result, page, pages = await music_player.queue(callback_query.message.chat.id, int(requested))
+                try:
+                    await callback_query.message.edit(result, reply_markup=queue_keyboard(page, pages))
+                except MessageNotModified:
+                    pass
+            await callback_query.answer()
+        except Exception as e:
+            logger.error(f"Error in queue_page_handler: {e}")
+            COMMAND_ERRORS.inc(command='queue_page')
+            await callback_query.answer("❌ Could not load that page.")
+
+    @client.on_message(REMOVE_COMMAND)
+    @instrumented('remove')
+    async def remove_handler(_, message: Message):
+        """Handle /remove command"""
+        try:
+            # Check if this is a private chat
+            if await check_private_chat(message):
+                return
+
+            if len(message.command) < 2 or not message.command[1].isdigit():
+                await message.reply("Please provide the position of the song to remove.\nExample: `/remove 3`")
+                return
+
+            result = await music_player.remove(message.chat.id, int(message.command[1]))
+            await message.reply(result)
+        except Exception as e:
+            logger.error(f"Error in remove_handler: {e}")
+            COMMAND_ERRORS.inc(command='remove')
+            await message.reply(f"❌ Error removing song: {str(e)}")
+
+    @client.on_message(MOVE_COMMAND)
+    @instrumented('move')
+    async def move_handler(_, message: Message):
+        """Handle /move command"""
+        try:
+            # Check if this is a private chat
+            if await check_private_chat(message):
+                return
+
+            if len(message.command) < 3 or not (message.command[1].isdigit() and message.command[2].isdigit()):
+                await message.reply("Please provide the current and new position of the song.\nExample: `/move 5 1`")
+                return
+
+            result = await music_player.move(message.chat.id, int(message.command[1]), int(message.command[2]))
+            await message.reply(result)
+        except Exception as e:
+            logger.error(f"Error in move_handler: {e}")
+            COMMAND_ERRORS.inc(command='move')
+            await message.reply(f"❌ Error moving song: {str(e)}")
+
+    @client.on_message(SHUFFLE_COMMAND)
+    @instrumented('shuffle')
+    async def shuffle_handler(_, message: Message):
+        """Handle /shuffle command"""
+        try:
+            # Check if this is a private chat
+            if await check_private_chat(message):
+                return
+
+            result = await music_player.shuffle(message.chat.id)
+            await message.reply(result)
+        except Exception as e:
+            logger.error(f"Error in shuffle_handler: {e}")
+            COMMAND_ERRORS.inc(command='shuffle')
+            await message.reply(f"❌ Error shuffling: {str(e)}")
     
+    @client.on_message(SEARCH_COMMAND)
+    @instrumented('search')
+    async def search_handler(_, message: Message):
+        """Handle /search command"""
+        # This command can work in any chat since it doesn't rely on voice chats
+        try:
+            if len(message.command) < 2:
+                await message.reply("Please provide a song name to search for.\nExample: `/search despacito`")
+                return
+
+            query = " ".join(message.command[1:])
+            processing_msg = await message.reply(f"🔍 Searching for: `{query}`...")
+
+            results = await search(query, Config.SEARCH_RESULTS)
+            if not results:
+                await processing_msg.edit("❌ No results found.")
+                return
+
+            result_msg = f"🔍 **Search Results for:** `{query}`\n\n"
+            for i, video in enumerate(results):
+                result_msg += f"{i+1}. [{video['title']}]({video['video_url']}) ({video['duration']})\n"
+                result_msg += f"   `/play {video['video_url']}`\n"
+
+            await processing_msg.edit(result_msg, disable_web_page_preview=True)
+        except Exception as e:
+            logger.error(f"Error in search_handler: {e}")
+            COMMAND_ERRORS.inc(command='search')
+            await message.reply(f"❌ Error searching: {str(e)}")
+
     @client.on_message(LYRICS_COMMAND)
+    @instrumented('lyrics')
     async def lyrics_handler(_, message: Message):
         """Handle /lyrics command"""
         # This command can work in any chat since it doesn't rely on voice chats
@@ -190,6 +369,7 @@ See /help for setup instructions.
         await message.reply(f"🎵 Lyrics for '{query}' would appear here in the full version.")
     
     @client.on_message(VOLUME_COMMAND)
+    @instrumented('volume')
     async def volume_handler(_, message: Message):
         """Handle /volume command"""
         try:
@@ -216,8 +396,45 @@ See /help for setup instructions.
                 await message.reply("⚠️ Please provide a valid number for volume level")
         except Exception as e:
             logger.error(f"Error in volume_handler: {e}")
+            COMMAND_ERRORS.inc(command='volume')
             await message.reply(f"❌ Error setting volume: {str(e)}")
     
+    @client.on_message(QUALITY_COMMAND)
+    @instrumented('quality')
+    async def quality_handler(_, message: Message):
+        """Handle /quality command"""
+        try:
+            # Check if this is a private chat
+            if await check_private_chat(message):
+                return
+                
+            chat_id = message.chat.id
+            if len(message.command) < 2:
+                result = await music_player.quality_status(chat_id)
+            else:
+                result = await music_player.set_quality(chat_id, message.command[1].lower())
+            await message.reply(result)
+        except Exception as e:
+            logger.error(f"Error in quality_handler: {e}")
+            COMMAND_ERRORS.inc(command='quality')
+            await message.reply(f"❌ Error setting quality: {str(e)}")
+    
+    @client.on_message(STATS_COMMAND)
+    @instrumented('stats')
+    async def stats_handler(_, message: Message):
+        """Handle /stats command (bot admins only)"""
+        try:
+            if message.from_user is None or message.from_user.id not in Config.ADMIN_IDS:
+                await message.reply("❌ This command is only available to bot admins.")
+                return
+
+            result = await music_player.stats_report()
+            await message.reply(result)
+        except Exception as e:
+            logger.error(f"Error in stats_handler: {e}")
+            COMMAND_ERRORS.inc(command='stats')
+            await message.reply(f"❌ Error getting stats: {str(e)}")
+
     # Add help command handler
     @client.on_message(filters.command(["help", "h"]))
     async def help_handler(_, message: Message):
@@ -227,6 +444,7 @@ See /help for setup instructions.
 
 **Core Commands:**
 `/play <song_name or URL>` - Search for a song and play it in voice chat
+`/play <playlist URL>` - Add a whole YouTube playlist to the queue
 `/stop` - Stop playback and leave voice chat
 `/skip` or `/next` - Skip to the next song in queue
 `/pause` - Pause the current playback
@@ -234,7 +452,12 @@ See /help for setup instructions.
 
 **Additional Commands:**
 `/queue` or `/q` - Show the current song queue
+`/remove <position>` - Remove a song from the queue
+`/move <from> <to>` - Move a song to another position in the queue
+`/shuffle` - Shuffle the queue
+`/search <song_name>` - Show several YouTube results to pick from
 `/volume <level>` or `/vol <level>` - Set volume (0-100)
+`/quality [studio|high|medium|low|auto]` - Show or pin the audio quality
 `/lyrics <song_name>` or `/ly <song_name>` - Get lyrics for a song
 
 **General Commands:**
@@ -0,0 +1,382 @@
+"""
+In-process metrics registry (counters, gauges, latency histograms) with Prometheus text output.
+"""
+import logging
+import asyncio
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from cache hits to slow downloads
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+class _Metric:
+    """Base of the metric types: a family of values keyed by label values"""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def label_values(self):
+        """Get the label value tuples that have been recorded"""
+        with self._lock:
+            return list(self._values)
+
+    def _samples(self):
+        """Get (suffix, label values, extra label, value) tuples for the text format"""
+        with self._lock:
+            return [('', key, None, value) for key, value in self._values.items()]
+
+    def render(self):
+        """
+        Get the metric in Prometheus text format
+
+        Returns:
+            list: Output lines
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self._samples():
+            labels = _format_labels(self.label_names, key, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    """A value that only goes up, e.g. handled commands"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """
+        Add to the counter
+
+        Args:
+            amount (float): Amount to add
+            **labels: Label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Get the count for one set of label values"""
+        key = self._key(labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def total(self):
+        """Get the sum over all label values"""
+        with self._lock:
+            return sum(self._values.values())
+
+class Gauge(_Metric):
+    """A value that goes up and down, e.g. active calls"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        """
+        Set the gauge
+
+        Args:
+            value (float): New value
+            **labels: Label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        """Add to the gauge"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        """Subtract from the gauge"""
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    """Distribution of observed values, e.g. latencies, in cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        """
+        Record a value
+
+        Args:
+            value (float): Observed value (seconds for latencies)
+            **labels: Label values
+        """
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            entry[0][index] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in a with block (also around awaits)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, count, total) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append(('_bucket', key, f'le="{_format_value(float(bound))}"', cumulative))
+                samples.append(('_count', key, None, count))
+                samples.append(('_sum', key, None, round(total, 6)))
+        return samples
+
+    def summary(self, **labels):
+        """
+        Get the count, mean and estimated percentiles of the observations
+
+        Args:
+            **labels: Label values to restrict to; all observations when omitted
+
+        Returns:
+            dict: count, avg, p50, p95 and p99
+        """
+        with self._lock:
+            if labels:
+                entries = [self._values[self._key(labels)]] if self._key(labels) in self._values else []
+            else:
+                entries = list(self._values.values())
+            counts = [sum(entry[0][i] for entry in entries) for i in range(len(self.buckets))]
+            count = sum(entry[1] for entry in entries)
+            total = sum(entry[2] for entry in entries)
+
+        return {
+            'count': count,
+            'avg': total / count if count else 0.0,
+            'p50': self._quantile(counts, count, 0.50),
+            'p95': self._quantile(counts, count, 0.95),
+            'p99': self._quantile(counts, count, 0.99),
+        }
+
+    def _quantile(self, counts, count, q):
+        """Estimate a quantile by interpolating inside its bucket, like Prometheus does"""
+        if not count:
+            return 0.0
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if bound == math.inf:
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+            lower = bound
+        return lower
+
+class MetricsRegistry:
+    """
+    Holds the process's metrics. Besides metrics updated where things happen,
+    stats collectors are read at scrape time so the stats() dicts of the
+    pools and caches show up without instrumenting them twice.
+    """
+    def __init__(self, namespace: str):
+        """
+        Initialize the registry
+
+        Args:
+            namespace (str): Prefix of every metric name
+        """
+        self.namespace = namespace
+        self.started_at = time.time()
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+        # Event loop that owns the state the stats collectors read
+        self._loop = None
+
+    def _register(self, cls, name, *args, **kwargs):
+        full_name = f"{self.namespace}_{name}"
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = self._metrics[full_name] = cls(full_name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {full_name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labels=()):
+        """Get or create a counter"""
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels=()):
+        """Get or create a gauge"""
+        return self._register(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        """Get or create a histogram"""
+        return self._register(Histogram, name, documentation, labels, buckets)
+
+    def register_stats(self, prefix: str, collector, counters=()):
+        """
+        Export a component's stats, read at scrape time
+
+        Numeric values of the returned dict become <namespace>_<prefix>_<key>,
+        nested dicts extend the name, and lists of dicts are labelled by index.
+        Values are gauges unless listed in counters; counters get a _total suffix.
+
+        Args:
+            prefix (str): Metric name prefix for the component
+            collector (callable): Returns the component's stats dict
+            counters (tuple): Dotted key paths of values that only go up
+                ('*' matches any key; a path covers everything below it)
+        """
+        self._collectors[prefix] = (collector, tuple(tuple(path.split('.')) for path in counters))
+
+    def bind_loop(self, loop):
+        """
+        Run the stats collectors on an event loop
+
+        The collectors read state owned by the bot's event loop, so scrapes
+        from other threads (the web app) take the snapshot on that loop.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): The bot's event loop
+        """
+        self._loop = loop
+
+    @staticmethod
+    def _is_counter(path, counters):
+        return any(
+            len(path) >= len(pattern) and all(part in ('*', key) for part, key in zip(pattern, path))
+            for pattern in counters
+        )
+
+    def _flatten(self, name, value, labels, path, counters, out):
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            if self._is_counter(path, counters):
+                out.append((f"{name}_total", 'counter', labels, value))
+            else:
+                out.append((name, 'gauge', labels, value))
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                self._flatten(f"{name}_{key}", item, labels, path + (str(key),), counters, out)
+        elif isinstance(value, (list, tuple)):
+            for index, item in enumerate(value):
+                self._flatten(name, item, labels + (('index', index),), path, counters, out)
+
+    def _collect(self):
+        samples = []
+        for prefix, (collector, counters) in list(self._collectors.items()):
+            try:
+                self._flatten(f"{self.namespace}_{prefix}", collector(), (), (), counters, samples)
+            except Exception as e:
+                logger.error(f"Error collecting {prefix} stats: {e}")
+        return samples
+
+    def collect_stats(self, timeout=5.0):
+        """
+        Read every registered collector, on the bound event loop when called from another thread
+
+        Args:
+            timeout (float): Seconds to wait for the event loop
+
+        Returns:
+            list: (metric name, 'counter' or 'gauge', ((label, value), ...), value) tuples
+        """
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            return self._collect()
+        try:
+            if asyncio.get_running_loop() is loop:
+                return self._collect()
+        except RuntimeError:
+            pass
+
+        async def _snapshot():
+            return self._collect()
+
+        future = asyncio.run_coroutine_threadsafe(_snapshot(), loop)
+        try:
+            return future.result(timeout)
+        except Exception as e:
+            future.cancel()
+            logger.error(f"Error collecting stats on the bot's event loop: {e}")
+            return []
+
+    def render(self):
+        """
+        Get every metric in the Prometheus text exposition format
+
+        Returns:
+            str: Exposition text
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = [
+            f"# HELP {self.namespace}_uptime_seconds Seconds since the process started",
+            f"# TYPE {self.namespace}_uptime_seconds gauge",
+            f"{self.namespace}_uptime_seconds {round(time.time() - self.started_at, 3)}",
+        ]
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        # Samples of one metric must be consecutive; the sort is stable, so indexes stay in order
+        typed = set()
+        for name, kind, labels, value in sorted(self.collect_stats(), key=lambda sample: sample[0]):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+            label_text = _format_labels([label for label, _ in labels], [value for _, value in labels])
+            lines.append(f"{name}{label_text} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Shared registry of the bot and web app
+metrics = MetricsRegistry('luminous')
+
+# Bot command handlers
+COMMANDS = metrics.counter('commands_total', 'Bot commands handled', ('command',))
+COMMAND_ERRORS = metrics.counter('command_errors_total', 'Bot commands that failed with an error', ('command',))
+COMMAND_LATENCY = metrics.histogram('command_seconds', 'Time to handle a bot command', ('command',))
@@ -8,17 +8,45 @@ import time
 import random
 import tempfile
 import pathlib
-from pytgcalls import PyTgCalls
-from pytgcalls.types import MediaStream, Update, StreamEnded, AudioQuality
+from pytgcalls.types import MediaStream, Update, StreamEnded, AudioQuality, ChatUpdate
 from pyrogram import Client
 from pyrogram.errors import ChannelInvalid, PeerIdInvalid, UserNotParticipant
 from pyrogram.raw.functions.channels import GetFullChannel
 from pyrogram.raw.functions.phone import CreateGroupCall, DiscardGroupCall
 from pyrogram.raw.types import InputPeerChannel, InputChannel
-from bot.ytdl import download_and_extract_audio, get_video_info
+from bot.config import Config
+from bot.ytdl import (
+    download_and_extract_audio, resolve_video, start_progressive_download,
+    is_playlist_url, get_playlist_entries, extract_video_id, ProgressiveDownload,
+    get_info_cache_stats, EXTRACT_LATENCY, DOWNLOAD_LATENCY, AUDIO_CACHE_LOOKUPS
+)
+from bot.stream_urls import stream_url_cache, StreamUrl
+from bot.audio_cache import audio_cache
+from bot.prefetch import Prefetcher
+from bot.scheduler import download_scheduler
+from bot.state import Track, ChatState
+from bot.chat_lock import ChatLocks
+from bot.assistants import AssistantPool, NoAssistantAvailable, create_assistant_clients
+from bot.persistence import create_persister
+from bot.quality import create_quality_policy, QUALITY_LEVELS
+from bot.metrics import metrics, COMMANDS, COMMAND_ERRORS
+from bot.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+# FFmpeg input options for playing a file that is still being downloaded:
+# keep reading at EOF and give up after 10 seconds without new data
+GROWING_FILE_FFMPEG_PARAMETERS = "-follow 1 -rw_timeout 10000000"
+
+# Songs per page of /queue, well below Telegram's message length limit
+QUEUE_PAGE_SIZE = 15
+
+# Playback metrics
+TRACKS_STARTED = metrics.counter('tracks_started_total', 'Tracks started in voice chats', ('reason',))
+FIRST_AUDIO = metrics.histogram('first_audio_seconds', 'Time from /play to audio in a chat that was not playing')
+COLD_START_STAGES = metrics.histogram('cold_start_stage_seconds', 'Duration of each stage of a cold /play', ('stage',))
+STREAM_FALLBACKS = metrics.counter('stream_fallbacks_total', 'Streams that fell back to the complete downloaded file')
+
 class MusicPlayer:
     """
     Music player class to handle voice chat streaming in multiple groups
@@ -34,80 +62,512 @@ class MusicPlayer:
         # Store Pyrogram client
         self.client = client
 
-        # Initialize PyTgCalls client
-        self.pytgcalls = PyTgCalls(client)
+        # Assistant accounts that join the voice chats, each with its own PyTgCalls
+        self.assistants = AssistantPool(create_assistant_clients(client), Config.ASSISTANT_MAX_CALLS)
+
+        # Playback state (now playing and queue) by chat_id
+        self.chats = {}
+
+        # Serializes the operations of each chat
+        self.chat_locks = ChatLocks()
+
+        # Saves queues and now-playing so a restart can resume every chat
+        self.persister = create_persister()
+
+        # Picks the audio quality of each new stream from the process load
+        self.quality = create_quality_policy()
+
+        # Metadata lookups of queued songs that run after /play replied
+        self._resolving = set()
+
+        # Keep upcoming songs downloaded ahead of time
+        self.prefetcher = Prefetcher(self.chats, Config.PREFETCH_DEPTH, Config.PREFETCH_CONCURRENCY)
+
+        # Never evict cached audio that is playing or queued
+        audio_cache.register_in_use(self._files_in_use)
+
+        # Keep direct stream URLs of playing and queued songs fresh
+        stream_url_cache.register_in_use(self._videos_in_use)
+
+        # Export the state of the player and its components
+        metrics.register_stats('player', self.stats)
+        metrics.register_stats('assistants', self.assistants.stats, counters=('rejected', 'assistants.placed'))
+        metrics.register_stats('chat_locks', self.chat_locks.stats, counters=('acquired', 'contended'))
+        metrics.register_stats('prefetch', self.prefetcher.stats, counters=('prefetched', 'failed'))
+        metrics.register_stats('quality', self.quality.stats, counters=('chosen',))
+        if self.persister is not None:
+            metrics.register_stats('persistence', self.persister.stats, counters=(
+                'flushes', 'rows_written', 'rows_deleted', 'compactions', 'failures'
+            ))
+
+        # Handle the updates of every assistant's PyTgCalls; start() starts them
+        self.assistants.on_update(self._on_update)
+
+        logger.info("Music player initialized with PyTgCalls")
+
+    def _active(self, chat_id: int):
+        """Get the state of a chat that is playing, or None"""
+        state = self.chats.get(chat_id)
+        if state is not None and state.is_playing:
+            return state
+        return None
+
+    async def _on_update(self, update: Update):
+        """
+        Handle PyTgCalls updates from every assistant (PyTgCalls v2.1.1)
+
+        Args:
+            update (Update): Stream or chat update
+        """
+        # The bot left the call or was removed (e.g. the voice chat was ended)
+        if isinstance(update, ChatUpdate) and update.status & ChatUpdate.Status.LEFT_CALL:
+            async with self.chat_locks.hold(update.chat_id):
+                if update.chat_id in self.chats:
+                    logger.info(f"No longer in the voice chat of {update.chat_id}")
+                    self._forget_chat(update.chat_id)
+                    self.prefetcher.cancel(update.chat_id)
+            return
+
+        # Check if the update is a stream end event
+        if isinstance(update, StreamEnded) and update.stream_type == StreamEnded.Type.AUDIO:
+            chat_id = update.chat_id
+            logger.info(f"Stream ended in chat {chat_id}")
+
+            async with self.chat_locks.hold(chat_id):
+                state = self.chats.get(chat_id)
+
+                # Play the next playable song in queue
+                while state is not None and state.queue:
+                    # Get next song from queue
+                    next_song = state.next_track()
+                    self.prefetcher.schedule(chat_id)
+                    logger.info(f"Playing next song from queue: {next_song.title}")
+
+                    # A song that cannot be fetched is skipped
+                    try:
+                        audio_source = await self._prepare_song(chat_id, next_song)
+                    except Exception as e:
+                        logger.error(f"Error preparing next song in queue: {e}")
+                        audio_source = None
+                    if not audio_source:
+                        logger.error(f"Audio not available for next song in queue: {next_song.title}")
+                        continue
 
-        # Dictionary to track active streams by chat_id
-        self.active_chats = {}
+                    # Play the next song
+                    audio_file, source = audio_source
+                    try:
+                        await self._start_stream(state, next_song, audio_file, source)
+                    except Exception as e:
+                        # The call itself is broken (removed, voice chat ended, no permission);
+                        # every other queued song would be downloaded only to fail the same way
+                        logger.error(f"Error changing stream in chat {chat_id}, leaving voice chat: {e}")
+                        try:
+                            await self._calls(chat_id).leave_call(chat_id)
+                        except Exception as e:
+                            logger.error(f"Error leaving call: {e}")
+                        self._forget_chat(chat_id)
+                        self.prefetcher.cancel(chat_id)
+                        download_scheduler.cancel_chat(chat_id)
+                        return
+
+                    # Update current playing info
+                    state.set_now_playing(next_song)
+                    TRACKS_STARTED.inc(reason='next')
+                    logger.info(f"Changed stream to next song in chat {chat_id}")
+                    return
+
+                # No more songs in queue: stay in the call for a while so the
+                # next /play only has to change the stream
+                if state is not None and Config.IDLE_LEAVE_SECONDS > 0:
+                    logger.info(f"No more songs in queue for chat {chat_id}, idling in voice chat")
+                    state.set_now_playing(None)
+                    state.idle_timer = asyncio.ensure_future(self._leave_when_idle(state))
+                    return
+
+                logger.info(f"No more songs in queue for chat {chat_id}, leaving voice chat")
+                try:
+                    await self._calls(chat_id).leave_call(chat_id)
+                except Exception as e:
+                    logger.error(f"Error leaving call: {e}")
+
+                # Forget the chat
+                self._forget_chat(chat_id)
+
+    def _calls(self, chat_id: int):
+        """
+        Get the PyTgCalls instance of the assistant serving a chat
+
+        Raises:
+            NoAssistantAvailable: If the chat is not placed on an assistant
+        """
+        assistant = self.assistants.get(chat_id)
+        if assistant is None:
+            raise NoAssistantAvailable(f"No assistant is serving chat {chat_id}")
+        return assistant.calls
+
+    def _joining_calls(self, chat_id: int):
+        """
+        Get the PyTgCalls instance that joins a chat's voice chat, placing
+        the chat on the least-loaded assistant if it has none yet
+
+        Raises:
+            NoAssistantAvailable: If the chat has no assistant and every assistant is full
+        """
+        assistant = self.assistants.assign(chat_id)
+        if assistant is None:
+            raise NoAssistantAvailable("All assistants are busy")
+        return assistant.calls
+
+    def _release_if_idle(self, chat_id: int):
+        """Free the chat's assistant unless the chat is playing or in a call"""
+        if chat_id not in self.chats:
+            self.assistants.release(chat_id)
+
+    def _forget_chat(self, chat_id: int):
+        """Drop the state of a chat the bot is no longer in"""
+        state = self.chats.pop(chat_id, None)
+        if state is not None:
+            state.cancel_idle_timer()
+            # Its files are unreferenced now; let the reaper decide on them
+            audio_cache.reap_soon()
+        self.assistants.release(chat_id)
+
+    async def _leave_when_idle(self, state):
+        """Leave the voice chat if nothing was played for IDLE_LEAVE_SECONDS"""
+        await asyncio.sleep(Config.IDLE_LEAVE_SECONDS)
+        chat_id = state.chat_id
+        async with self.chat_locks.hold(chat_id):
+            if self.chats.get(chat_id) is not state or state.is_playing:
+                return
+
+            # The timer is done; do not let _forget_chat cancel the running task
+            state.idle_timer = None
+            logger.info(f"Leaving idle voice chat in {chat_id}")
+            try:
+                await self._calls(chat_id).leave_call(chat_id)
+            except Exception as e:
+                logger.error(f"Error leaving call: {e}")
+            self._forget_chat(chat_id)
+
+    @staticmethod
+    def _is_not_in_call(error):
+        """Check whether a PyTgCalls error means the bot is not in the call"""
+        return type(error).__name__ in ('NotInCallError', 'NotInGroupCallError') or "not in" in str(error).lower()
+
+    def _files_in_use(self):
+        """Get audio file paths of playing and queued songs"""
+        return [track.file_path for state in list(self.chats.values()) for track in state.tracks()]
+
+    def _videos_in_use(self):
+        """Get video ids of playing and queued songs"""
+        return {
+            extract_video_id(track.video_url or '')
+            for state in list(self.chats.values())
+            for track in state.tracks()
+        } - {None}
+
+    def _media_stream(self, audio_file, source=None, offset=0, quality=AudioQuality.HIGH):
+        """
+        Build the MediaStream for an audio source
+
+        Args:
+            audio_file (str): Path of the audio file or direct stream URL
+            source (optional): ProgressiveDownload still writing the file or
+                StreamUrl for a direct URL, as returned by _fetch_audio
+            offset (float): Seconds into the track to start at
+            quality (AudioQuality): Encoding quality of the stream
+        """
+        ffmpeg_parameters = []
+        if offset > 0:
+            ffmpeg_parameters.append(f"-ss {offset:.1f}")
+
+        if isinstance(source, StreamUrl):
+            return MediaStream(
+                source.url,
+                audio_parameters=quality,
+                headers=source.headers or None,
+                ffmpeg_parameters=" ".join(ffmpeg_parameters) or None
+            )
+        if isinstance(source, ProgressiveDownload) and not source.complete:
+            ffmpeg_parameters.insert(0, GROWING_FILE_FFMPEG_PARAMETERS)
+        return MediaStream(
+            audio_file,
+            audio_parameters=quality,
+            ffmpeg_parameters=" ".join(ffmpeg_parameters) or None
+        )
+
+    async def _fetch_audio(self, query, video=None, chat_id=None):
+        """
+        Get playable audio for a query
+
+        In progressive mode playback can start as soon as enough audio is
+        buffered, and in direct mode the YouTube stream URL is played without
+        downloading; on any error both fall back to the full download.
+
+        Args:
+            query (str): YouTube search query or URL
+            video (dict, optional): Details already returned by resolve_video
+            chat_id (int, optional): Chat the audio is for; its downloads are cancelled on /stop
+
+        Returns:
+            tuple: (audio_file, source) where audio_file is a file path or URL and
+                source is the ProgressiveDownload still writing the file, the
+                StreamUrl being played, or None for a complete file; None if error
+        """
+        if Config.PLAYBACK_MODE == 'direct':
+            if video is None:
+                video = await resolve_video(query)
+            if video:
+                with tracer.span('stream_url'):
+                    stream_url = await stream_url_cache.get(video)
+                if stream_url:
+                    return stream_url.url, stream_url
+            logger.warning(f"Direct stream URL not available for {query}, falling back to download")
+
+        if Config.PLAYBACK_MODE == 'progressive':
+            download = await start_progressive_download(query, video, chat_id)
+            if download:
+                min_bytes = Config.STREAM_MIN_BUFFER_KB * 1024
+                with tracer.span('buffer'):
+                    buffered = await download.wait_for_buffer(min_bytes, Config.STREAM_BUFFER_TIMEOUT)
+                if buffered:
+                    return download.path, (None if download.complete else download)
+                # Other chats may be streaming the same download; only this chat gives up on it
+                download.release(chat_id)
+            logger.warning(f"Progressive download failed for {query}, falling back to full download")
+
+        audio_info = await download_and_extract_audio(query, video, chat_id=chat_id)
+        if not audio_info or not audio_info[0]:
+            return None
+        return audio_info[0], None
+
+    async def _prepare_song(self, chat_id: int, song):
+        """
+        Get a queued song ready to play
+
+        Uses the prefetched file when there is one. Otherwise the download is
+        requested at now-playing priority, which joins (and speeds up) a
+        prefetch of the same song that is still queued or running.
+
+        Args:
+            chat_id (int): Chat the song was queued in
+            song (Track): Queued song
+
+        Returns:
+            tuple: (audio_file, source) as returned by _fetch_audio, or None if error
+        """
+        audio_file = song.file_path
+        if audio_file and os.path.exists(audio_file):
+            return audio_file, None
+
+        return await self._fetch_audio(song.source_query, chat_id=chat_id)
+
+    async def _complete_file(self, chat_id: int, song, source):
+        """
+        Get the complete downloaded file after progressive or direct playback failed
+
+        Args:
+            chat_id (int): Chat the song is played in
+            song (Track): Song being started
+            source: ProgressiveDownload or StreamUrl that failed
+
+        Returns:
+            str: Path of the complete audio file or None if error
+        """
+        if isinstance(source, ProgressiveDownload):
+            if await source.wait_complete():
+                return source.path
+            return None
+
+        if isinstance(source, StreamUrl):
+            stream_url_cache.invalidate(source.video_id)
+
+        audio_info = await download_and_extract_audio(song.source_query, chat_id=chat_id)
+        return audio_info[0] if audio_info else None
+
+    async def _start_stream(self, state, song, audio_file, source, offset=0):
+        """
+        Play audio in a chat, falling back to the complete file when a
+        growing file or direct URL cannot be played
+
+        While the bot is in the call the stream is swapped in place with
+        change_stream; it only joins when it is not in the call yet (or
+        turns out to have been removed from it).
+
+        Args:
+            state (ChatState): State of the chat to play in
+            song (Track): Song being started; its file_path is kept up to date
+            audio_file (str): File path or URL from _fetch_audio
+            source: Source handle from _fetch_audio
+            offset (float): Seconds into the track to start at
+        """
+        chat_id = state.chat_id
+
+        # Chats already streaming count towards the load; this one does not yet
+        active_calls = sum(1 for other in self.chats.values() if other.in_call and other is not state)
+        level, quality = self.quality.choose(chat_id, active_calls)
+        logger.info(f"Streaming {song.title} in chat {chat_id} at {level} quality")
+
+        async def _play(media_stream):
+            if state.in_call:
+                try:
+                    with tracer.span('change_stream'):
+                        await self._calls(chat_id).change_stream(chat_id, media_stream)
+                    return
+                except Exception as e:
+                    if not self._is_not_in_call(e):
+                        raise
+                    logger.warning(f"Not in the voice chat of {chat_id} anymore, joining again")
+                    state.in_call = False
 
-        # Dictionary to store queued songs
-        self.queue = {}
+            with tracer.span('join_group_call'):
+                await self._joining_calls(chat_id).join_group_call(chat_id, stream=media_stream)
+            state.in_call = True
 
-        # Start PyTgCalls
         try:
-            self.pytgcalls.start()
+            await _play(self._media_stream(audio_file, source, offset, quality))
+        except Exception as e:
+            # Voice chat errors are not fixed by playing the complete file
+            if source is None or "GROUPCALL" in str(e) or "No active group call" in str(e):
+                raise
+            logger.warning(f"Streaming failed in chat {chat_id}, falling back to the downloaded file: {e}")
+            STREAM_FALLBACKS.inc()
+            audio_file = await self._complete_file(chat_id, song, source)
+            if not audio_file:
+                raise
+            source = None
+            await _play(self._media_stream(audio_file, offset=offset, quality=quality))
+
+        if isinstance(source, StreamUrl):
+            return
+
+        song.file_path = audio_file
+
+        # A growing file moves into the audio cache once complete
+        if isinstance(source, ProgressiveDownload):
+            source.add_done_callback(lambda path: setattr(song, 'file_path', path))
+
+    async def start(self):
+        """
+        Start the player's background work on the bot's event loop.
+        Call once the clients are connected.
+        """
+        # Start PyTgCalls (and the Pyrogram client) of every assistant
+        try:
+            await self.assistants.start()
             logger.info("PyTgCalls successfully started")
         except Exception as e:
             logger.error(f"Failed to start PyTgCalls: {e}")
             raise
 
-        # Set up update handler for PyTgCalls v2.1.1
-        @self.pytgcalls.on_update()
-        async def on_update(_, update: Update):
-            # Check if the update is a stream end event
-            if isinstance(update, StreamEnded) and update.stream_type == StreamEnded.Type.AUDIO:
-                chat_id = update.chat_id
-                logger.info(f"Stream ended in chat {chat_id}")
+        # Metrics scrapes from the web thread read the player's state on this loop
+        metrics.bind_loop(asyncio.get_running_loop())
+        tracer.active = True
+        self.quality.start()
 
-                # Play next song in queue if available
-                if chat_id in self.queue and self.queue[chat_id]:
-                    # Get next song from queue
-                    next_song = self.queue[chat_id].pop(0)
-                    logger.info(f"Playing next song from queue: {next_song['title']}")
+    async def shutdown(self):
+        """Disconnect the assistant accounts (the bot's own client is left to its owner)"""
+        await self.assistants.stop(skip=self.client)
 
-                    # Update current playing info
-                    self.active_chats[chat_id] = next_song
+    async def restore_state(self):
+        """
+        Resume the chats saved before the last restart and start saving state
 
-                    # Play the next song
-                    try:
-                        audio_file = next_song.get('file_path')
-                        if audio_file and os.path.exists(audio_file):
-                            await self.pytgcalls.change_stream(
-                                chat_id,
-                                MediaStream(
-                                    audio_file,
-                                    audio_parameters=AudioQuality.HIGH
-                                )
-                            )
-                            logger.info(f"Changed stream to next song in chat {chat_id}")
-                        else:
-                            logger.error(f"Audio file not found for next song in queue")
-                            if chat_id in self.active_chats:
-                                self.active_chats.pop(chat_id)
-                    except Exception as e:
-                        logger.error(f"Error changing stream: {e}")
-                        if chat_id in self.active_chats:
-                            self.active_chats.pop(chat_id)
-                else:
-                    # No more songs in queue, clean up
-                    logger.info(f"No more songs in queue for chat {chat_id}, leaving voice chat")
+        Each chat's now-playing track is started again where it left off
+        (or its next track, if it had finished) and its queue is restored.
+        Chats whose voice chat cannot be joined anymore are dropped.
+        Call once the clients are connected.
+        """
+        if self.persister is None:
+            return
+
+        try:
+            snapshots, heartbeat = await asyncio.to_thread(self.persister.load)
+        except Exception as e:
+            logger.error(f"Error loading saved player state: {e}")
+            snapshots, heartbeat = [], None
+
+        # Restore a few chats at a time to spread the joins and downloads
+        semaphore = asyncio.Semaphore(5)
+
+        async def _restore(snapshot):
+            async with semaphore:
+                async with self.chat_locks.hold(snapshot['chat_id']):
                     try:
-                        await self.pytgcalls.leave_call(chat_id)
+                        return await self._restore_chat(snapshot, heartbeat)
                     except Exception as e:
-                        logger.error(f"Error leaving call: {e}")
+                        logger.error(f"Error restoring chat {snapshot['chat_id']}: {e}")
+                        self._forget_chat(snapshot['chat_id'])
+                        return False
 
-                    # Remove from active chats
-                    if chat_id in self.active_chats:
-                        self.active_chats.pop(chat_id)
+        results = await asyncio.gather(*(_restore(snapshot) for snapshot in snapshots))
+        if snapshots:
+            logger.info(f"Restored {sum(results)} of {len(snapshots)} saved chats")
 
-        logger.info("Music player initialized with PyTgCalls")
+        self.persister.start(self.chats)
+
+    async def _restore_chat(self, snapshot, heartbeat):
+        """
+        Start playback of one saved chat. The caller holds the chat lock.
+
+        Args:
+            snapshot (dict): Output of ChatState.snapshot()
+            heartbeat (float): When the state was last saved, i.e. roughly when the bot stopped
+
+        Returns:
+            bool: True if the chat is playing again
+        """
+        chat_id = snapshot['chat_id']
+        if chat_id in self.chats:
+            return True
+
+        state = ChatState.from_snapshot(snapshot)
+        track = Track.from_dict(snapshot['now_playing']) if snapshot.get('now_playing') else None
+
+        # Position when the bot stopped; paused tracks stay where they were paused
+        offset = 0.0
+        if track is not None and snapshot.get('started_at'):
+            stopped_at = snapshot.get('paused_at') or heartbeat or snapshot['started_at']
+            offset = max(0.0, stopped_at - snapshot['started_at'])
+            if track.duration_seconds and offset >= track.duration_seconds - 1:
+                track, offset = None, 0.0
+
+        if track is None:
+            track = state.next_track()
+        if track is None:
+            return False
+
+        if self.assistants.assign(chat_id) is None:
+            return False
+
+        audio_source = await self._prepare_song(chat_id, track)
+        if not audio_source:
+            logger.error(f"Audio not available to restore chat {chat_id}: {track.title}")
+            self._release_if_idle(chat_id)
+            return False
+
+        audio_file, source = audio_source
+        self.chats[chat_id] = state
+        await self._start_stream(state, track, audio_file, source, offset)
+
+        state.set_now_playing(track)
+        state.started_at -= offset
+        TRACKS_STARTED.inc(reason='restore')
+        self.prefetcher.schedule(chat_id)
+        logger.info(f"Resumed chat {chat_id} at {offset:.0f}s: {track.title}")
+        return True
+
+    async def save_state(self):
+        """Write all pending state changes now (e.g. before shutting down)"""
+        if self.persister is not None:
+            await self.persister.flush(self.chats)
 
     async def _ensure_voice_chat(self, chat_id: int) -> bool:
         """Check if voice chat is active in the chat"""
         try:
             # Try to join active voice chat
             try:
-                await self.pytgcalls.join_group_call(
+                await self._joining_calls(chat_id).join_group_call(
                     chat_id,
                     stream=None,
                     stream_type=None
@@ -140,7 +600,7 @@ class MusicPlayer:
             )
             return False
 
-    async def play(self, chat_id: int, query: str, message):
+    async def play(self, chat_id: int, query: str, message, reply=None):
         """
         Play audio in a voice chat
 
@@ -148,59 +608,83 @@ class MusicPlayer:
             chat_id (int): Chat ID where to play the audio
             query (str): YouTube search query or URL
             message (Message): Original message that triggered the command
+            reply (Message, optional): Bot message showing the result; edited
+                once the details of a song queued ahead of its lookup are known
 
         Returns:
-            str: Status message
+            str: Status message, or None when the player updates reply itself
         """
         try:
             # Check if this is a valid group chat first
             if chat_id > 0:
                 return "❌ Voice chats are only available in groups and channels, not in private chats."
 
-            # Get video info first
-            logger.info(f"Searching for query: {query}")
-            video_info = await get_video_info(query)
-
-            if not video_info:
-                return "❌ Could not find the requested song."
+            # Playlists are enqueued as a whole
+            if is_playlist_url(query):
+                return await self.play_playlist(chat_id, query, message)
 
-            title, duration, thumbnail, video_url = video_info
-
-            # Check if we're already playing something in this chat
-            if chat_id in self.active_chats:
-                # Add to queue instead
-                if chat_id not in self.queue:
-                    self.queue[chat_id] = []
+            # Commands of one chat run in order; other chats are not blocked
+            wait_started = time.perf_counter()
+            async with self.chat_locks.hold(chat_id):
+                tracer.record('chat_lock', wait_started, time.perf_counter())
+                try:
+                    return await self._play_song(chat_id, query, reply)
+                finally:
+                    self._release_if_idle(chat_id)
 
-                # Add to queue
-                queue_item = {
-                    'title': title,
-                    'duration': duration,
-                    'video_url': video_url,
-                    'thumbnail': thumbnail,
-                    'query': query
-                }
+        except Exception as e:
+            logger.error(f"Error in play function: {e}")
+            return f"❌ An error occurred: {str(e)}"
 
-                self.queue[chat_id].append(queue_item)
-                queue_position = len(self.queue[chat_id])
+    async def _play_song(self, chat_id: int, query: str, reply=None):
+        """
+        Play a song, or add it to the queue if the chat is already playing.
+        The caller holds the chat lock.
 
-                logger.info(f"Added to queue at position {queue_position} in chat {chat_id}: {title}")
+        Args:
+            chat_id (int): Chat ID where to play the audio
+            query (str): YouTube search query or URL
+            reply (Message, optional): Bot message to edit once a queued song is resolved
 
-                return f"""
+        Returns:
+            str: Status message, or None when the player updates reply itself
+        """
+        try:
+            # Check if we're already playing something in this chat
+            state = self._active(chat_id)
+            if state is not None:
+                # Add to queue right away and look the song up in the background
+                song = Track.placeholder(query)
+                queue_position = state.enqueue(song)
+                logger.info(f"Added to queue at position {queue_position} in chat {chat_id}: {query}")
+
+                text = f"""
 ✅ **Added to Queue**
 
-🎵 **Title:** {title}
-⏱ **Duration:** {duration}
-🔗 **Watch on YouTube:** [Click here]({video_url})
-
+🎵 **Query:** {query}
 📊 **Position in queue:** {queue_position}
+
+🔍 Looking up the song...
 """
+                # With a reply to edit, both edits come from the lookup task so they stay in order
+                task = asyncio.ensure_future(self._resolve_queued(state, song, reply, text))
+                self._resolving.add(task)
+                task.add_done_callback(self._resolving.discard)
+                return None if reply is not None else text
+
+            # Place the chat on an assistant with room for another call
+            if self.assistants.assign(chat_id) is None:
+                return "❌ All voice chat assistants are busy right now. Please try again later."
 
             # Try to download the audio
             try:
-                # First, ensure there's a voice chat
-                voice_chat_active = await self._ensure_voice_chat(chat_id)
-                if not voice_chat_active:
+                started = time.perf_counter()
+                timings = {}
+                result = await self._cold_start(chat_id, query, timings)
+
+                if result == 'no_video':
+                    return "❌ Could not find the requested song."
+                if result == 'no_voice_chat':
                     return """❌ Could not join or create a voice chat.
 
 Possible reasons:
@@ -214,53 +698,44 @@ Please make sure:
 2. The bot has 'Manage Voice Chats' permission
 3. You're using the bot in a group or channel, not a private chat
 4. A voice chat is already active if the bot can't create one"""
-
-                # Download the audio
-                logger.info(f"Downloading audio for: {title}")
-                audio_info = await download_and_extract_audio(query)
-
-                if not audio_info or not audio_info[0]:
+                if result == 'no_audio':
                     return "❌ Failed to download audio."
 
-                audio_file, _, _, _ = audio_info
+                video, (audio_file, source) = result
+                song = Track.from_video(video, query)
+                title = song.title
 
                 # Join the voice chat and play the audio (PyTgCalls v2.1.1)
                 try:
-                    # First stop any existing stream
-                    if chat_id in self.active_chats:
-                        try:
-                            await self.pytgcalls.leave_call(chat_id)
-                            await asyncio.sleep(1)  # Give it a moment to clean up
-                        except:
-                            pass  # Ignore errors from stopping existing stream
-                            
-                    # Now try to play the new stream
-                    await self.pytgcalls.join_group_call(
-                        chat_id,
-                        stream=MediaStream(
-                            audio_file,
-                            audio_parameters=AudioQuality.HIGH
-                        )
-                    )
+                    # Nothing else can start playback in this chat while we hold its lock
+                    state = self.chats.setdefault(chat_id, ChatState(chat_id))
+                    stream_started = time.perf_counter()
+                    try:
+                        await self._start_stream(state, song, audio_file, source)
+                    except Exception:
+                        if not state.in_call:
+                            self._forget_chat(chat_id)
+                        raise
+                    timings['stream'] = (time.perf_counter() - stream_started) * 1000
 
                     # Save info for the active chat
-                    self.active_chats[chat_id] = {
-                        'title': title,
-                        'duration': duration,
-                        'video_url': video_url,
-                        'thumbnail': thumbnail,
-                        'file_path': audio_file,
-                        'query': query
-                    }
+                    state.set_now_playing(song)
+                    TRACKS_STARTED.inc(reason='play')
 
                     logger.info(f"Now playing in chat {chat_id}: {title}")
+                    first_audio = time.perf_counter() - started
+                    FIRST_AUDIO.observe(first_audio)
+                    for stage, ms in timings.items():
+                        COLD_START_STAGES.observe(ms / 1000, stage=stage)
+                    stages = ", ".join(f"{stage} {ms:.0f}ms" for stage, ms in timings.items())
+                    logger.info(f"First audio in chat {chat_id} after {first_audio * 1000:.0f}ms ({stages})")
 
                     return f"""
 ✅ **Now Playing**
 
 🎵 **Title:** {title}
-⏱ **Duration:** {duration}
-🔗 **Watch on YouTube:** [Click here]({video_url})
+⏱ **Duration:** {song.duration}
+🔗 **Watch on YouTube:** [Click here]({song.video_url})
 
 📱 **Status:** Playing in voice chat
 """
@@ -284,6 +759,194 @@ Please make sure:
             logger.error(f"Error in play function: {e}")
             return f"❌ An error occurred: {str(e)}"
 
+    async def _resolve_queued(self, state, song, reply=None, queued_text=None):
+        """
+        Look up a song that was queued as a placeholder and fill in its details
+
+        A song that cannot be found is taken out of the queue. The reply of
+        the /play that queued it first shows queued_text and then the outcome.
+
+        Args:
+            state (ChatState): State of the chat the song was queued in
+            song (Track): Placeholder from Track.placeholder
+            reply (Message, optional): Bot message to edit
+            queued_text (str, optional): Message shown while the lookup runs
+        """
+        chat_id = state.chat_id
+        lookup = asyncio.ensure_future(resolve_video(song.query))
+        if reply is not None and queued_text:
+            try:
+                await reply.edit(queued_text)
+            except Exception as e:
+                logger.error(f"Error updating queued song message: {e}")
+
+        try:
+            video = await lookup
+        except Exception as e:
+            logger.error(f"Error resolving queued song {song.query}: {e}")
+            video = None
+
+        # Other commands of the chat may have changed the queue during the lookup
+        async with self.chat_locks.hold(chat_id):
+            queued = self.chats.get(chat_id) is state and song in state.queue
+            if not video:
+                if queued:
+                    state.queue.remove(song)
+                    state.touch()
+                text = f"❌ Could not find the requested song: {song.query}"
+            else:
+                old_seconds = song.duration_seconds
+                song.fill(video)
+                state.touch()
+                if queued:
+                    state.queue.refresh(song, old_seconds)
+                    self.prefetcher.schedule(chat_id)
+                position = state.queue.index(song) + 1 if queued else None
+                logger.info(f"Resolved queued song in chat {chat_id}: {song.title}")
+                text = f"""
+✅ **Added to Queue**
+
+🎵 **Title:** {song.title}
+⏱ **Duration:** {song.duration}
+🔗 **Watch on YouTube:** [Click here]({song.video_url})
+""" + (f"\n📊 **Position in queue:** {position}\n" if position else "")
+
+        if reply is not None:
+            try:
+                await reply.edit(text)
+            except Exception as e:
+                logger.error(f"Error updating queued song message: {e}")
+
+    async def _cold_start(self, chat_id: int, query: str, timings: dict):
+        """
+        Resolve and fetch a song while checking the voice chat at the same time
+
+        Neither branch depends on the other, so the voice chat check (skipped
+        while the bot idles in the call) overlaps the metadata lookup and the
+        download. When one branch fails the other is cancelled, along with
+        the chat's downloads.
+
+        Args:
+            chat_id (int): Chat the song is for
+            query (str): YouTube search query or URL
+            timings (dict): Receives the milliseconds each stage took
+
+        Returns:
+            tuple: (video, (audio_file, source)) ready for _start_stream, or
+                'no_video', 'no_voice_chat' or 'no_audio' naming the failed stage
+        """
+        async def _timed(stage, coro):
+            stage_started = time.perf_counter()
+            try:
+                with tracer.span(stage):
+                    return await coro
+            finally:
+                timings[stage] = (time.perf_counter() - stage_started) * 1000
+
+        async def _audio():
+            logger.info(f"Searching for query: {query}")
+            video = await _timed('resolve', resolve_video(query))
+            if not video:
+                return 'no_video'
+
+            logger.info(f"Downloading audio for: {video['title']}")
+            audio_source = await _timed('audio', self._fetch_audio(query, video, chat_id))
+            if not audio_source:
+                return 'no_audio'
+            return video, audio_source
+
+        state = self.chats.get(chat_id)
+        in_call = state is not None and state.in_call
+
+        audio_task = asyncio.ensure_future(_audio())
+        voice_task = None
+        if not in_call:
+            voice_task = asyncio.ensure_future(_timed('voice_chat', self._ensure_voice_chat(chat_id)))
+
+        pending = {task for task in (audio_task, voice_task) if task is not None}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if voice_task in done and not voice_task.result():
+                    # Do not keep downloading for a chat we cannot play in
+                    download_scheduler.cancel_chat(chat_id)
+                    return 'no_voice_chat'
+                if audio_task in done and (audio_task.exception() is not None or isinstance(audio_task.result(), str)):
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        # The voice chat check may have joined the call although there is nothing to play
+        failed = audio_task.exception() is not None or isinstance(audio_task.result(), str)
+        if voice_task is not None and failed:
+            await self._leave_unused_call(chat_id)
+        return audio_task.result()
+
+    async def _leave_unused_call(self, chat_id: int):
+        """Leave a voice chat joined by _ensure_voice_chat, if it was joined, for a song that failed"""
+        try:
+            await self._calls(chat_id).leave_call(chat_id)
+            logger.info(f"Left voice chat in {chat_id}, nothing to play")
+        except Exception as e:
+            if not self._is_not_in_call(e):
+                logger.error(f"Error leaving call: {e}")
+
+    async def play_playlist(self, chat_id: int, url: str, message):
+        """
+        Enqueue every track of a playlist
+
+        The playlist is read with one flat extraction; each track's audio is
+        only downloaded when it is about to play.
+
+        Args:
+            chat_id (int): Chat ID where to play the playlist
+            url (str): YouTube playlist URL
+            message (Message): Original message that triggered the command
+
+        Returns:
+            str: Status message
+        """
+        try:
+            logger.info(f"Loading playlist: {url}")
+            playlist = await get_playlist_entries(url)
+
+            if not playlist or not playlist[1]:
+                return "❌ Could not load the playlist or it is empty."
+
+            playlist_title, entries = playlist
+
+            async with self.chat_locks.hold(chat_id):
+                # Start the first track if nothing is playing yet
+                status = ""
+                if self._active(chat_id) is None:
+                    first = entries[0]
+                    status = await self._play_song(chat_id, first['video_url'])
+                    if self._active(chat_id) is None:
+                        self._release_if_idle(chat_id)
+                        return status
+                    entries = entries[1:]
+
+                state = self.chats[chat_id]
+                for entry in entries:
+                    state.enqueue(Track.from_video(entry))
+
+                self.prefetcher.schedule(chat_id)
+                logger.info(f"Added {len(entries)} tracks from playlist to queue in chat {chat_id}")
+
+                return f"""{status}
+📃 **Playlist:** {playlist_title}
+
+✅ **Added to Queue:** {len(entries)} tracks
+📊 **Songs in queue:** {len(state.queue)}
+"""
+
+        except Exception as e:
+            logger.error(f"Error in play_playlist function: {e}")
+            return f"❌ An error occurred: {str(e)}"
+
     async def stop(self, chat_id: int):
         """
         Stop playing and leave the voice chat
@@ -294,33 +957,45 @@ Please make sure:
         Returns:
             str: Status message
         """
-        try:
-            if chat_id in self.active_chats:
-                # Get the song details
-                song_info = self.active_chats[chat_id]
-                title = song_info.get('title', 'Unknown')
+        # Withdraw pending downloads first so an operation waiting on one ends quickly
+        download_scheduler.cancel_chat(chat_id)
 
-                # Stop streaming and leave voice chat (PyTgCalls v2.1.1)
-                try:
-                    await self.pytgcalls.leave_call(chat_id)
-                    logger.info(f"Left voice chat in {chat_id}")
-                except Exception as e:
-                    logger.error(f"Error leaving voice chat: {e}")
+        async with self.chat_locks.hold(chat_id):
+            try:
+                state = self.chats.get(chat_id)
+                if state is not None and not state.is_playing and state.in_call:
+                    # Idle in the call after the queue ran out
+                    try:
+                        await self._calls(chat_id).leave_call(chat_id)
+                    except Exception as e:
+                        logger.error(f"Error leaving voice chat: {e}")
+                    self._forget_chat(chat_id)
+                    return "🛑 Left the voice chat."
 
-                # Clean up
-                self.active_chats.pop(chat_id, None)
+                state = self._active(chat_id)
+                if state is not None:
+                    # Get the song details
+                    title = state.now_playing.title or 'Unknown'
 
-                # Clear queue
-                if chat_id in self.queue:
-                    self.queue.pop(chat_id, None)
+                    # Stop streaming and leave voice chat (PyTgCalls v2.1.1)
+                    try:
+                        await self._calls(chat_id).leave_call(chat_id)
+                        logger.info(f"Left voice chat in {chat_id}")
+                    except Exception as e:
+                        logger.error(f"Error leaving voice chat: {e}")
 
-                return f"🛑 Stopped playing **{title}** and left the voice chat."
-            else:
-                return "❌ I'm not playing anything in this chat."
+                    # Clean up state and queue
+                    self._forget_chat(chat_id)
+                    self.prefetcher.cancel(chat_id)
+                    download_scheduler.cancel_chat(chat_id)
 
-        except Exception as e:
-            logger.error(f"Error stopping playback: {e}")
-            return f"❌ Error stopping playback: {str(e)}"
+                    return f"🛑 Stopped playing **{title}** and left the voice chat."
+                else:
+                    return "❌ I'm not playing anything in this chat."
+
+            except Exception as e:
+                logger.error(f"Error stopping playback: {e}")
+                return f"❌ Error stopping playback: {str(e)}"
 
     async def skip(self, chat_id: int):
         """
@@ -332,68 +1007,64 @@ Please make sure:
         Returns:
             str: Status message
         """
-        try:
-            # Check if there's an active stream
-            if chat_id not in self.active_chats:
-                return "❌ No active playback to skip."
+        async with self.chat_locks.hold(chat_id):
+            try:
+                # Check if there's an active stream
+                state = self._active(chat_id)
+                if state is None:
+                    return "❌ No active playback to skip."
 
-            current_song = self.active_chats[chat_id]['title']
+                current_song = state.now_playing.title
 
-            # Check if there are songs in queue
-            if chat_id not in self.queue or not self.queue[chat_id]:
-                # No songs in queue, just stop (PyTgCalls v2.1.1)
-                try:
-                    await self.pytgcalls.leave_call(chat_id)
-                    self.active_chats.pop(chat_id, None)
-                    return f"⏭ Skipped **{current_song}**. No more songs in queue."
-                except Exception as e:
-                    logger.error(f"Error leaving voice chat: {e}")
-                    return f"❌ Error skipping: {str(e)}"
+                # Check if there are songs in queue
+                if not state.queue:
+                    # No songs in queue, just stop (PyTgCalls v2.1.1)
+                    try:
+                        await self._calls(chat_id).leave_call(chat_id)
+                        self._forget_chat(chat_id)
+                        return f"⏭ Skipped **{current_song}**. No more songs in queue."
+                    except Exception as e:
+                        logger.error(f"Error leaving voice chat: {e}")
+                        return f"❌ Error skipping: {str(e)}"
 
-            # Get next song from queue
-            next_song = self.queue[chat_id].pop(0)
-            next_title = next_song['title']
+                # Get next song from queue
+                next_song = state.next_track()
+                next_title = next_song.title
+                self.prefetcher.schedule(chat_id)
 
-            # Try to download the next audio if needed
-            if 'file_path' not in next_song or not os.path.exists(next_song['file_path']):
+                # Use the prefetched audio, or download it now
                 try:
-                    audio_info = await download_and_extract_audio(next_song['query'])
-                    if audio_info and audio_info[0]:
-                        next_song['file_path'] = audio_info[0]
-                    else:
+                    audio_source = await self._prepare_song(chat_id, next_song)
+                    if not audio_source:
                         return "❌ Failed to download next audio."
+                    audio_file, source = audio_source
                 except Exception as e:
                     logger.error(f"Error downloading next audio: {e}")
                     return f"❌ Error downloading next audio: {str(e)}"
 
-            # Change stream (PyTgCalls v2.1.1)
-            try:
-                await self.pytgcalls.change_stream(
-                    chat_id,
-                    MediaStream(
-                        next_song['file_path'],
-                        audio_parameters=AudioQuality.HIGH
-                    )
-                )
+                # Change stream (PyTgCalls v2.1.1)
+                try:
+                    await self._start_stream(state, next_song, audio_file, source)
 
-                # Update current playing info
-                self.active_chats[chat_id] = next_song
+                    # Update current playing info
+                    state.set_now_playing(next_song)
+                    TRACKS_STARTED.inc(reason='skip')
 
-                return f"""
+                    return f"""
 ⏭ Skipped to next song
 
 🎵 **Now Playing:** {next_title}
-⏱ **Duration:** {next_song['duration']}
-🔗 **Watch on YouTube:** [Click here]({next_song['video_url']})
+⏱ **Duration:** {next_song.duration}
+🔗 **Watch on YouTube:** [Click here]({next_song.video_url})
 """
+                except Exception as e:
+                    logger.error(f"Error changing stream: {e}")
+                    return f"❌ Error skipping: {str(e)}"
+
             except Exception as e:
-                logger.error(f"Error changing stream: {e}")
+                logger.error(f"Error in skip function: {e}")
                 return f"❌ Error skipping: {str(e)}"
 
-        except Exception as e:
-            logger.error(f"Error in skip function: {e}")
-            return f"❌ Error skipping: {str(e)}"
-
     async def pause(self, chat_id: int):
         """
         Pause the current playback
@@ -404,21 +1075,24 @@ Please make sure:
         Returns:
             str: Status message
         """
-        try:
-            if chat_id not in self.active_chats:
-                return "❌ No active playback to pause."
-
+        async with self.chat_locks.hold(chat_id):
             try:
-                await self.pytgcalls.pause(chat_id)
-                return "⏸ Music playback paused."
+                state = self._active(chat_id)
+                if state is None:
+                    return "❌ No active playback to pause."
+
+                try:
+                    await self._calls(chat_id).pause(chat_id)
+                    state.pause()
+                    return "⏸ Music playback paused."
+                except Exception as e:
+                    logger.error(f"Error pausing stream: {e}")
+                    return f"❌ Error pausing: {str(e)}"
+
             except Exception as e:
-                logger.error(f"Error pausing stream: {e}")
+                logger.error(f"Error in pause function: {e}")
                 return f"❌ Error pausing: {str(e)}"
 
-        except Exception as e:
-            logger.error(f"Error in pause function: {e}")
-            return f"❌ Error pausing: {str(e)}"
-
     async def resume(self, chat_id: int):
         """
         Resume paused playback
@@ -429,59 +1103,230 @@ Please make sure:
         Returns:
             str: Status message
         """
-        try:
-            if chat_id not in self.active_chats:
-                return "❌ No paused playback to resume."
-
+        async with self.chat_locks.hold(chat_id):
             try:
-                await self.pytgcalls.resume(chat_id)
-                return "▶️ Music playback resumed."
+                state = self._active(chat_id)
+                if state is None:
+                    return "❌ No paused playback to resume."
+
+                try:
+                    await self._calls(chat_id).resume(chat_id)
+                    state.resume()
+                    return "▶️ Music playback resumed."
+                except Exception as e:
+                    logger.error(f"Error resuming stream: {e}")
+                    return f"❌ Error resuming: {str(e)}"
+
             except Exception as e:
-                logger.error(f"Error resuming stream: {e}")
+                logger.error(f"Error in resume function: {e}")
                 return f"❌ Error resuming: {str(e)}"
 
-        except Exception as e:
-            logger.error(f"Error in resume function: {e}")
-            return f"❌ Error resuming: {str(e)}"
+    def stats(self):
+        """
+        Get the playback state of all chats
 
-    async def queue(self, chat_id: int):
+        Returns:
+            dict: Chat, call, playing and queue counts
+        """
+        states = list(self.chats.values())
+        return {
+            'chats': len(states),
+            'in_call': sum(1 for state in states if state.in_call),
+            'playing': sum(1 for state in states if state.is_playing),
+            'paused': sum(1 for state in states if state.paused),
+            'queued_tracks': sum(len(state.queue) for state in states),
+            'queued_seconds': sum(state.queue.total_seconds for state in states),
+            'resolving': len(self._resolving),
+        }
+
+    async def stats_report(self):
         """
-        Get the current queue
+        Get a summary of the bot's metrics for admins
+
+        Returns:
+            str: Stats message
+        """
+        try:
+            player = self.stats()
+            uptime = self._format_total(time.time() - metrics.started_at)
+
+            def _latency(histogram, **labels):
+                summary = histogram.summary(**labels)
+                if not summary['count']:
+                    return "no data"
+                return (
+                    f"{summary['count']} | p50 {summary['p50'] * 1000:.0f}ms"
+                    f" | p95 {summary['p95'] * 1000:.0f}ms | p99 {summary['p99'] * 1000:.0f}ms"
+                )
+
+            lookups = AUDIO_CACHE_LOOKUPS.total()
+            audio_hits = AUDIO_CACHE_LOOKUPS.value(result='hit')
+            video_cache = get_info_cache_stats()['videos']
+            assistants = self.assistants.stats()
+
+            lines = [
+                "📊 **Bot Stats**\n",
+                f"⏱ Uptime: {uptime}",
+                f"🎙 Voice chats: {player['in_call']} | Playing: {player['playing']} | Paused: {player['paused']}",
+                f"📋 Queued: {player['queued_tracks']} tracks ({self._format_total(player['queued_seconds'])})",
+                f"🤖 Assistants: {len(assistants['assistants'])} serving {assistants['chats']} chats"
+                f" | Rejected: {assistants['rejected']}",
+                f"💬 Commands: {COMMANDS.total():.0f} | Errors: {COMMAND_ERRORS.total():.0f}",
+                "",
+                f"🔍 Extraction: {_latency(EXTRACT_LATENCY)}",
+                f"⬇️ Download: {_latency(DOWNLOAD_LATENCY)}",
+                f"▶️ First audio: {_latency(FIRST_AUDIO)}",
+                "",
+                f"🗂 Metadata cache hit rate: {video_cache.get('hit_rate', 0):.0%}",
+                f"💾 Audio cache hit rate: {audio_hits / lookups if lookups else 0:.0%}",
+            ]
+            return "\n".join(lines)
+
+        except Exception as e:
+            logger.error(f"Error in stats_report function: {e}")
+            return f"❌ Error getting stats: {str(e)}"
+
+    @staticmethod
+    def _format_total(seconds):
+        """Format a total duration as H:MM:SS or M:SS"""
+        hours, rest = divmod(int(seconds), 3600)
+        minutes, seconds = divmod(rest, 60)
+        if hours:
+            return f"{hours}:{minutes:02d}:{seconds:02d}"
+        return f"{minutes}:{seconds:02d}"
+
+    async def queue(self, chat_id: int, page: int = 1):
+        """
+        Get one page of the current queue
 
         Args:
             chat_id (int): Chat ID to get queue for
+            page (int): Page to show, starting at 1 (clamped to the last page)
 
         Returns:
-            str: Queue information
+            tuple: (queue information, page shown, number of pages)
         """
         try:
             # Check if there's an active stream
-            if chat_id not in self.active_chats:
-                return "❌ No active playback or queue."
+            state = self._active(chat_id)
+            if state is None:
+                return "❌ No active playback or queue.", 1, 1
 
-            current_song = self.active_chats[chat_id]['title']
+            current_song = state.now_playing.title
 
             # Check if there are songs in queue
-            if chat_id not in self.queue or not self.queue[chat_id]:
+            if not state.queue:
                 return f"""
 📋 **Queue Information**
 
 🎵 **Now Playing:** {current_song}
 
 No more songs in queue.
-"""
+""", 1, 1
 
-            # Construct queue message
-            queue_msg = f"📋 **Queue Information**\n\n🎵 **Now Playing:** {current_song}\n\n**Up Next:**\n"
+            pages = (len(state.queue) + QUEUE_PAGE_SIZE - 1) // QUEUE_PAGE_SIZE
+            page = max(1, min(page, pages))
 
-            for i, song in enumerate(self.queue[chat_id]):
-                queue_msg += f"{i+1}. {song['title']} ({song['duration']})\n"
+            # Construct queue message from the requested page only
+            lines = [
+                "📋 **Queue Information**\n",
+                f"🎵 **Now Playing:** {current_song}\n",
+                f"**Up Next:** {len(state.queue)} songs, {self._format_total(state.queue.total_seconds)}",
+            ]
+            for position, song in state.queue.page((page - 1) * QUEUE_PAGE_SIZE, QUEUE_PAGE_SIZE):
+                lines.append(f"{position + 1}. {song.title} ({song.duration})")
+            if pages > 1:
+                lines.append(f"\nPage {page}/{pages}")
 
-            return queue_msg
+            return "\n".join(lines), page, pages
 
         except Exception as e:
             logger.error(f"Error in queue function: {e}")
-            return f"❌ Error getting queue: {str(e)}"
+            return f"❌ Error getting queue: {str(e)}", 1, 1
+
+    async def remove(self, chat_id: int, position: int):
+        """
+        Remove a song from the queue
+
+        Args:
+            chat_id (int): Chat ID
+            position (int): Position of the song in the queue (1-based)
+
+        Returns:
+            str: Status message
+        """
+        async with self.chat_locks.hold(chat_id):
+            try:
+                state = self._active(chat_id)
+                if state is None or not state.queue:
+                    return "❌ The queue is empty."
+                if not 1 <= position <= len(state.queue):
+                    return f"❌ Position must be between 1 and {len(state.queue)}."
+
+                song = state.queue.remove_at(position - 1)
+                state.touch()
+                self.prefetcher.cancel_song(chat_id, song)
+                self.prefetcher.schedule(chat_id)
+                return f"🗑 Removed **{song.title}** from the queue."
+
+            except Exception as e:
+                logger.error(f"Error in remove function: {e}")
+                return f"❌ Error removing song: {str(e)}"
+
+    async def move(self, chat_id: int, position: int, new_position: int):
+        """
+        Move a song to another position in the queue
+
+        Args:
+            chat_id (int): Chat ID
+            position (int): Current position of the song (1-based)
+            new_position (int): Position to move it to (1-based)
+
+        Returns:
+            str: Status message
+        """
+        async with self.chat_locks.hold(chat_id):
+            try:
+                state = self._active(chat_id)
+                if state is None or not state.queue:
+                    return "❌ The queue is empty."
+                size = len(state.queue)
+                if not 1 <= position <= size or not 1 <= new_position <= size:
+                    return f"❌ Positions must be between 1 and {size}."
+
+                song = state.queue.move(position - 1, new_position - 1)
+                state.touch()
+                self.prefetcher.schedule(chat_id)
+                return f"↕️ Moved **{song.title}** to position {new_position}."
+
+            except Exception as e:
+                logger.error(f"Error in move function: {e}")
+                return f"❌ Error moving song: {str(e)}"
+
+    async def shuffle(self, chat_id: int):
+        """
+        Shuffle the queue
+
+        Args:
+            chat_id (int): Chat ID
+
+        Returns:
+            str: Status message
+        """
+        async with self.chat_locks.hold(chat_id):
+            try:
+                state = self._active(chat_id)
+                if state is None or len(state.queue) < 2:
+                    return "❌ Not enough songs in queue to shuffle."
+
+                state.queue.shuffle()
+                state.touch()
+                self.prefetcher.schedule(chat_id)
+                return f"🔀 Shuffled {len(state.queue)} songs."
+
+            except Exception as e:
+                logger.error(f"Error in shuffle function: {e}")
+                return f"❌ Error shuffling: {str(e)}"
 
     async def volume(self, chat_id: int, volume: int):
         """
@@ -494,17 +1339,84 @@ No more songs in queue.
         Returns:
             str: Status message
         """
-        try:
-            if chat_id not in self.active_chats:
-                return "❌ No active playback to adjust volume."
-
+        async with self.chat_locks.hold(chat_id):
             try:
-                await self.pytgcalls.change_volume_call(chat_id, volume)
-                return f"🔊 Volume set to {volume}%."
+                if self._active(chat_id) is None:
+                    return "❌ No active playback to adjust volume."
+
+                try:
+                    await self._calls(chat_id).change_volume_call(chat_id, volume)
+                    return f"🔊 Volume set to {volume}%."
+                except Exception as e:
+                    logger.error(f"Error changing volume: {e}")
+                    return f"❌ Error changing volume: {str(e)}"
+
             except Exception as e:
-                logger.error(f"Error changing volume: {e}")
+                logger.error(f"Error in volume function: {e}")
                 return f"❌ Error changing volume: {str(e)}"
 
+    async def quality_status(self, chat_id: int):
+        """
+        Get the audio quality setting of a chat
+
+        Args:
+            chat_id (int): Chat ID
+
+        Returns:
+            str: Status message
+        """
+        try:
+            override = self.quality.get_override(chat_id)
+            active_calls = sum(1 for state in self.chats.values() if state.in_call)
+            level = override or self.quality.load_level(active_calls)
+            setting = override or "auto"
+            return (
+                f"🎚 **Audio Quality**\n\n"
+                f"Setting: {setting}\n"
+                f"New streams: {level}\n"
+                f"CPU: {self.quality.cpu_percent():.0f}% | Active calls: {active_calls}"
+            )
+
         except Exception as e:
-            logger.error(f"Error in volume function: {e}")
-            return f"❌ Error changing volume: {str(e)}"
\ No newline at end of file
+            logger.error(f"Error in quality_status function: {e}")
+            return f"❌ Error getting quality: {str(e)}"
+
+    async def set_quality(self, chat_id: int, level: str):
+        """
+        Pin the audio quality of a chat, or let it follow the load again
+
+        The playing song is restarted at its current position so the new
+        quality is heard right away; a paused song picks it up with the
+        next song.
+
+        Args:
+            chat_id (int): Chat ID
+            level (str): Quality level name or 'auto'
+
+        Returns:
+            str: Status message
+        """
+        if level != 'auto' and level not in QUALITY_LEVELS:
+            return f"❌ Unknown quality. Use one of: {', '.join(QUALITY_LEVELS)}, auto."
+
+        async with self.chat_locks.hold(chat_id):
+            try:
+                self.quality.set_override(chat_id, level)
+                message = f"🎚 Audio quality set to {level}."
+
+                state = self._active(chat_id)
+                song = state.now_playing if state is not None else None
+                if song is None or state.paused or not state.in_call:
+                    return message
+                if not song.file_path or not os.path.exists(song.file_path):
+                    return f"{message} It applies from the next song."
+
+                position = state.position()
+                await self._start_stream(state, song, song.file_path, None, position)
+                state.started_at = time.time() - position
+                state.touch()
+                return message
+
+            except Exception as e:
+                logger.error(f"Error in set_quality function: {e}")
+                return f"❌ Error setting quality: {str(e)}"
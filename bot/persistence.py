@@ -0,0 +1,376 @@
+"""
+Write-behind persistence of per-chat playback state so queues survive restarts.
+"""
+import logging
+import asyncio
+import json
+import time
+from bisect import bisect_left
+from collections import deque
+from itertools import count
+from sqlalchemy import (
+    create_engine, MetaData, Table, Column, BigInteger, Float, String, Text, select, delete, func
+)
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+# One row per chat with a JSON snapshot of its now-playing track and timing
+player_state = Table(
+    'player_state', metadata,
+    Column('chat_id', BigInteger, primary_key=True, autoincrement=False),
+    Column('data', Text, nullable=False),
+    Column('updated_at', Float, nullable=False),
+)
+
+# One row per queued track; position orders a chat's rows and leaves room between them
+player_queue = Table(
+    'player_queue', metadata,
+    Column('chat_id', BigInteger, primary_key=True, autoincrement=False),
+    Column('entry_id', BigInteger, primary_key=True, autoincrement=False),
+    Column('position', Float, nullable=False),
+    Column('data', Text, nullable=False),
+)
+
+# Process-wide values, e.g. when the player last saved its state
+player_meta = Table(
+    'player_meta', metadata,
+    Column('key', String(64), primary_key=True),
+    Column('value', Float, nullable=False),
+)
+
+def _increasing_run(pairs):
+    """
+    Find a longest run of pairs whose positions strictly increase in order
+
+    Args:
+        pairs (list): (index, position) pairs in queue order
+
+    Returns:
+        set: Indexes of the pairs in the run
+    """
+    tails = []
+    tail_pairs = []
+    previous = [None] * len(pairs)
+    for k, (_, position) in enumerate(pairs):
+        slot = bisect_left(tails, position)
+        if slot == len(tails):
+            tails.append(position)
+            tail_pairs.append(k)
+        else:
+            tails[slot] = position
+            tail_pairs[slot] = k
+        previous[k] = tail_pairs[slot - 1] if slot else None
+
+    run = set()
+    k = tail_pairs[-1] if tail_pairs else None
+    while k is not None:
+        run.add(pairs[k][0])
+        k = previous[k]
+    return run
+
+class StatePersister:
+    """
+    Saves the state of chats that changed since the last flush, every
+    interval seconds, off the event loop. Mutations are never written
+    synchronously: any number of changes to a chat between two flushes
+    cost one write of what actually changed. Queued tracks are rows of
+    their own, so adding, taking or removing one track writes one row
+    instead of the whole queue.
+    """
+    # Seconds between heartbeat writes while nothing else changes
+    HEARTBEAT_INTERVAL = 30.0
+
+    # Smallest gap between the positions of neighbouring rows before a chat's rows are renumbered
+    MIN_POSITION_GAP = 1e-6
+
+    def __init__(self, database_url: str, interval: float):
+        """
+        Initialize the persister and create its tables
+
+        Args:
+            database_url (str): SQLAlchemy database URL
+            interval (float): Seconds between flushes
+        """
+        self.interval = max(0.1, interval)
+        self.engine = create_engine(database_url, pool_pre_ping=True)
+        metadata.create_all(self.engine)
+
+        # chat_id -> updated_at of the state that was last written
+        self._saved = {}
+        # chat_id -> JSON of the chat's state row as last written
+        self._state_rows = {}
+        # chat_id -> {Track: [(entry_id, position, data)]} of the chat's queue rows as last written
+        self._queue_rows = {}
+        # chat_id -> {data: deque of (entry_id, position)} loaded rows not matched to a restored track yet
+        self._unclaimed = {}
+        self._entry_ids = count(1)
+        self._last_heartbeat = 0.0
+        self._task = None
+
+        # Counters
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_deleted = 0
+        self.compactions = 0
+        self.failures = 0
+        self.last_flush_ms = 0.0
+
+    def load(self):
+        """
+        Read the saved state of every chat
+
+        Returns:
+            tuple: (list of snapshots, time of the last flush or None)
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(player_state.c.chat_id, player_state.c.data)).all()
+            queue_rows = conn.execute(
+                select(player_queue.c.chat_id, player_queue.c.entry_id, player_queue.c.position, player_queue.c.data)
+                .order_by(player_queue.c.chat_id, player_queue.c.position)
+            ).all()
+            last_entry_id = conn.execute(select(func.max(player_queue.c.entry_id))).scalar()
+            heartbeat = conn.execute(
+                select(player_meta.c.value).where(player_meta.c.key == 'heartbeat')
+            ).scalar()
+
+        queues = {}
+        for chat_id, entry_id, position, data in queue_rows:
+            queues.setdefault(chat_id, []).append((entry_id, position, data))
+
+        snapshots = []
+        for chat_id, data in rows:
+            try:
+                snapshot = json.loads(data)
+            except ValueError as e:
+                logger.error(f"Ignoring unreadable saved state of chat {chat_id}: {e}")
+                continue
+
+            # State saved before queues had their own table still carries the queue
+            if chat_id in queues:
+                snapshot['queue'] = []
+                for _, _, track in queues[chat_id]:
+                    try:
+                        snapshot['queue'].append(json.loads(track))
+                    except ValueError as e:
+                        logger.error(f"Ignoring unreadable queued track of chat {chat_id}: {e}")
+            snapshots.append(snapshot)
+
+        # Rows of chats that are not restored get deleted by the next flush
+        self._saved = {chat_id: None for chat_id in {chat_id for chat_id, _ in rows} | set(queues)}
+        self._state_rows = {chat_id: data for chat_id, data in rows}
+        self._unclaimed = {}
+        for chat_id, entries in queues.items():
+            unclaimed = self._unclaimed[chat_id] = {}
+            for entry_id, position, data in entries:
+                unclaimed.setdefault(data, deque()).append((entry_id, position))
+        self._entry_ids = count((last_entry_id or 0) + 1)
+
+        logger.info(f"Loaded saved state of {len(snapshots)} chats")
+        return snapshots, heartbeat
+
+    def start(self, chats: dict):
+        """
+        Start flushing the state of chats in the background
+
+        Args:
+            chats (dict): chat_id -> ChatState (owned by the music player)
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush_loop(chats))
+
+    async def _flush_loop(self, chats):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush(chats)
+
+    def _plan_queue(self, chat_id, queue):
+        """
+        Work out the row writes that bring a chat's saved queue up to date
+
+        Tracks keep their row while their order relative to the other kept
+        tracks is unchanged (the longest run of saved positions that still
+        increases); only added, moved, changed and removed tracks are written.
+        A restored track takes over the loaded row with the same data.
+
+        Args:
+            chat_id (int): Chat ID
+            queue (TrackQueue): The chat's queue
+
+        Returns:
+            tuple: (rows to write, entry ids to delete, new row map)
+        """
+        saved = {track: deque(rows) for track, rows in self._queue_rows.get(chat_id, {}).items()}
+        unclaimed = {data: deque(entries) for data, entries in self._unclaimed.get(chat_id, {}).items()}
+
+        tracks = []
+        for track in queue:
+            data = json.dumps(track.to_dict())
+            row = saved[track].popleft() if saved.get(track) else None
+            if row is None and unclaimed.get(data):
+                row = unclaimed[data].popleft() + (data,)
+            tracks.append((track, data, row))
+
+        kept = _increasing_run([(index, row[1]) for index, (_, _, row) in enumerate(tracks) if row is not None])
+        positions = [row[1] if index in kept else None for index, (_, _, row) in enumerate(tracks)]
+
+        # Place the other tracks between their kept neighbours; renumber when there is no room left
+        compact = False
+        index = 0
+        while index < len(tracks):
+            if positions[index] is not None:
+                index += 1
+                continue
+            end = index
+            while end < len(tracks) and positions[end] is None:
+                end += 1
+            low = positions[index - 1] if index > 0 else None
+            high = positions[end] if end < len(tracks) else None
+            gap = end - index
+            for offset in range(gap):
+                if low is None and high is None:
+                    positions[index + offset] = float(index + offset + 1)
+                elif low is None:
+                    positions[index + offset] = high - gap + offset
+                elif high is None:
+                    positions[index + offset] = low + offset + 1
+                else:
+                    positions[index + offset] = low + (high - low) * (offset + 1) / (gap + 1)
+            if low is not None and high is not None and (high - low) / (gap + 1) < self.MIN_POSITION_GAP:
+                compact = True
+            index = end
+
+        if compact:
+            self.compactions += 1
+            positions = [float(index + 1) for index in range(len(tracks))]
+
+        rows = []
+        new_map = {}
+        for (track, data, row), position in zip(tracks, positions):
+            if row is None:
+                entry_id = next(self._entry_ids)
+            else:
+                entry_id = row[0]
+            if row is None or row[1] != position or row[2] != data:
+                rows.append({'chat_id': chat_id, 'entry_id': entry_id, 'position': position, 'data': data})
+            new_map.setdefault(track, []).append((entry_id, position, data))
+
+        # Rows left over belong to tracks that left the queue
+        stale = [entry_id for rows_left in saved.values() for entry_id, _, _ in rows_left]
+        stale.extend(entry_id for entries in unclaimed.values() for entry_id, _ in entries)
+        return rows, stale, new_map
+
+    async def flush(self, chats: dict):
+        """
+        Write what changed in the chats since the last flush and delete chats that are gone
+
+        A transaction is only opened for changes, or to record the heartbeat
+        every HEARTBEAT_INTERVAL seconds while chats are active.
+
+        Args:
+            chats (dict): chat_id -> ChatState
+        """
+        # Plan on the event loop so the writer thread never sees a half-updated state
+        state_rows = {}
+        queue_rows = []
+        stale_entries = []
+        plans = {}
+        for chat_id, state in list(chats.items()):
+            if self._saved.get(chat_id) == state.updated_at:
+                continue
+            data = json.dumps(state.snapshot(include_queue=False))
+            if data != self._state_rows.get(chat_id):
+                state_rows[chat_id] = (state.updated_at, data)
+            rows, stale, queue_map = self._plan_queue(chat_id, state.queue)
+            queue_rows.extend(rows)
+            stale_entries.extend(stale)
+            plans[chat_id] = (state.updated_at, data, queue_map)
+        deletes = [chat_id for chat_id in self._saved if chat_id not in chats]
+
+        now = time.time()
+        changed = bool(state_rows or queue_rows or stale_entries or deletes)
+        heartbeat = now if changed or (chats and now - self._last_heartbeat >= self.HEARTBEAT_INTERVAL) else None
+
+        if heartbeat is not None:
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, state_rows, queue_rows, stale_entries, deletes, heartbeat)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Error saving player state: {e}")
+                return
+
+            self._last_heartbeat = heartbeat
+            self.flushes += 1
+            self.rows_written += len(state_rows) + len(queue_rows)
+            self.rows_deleted += len(stale_entries) + len(deletes)
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+
+        for chat_id, (updated_at, data, queue_map) in plans.items():
+            self._saved[chat_id] = updated_at
+            self._state_rows[chat_id] = data
+            self._queue_rows[chat_id] = queue_map
+            self._unclaimed.pop(chat_id, None)
+        for chat_id in deletes:
+            self._saved.pop(chat_id, None)
+            self._state_rows.pop(chat_id, None)
+            self._queue_rows.pop(chat_id, None)
+            self._unclaimed.pop(chat_id, None)
+
+    def _write(self, state_rows, queue_rows, stale_entries, deletes, heartbeat):
+        """Blocking write of one flush in a single transaction"""
+        with self.engine.begin() as conn:
+            changed = list(state_rows) + deletes
+            if changed:
+                conn.execute(delete(player_state).where(player_state.c.chat_id.in_(changed)))
+            if state_rows:
+                conn.execute(player_state.insert(), [
+                    {'chat_id': chat_id, 'data': data, 'updated_at': updated_at}
+                    for chat_id, (updated_at, data) in state_rows.items()
+                ])
+            if deletes:
+                conn.execute(delete(player_queue).where(player_queue.c.chat_id.in_(deletes)))
+
+            # Entry ids are unique across chats; rewritten rows are deleted and inserted again
+            replaced = [row['entry_id'] for row in queue_rows] + stale_entries
+            if replaced:
+                conn.execute(delete(player_queue).where(player_queue.c.entry_id.in_(replaced)))
+            if queue_rows:
+                conn.execute(player_queue.insert(), queue_rows)
+
+            conn.execute(delete(player_meta).where(player_meta.c.key == 'heartbeat'))
+            conn.execute(player_meta.insert(), {'key': 'heartbeat', 'value': heartbeat})
+
+    def stats(self):
+        """
+        Get persistence counters
+
+        Returns:
+            dict: Saved chats, flush and row counts, failures and last flush time
+        """
+        return {
+            'chats': len(self._saved),
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'rows_deleted': self.rows_deleted,
+            'compactions': self.compactions,
+            'failures': self.failures,
+            'last_flush_ms': round(self.last_flush_ms, 2),
+        }
+
+def create_persister():
+    """
+    Create the state persister if persistence is enabled
+
+    Returns:
+        StatePersister: Persister, or None if disabled or the database is unavailable
+    """
+    if not Config.PERSIST_STATE:
+        return None
+    try:
+        return StatePersister(Config.DATABASE_URL, Config.PERSIST_INTERVAL)
+    except Exception as e:
+        logger.error(f"Player state persistence disabled, database unavailable: {e}")
+        return None
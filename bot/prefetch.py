@@ -0,0 +1,142 @@
+"""
+Background prefetching of upcoming queue entries so track changes never wait on a download.
+"""
+import logging
+import asyncio
+import os
+from itertools import islice
+from bot.config import Config
+from bot.ytdl import download_and_extract_audio, resolve_video, cancel_download
+from bot.scheduler import Priority
+from bot.stream_urls import stream_url_cache
+
+logger = logging.getLogger(__name__)
+
+class Prefetcher:
+    """
+    Keeps the next few queued songs of every chat downloaded ahead of time,
+    with a global cap on concurrent prefetch downloads
+    """
+    def __init__(self, chats: dict, depth: int, concurrency: int):
+        """
+        Initialize the prefetcher
+
+        Args:
+            chats (dict): chat_id -> ChatState (owned by the music player)
+            depth (int): Number of upcoming songs per chat to keep downloaded
+            concurrency (int): Maximum prefetch downloads running at once
+        """
+        self.chats = chats
+        self.depth = max(0, depth)
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        # (chat_id, song id) -> running prefetch task
+        self._tasks = {}
+
+        self.prefetched = 0
+        self.failed = 0
+
+    @staticmethod
+    def _has_file(song):
+        path = song.file_path
+        return bool(path) and os.path.exists(path)
+
+    def schedule(self, chat_id: int):
+        """
+        Start downloads for the next queued songs of a chat that are not ready yet
+
+        Args:
+            chat_id (int): Chat whose queue changed
+        """
+        state = self.chats.get(chat_id)
+        if state is None:
+            return
+
+        for position, song in enumerate(islice(state.queue, self.depth)):
+            key = (chat_id, id(song))
+            if key in self._tasks or self._has_file(song):
+                continue
+
+            # The song right after the current one is more urgent than the rest
+            priority = Priority.NEXT if position == 0 else Priority.PREFETCH
+            task = asyncio.create_task(self._prefetch(chat_id, song, priority))
+            self._tasks[key] = task
+
+            def _forget(done_task, key=key):
+                if self._tasks.get(key) is done_task:
+                    del self._tasks[key]
+
+            task.add_done_callback(_forget)
+
+    async def _prefetch(self, chat_id, song, priority):
+        """Download one song and record its file path"""
+        async with self._semaphore:
+            if self._has_file(song):
+                return song.file_path
+
+            # Direct playback only needs a fresh stream URL, not the file
+            if Config.PLAYBACK_MODE == 'direct':
+                video = await resolve_video(song.source_query)
+                if video and await stream_url_cache.get(video):
+                    return None
+
+            logger.info(f"Prefetching: {song.title}")
+            audio_info = await download_and_extract_audio(
+                song.source_query,
+                priority=priority,
+                chat_id=chat_id
+            )
+
+        if not audio_info or not audio_info[0]:
+            self.failed += 1
+            logger.error(f"Prefetch failed for: {song.title}")
+            return None
+
+        song.file_path = audio_info[0]
+        self.prefetched += 1
+        return song.file_path
+
+    def cancel(self, chat_id: int):
+        """
+        Cancel pending prefetches of a chat
+
+        Args:
+            chat_id (int): Chat whose queue was cleared
+        """
+        for key, task in list(self._tasks.items()):
+            if key[0] == chat_id:
+                task.cancel()
+                self._tasks.pop(key, None)
+
+    def cancel_song(self, chat_id: int, song):
+        """
+        Cancel the prefetch of a song taken out of a chat's queue
+
+        Its download is withdrawn too, unless the chat still plays or
+        queues the same video.
+
+        Args:
+            chat_id (int): Chat the song was queued in
+            song (Track): Song that was removed
+        """
+        task = self._tasks.pop((chat_id, id(song)), None)
+        if task is None:
+            return
+        task.cancel()
+
+        state = self.chats.get(chat_id)
+        if state is None or all(other.source_query != song.source_query for other in state.tracks()):
+            cancel_download(song.source_query, chat_id)
+
+    def stats(self):
+        """
+        Get prefetch counters
+
+        Returns:
+            dict: Running, completed and failed prefetch counts
+        """
+        return {
+            'running': len(self._tasks),
+            'prefetched': self.prefetched,
+            'failed': self.failed,
+        }
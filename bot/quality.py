@@ -0,0 +1,184 @@
+"""
+Load-adaptive audio quality: picks the stream quality per chat from process CPU load and active calls.
+"""
+import logging
+import asyncio
+import os
+import time
+from pytgcalls.types import AudioQuality
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Quality levels from best to cheapest
+QUALITY_LEVELS = {
+    'studio': AudioQuality.STUDIO,
+    'high': AudioQuality.HIGH,
+    'medium': AudioQuality.MEDIUM,
+    'low': AudioQuality.LOW,
+}
+
+class QualityPolicy:
+    """
+    Chooses the audio quality of new streams. The default level is used
+    while the process is lightly loaded; above the CPU or active call
+    thresholds new streams step down to medium and then low quality.
+    Chats can pin a level with an override.
+    """
+    # Seconds between CPU samples
+    SAMPLE_INTERVAL = 5.0
+
+    def __init__(self, default: str, cpu_medium: float, cpu_low: float, calls_medium: int, calls_low: int):
+        """
+        Initialize the policy
+
+        Args:
+            default (str): Level used without load (a QUALITY_LEVELS key)
+            cpu_medium (float): Process CPU percent from which medium quality is used
+            cpu_low (float): Process CPU percent from which low quality is used
+            calls_medium (int): Active calls from which medium quality is used (0 to ignore)
+            calls_low (int): Active calls from which low quality is used (0 to ignore)
+        """
+        self.default = default if default in QUALITY_LEVELS else 'high'
+        self.cpu_medium = cpu_medium
+        self.cpu_low = cpu_low
+        self.calls_medium = calls_medium
+        self.calls_low = calls_low
+
+        # chat_id -> pinned level
+        self._overrides = {}
+
+        self._last_sample = (time.monotonic(), self._cpu_seconds())
+        self._cpu_percent = 0.0
+        self._sampler = None
+
+        # Streams started per level
+        self.chosen = {level: 0 for level in QUALITY_LEVELS}
+
+    @staticmethod
+    def _cpu_seconds():
+        times = os.times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    def _sample(self):
+        """Measure the CPU load since the previous sample"""
+        now = time.monotonic()
+        cpu = self._cpu_seconds()
+        last_time, last_cpu = self._last_sample
+        if now > last_time:
+            self._cpu_percent = 100 * (cpu - last_cpu) / (now - last_time)
+        self._last_sample = (now, cpu)
+
+    def start(self):
+        """
+        Start sampling the CPU load in the background
+
+        Call from the bot's event loop; until then the load reads as 0.
+        """
+        if self._sampler is None or self._sampler.done():
+            self._last_sample = (time.monotonic(), self._cpu_seconds())
+            self._sampler = asyncio.ensure_future(self._sample_loop())
+
+    async def _sample_loop(self):
+        while True:
+            await asyncio.sleep(self.SAMPLE_INTERVAL)
+            self._sample()
+
+    def cpu_percent(self):
+        """
+        Get the CPU load of this process (and its finished children) over the last sample interval
+
+        Measured against one core, since the event loop that feeds every
+        call runs on one; threads can push it above 100. Only reads the last
+        sample, so it is safe to call from any thread.
+
+        Returns:
+            float: Percent of one CPU core
+        """
+        return self._cpu_percent
+
+    def load_level(self, active_calls: int):
+        """
+        Get the level the current load allows
+
+        Args:
+            active_calls (int): Voice chats the process is streaming to
+
+        Returns:
+            str: Quality level name
+        """
+        cpu = self.cpu_percent()
+        if cpu >= self.cpu_low or (self.calls_low and active_calls >= self.calls_low):
+            return 'low'
+        if cpu >= self.cpu_medium or (self.calls_medium and active_calls >= self.calls_medium):
+            return 'medium' if self.default in ('studio', 'high') else self.default
+        return self.default
+
+    def choose(self, chat_id: int, active_calls: int):
+        """
+        Pick the quality of a stream that is about to start
+
+        Args:
+            chat_id (int): Chat the stream is for
+            active_calls (int): Voice chats the process is streaming to
+
+        Returns:
+            tuple: (level name, AudioQuality)
+        """
+        level = self._overrides.get(chat_id) or self.load_level(active_calls)
+        self.chosen[level] += 1
+        return level, QUALITY_LEVELS[level]
+
+    def get_override(self, chat_id: int):
+        """
+        Get the level pinned for a chat
+
+        Args:
+            chat_id (int): Chat ID
+
+        Returns:
+            str: Level name or None when the chat follows the load
+        """
+        return self._overrides.get(chat_id)
+
+    def set_override(self, chat_id: int, level):
+        """
+        Pin a chat to a level, or let it follow the load again
+
+        Args:
+            chat_id (int): Chat ID
+            level (str): QUALITY_LEVELS key, or None/'auto' to remove the override
+        """
+        if level in (None, 'auto'):
+            self._overrides.pop(chat_id, None)
+        else:
+            self._overrides[chat_id] = level
+
+    def stats(self):
+        """
+        Get the policy's inputs and decisions
+
+        Returns:
+            dict: CPU load, overrides and streams started per level
+        """
+        return {
+            'cpu_percent': round(self.cpu_percent(), 1),
+            'default': self.default,
+            'overrides': len(self._overrides),
+            'chosen': dict(self.chosen),
+        }
+
+def create_quality_policy():
+    """
+    Create the quality policy from the configuration
+
+    Returns:
+        QualityPolicy: New policy
+    """
+    return QualityPolicy(
+        Config.AUDIO_QUALITY,
+        Config.QUALITY_CPU_MEDIUM,
+        Config.QUALITY_CPU_LOW,
+        Config.QUALITY_CALLS_MEDIUM,
+        Config.QUALITY_CALLS_LOW
+    )
@@ -0,0 +1,244 @@
+"""
+Central download scheduler with priority classes, per-chat fairness and a global concurrency limit.
+"""
+import logging
+import asyncio
+import contextvars
+import itertools
+import threading
+import time
+from enum import IntEnum
+from bot.config import Config
+from bot.tracing import tracer
+from bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class Priority(IntEnum):
+    """Download priority classes, most urgent first"""
+    NOW_PLAYING = 0
+    NEXT = 1
+    PREFETCH = 2
+    WARM = 3
+
+class DownloadCancelled(Exception):
+    """Raised to waiters of a download that was cancelled"""
+
+class DownloadJob:
+    """A scheduled download shared by every chat that requested it"""
+    def __init__(self, key, func, priority, seq):
+        self.key = key
+        self.func = func
+        self.priority = priority
+        self.seq = seq
+        self.chats = set()
+        self.cancel_event = threading.Event()
+        self.future = asyncio.get_running_loop().create_future()
+        self.running = False
+
+        # Context of the first request, so the download's trace spans join its trace
+        self.context = contextvars.copy_context()
+        self.submitted = time.perf_counter()
+
+class DownloadScheduler:
+    """
+    Runs download coroutines with at most max_concurrent at a time.
+    Pending jobs start in priority order; within a priority the chat with
+    the fewest running downloads goes first, then the oldest job.
+    Identical requests (same key) join the existing job.
+    """
+    def __init__(self, max_concurrent: int):
+        """
+        Initialize the scheduler
+
+        Args:
+            max_concurrent (int): Maximum downloads running at once
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self._jobs = {}
+        self._pending = []
+        self._running = 0
+        self._seq = itertools.count()
+
+        # Counters
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.coalesced = 0
+
+    async def submit(self, key, func, priority=Priority.NOW_PLAYING, chat_id=None):
+        """
+        Schedule a download and await its result
+
+        Args:
+            key: Deduplication key (e.g. video id and format)
+            func (callable): Coroutine function called with a threading.Event
+                that is set when the download should abort
+            priority (Priority): Priority class of this request
+            chat_id (int, optional): Chat the download is for; None for
+                requests that must not be cancelled by a chat
+
+        Returns:
+            Any: Result of the download
+
+        Raises:
+            DownloadCancelled: If every requesting chat cancelled the download
+        """
+        return await self.enqueue(key, func, priority, chat_id)
+
+    def enqueue(self, key, func, priority=Priority.NOW_PLAYING, chat_id=None):
+        """
+        Schedule a download without waiting for it
+
+        Same as submit, except that the chat is registered with the job
+        before this returns.
+
+        Returns:
+            asyncio.Future: Result of the download (see submit)
+        """
+        job = self._jobs.get(key)
+        if job is not None and not job.cancel_event.is_set():
+            self.coalesced += 1
+            if priority < job.priority:
+                job.priority = priority
+        else:
+            job = DownloadJob(key, func, priority, next(self._seq))
+            self._jobs[key] = job
+            self._pending.append(job)
+
+        job.chats.add(chat_id)
+        self._dispatch()
+        return asyncio.shield(job.future)
+
+    def active(self, key):
+        """
+        Check whether a download is queued or running and not cancelled
+
+        Args:
+            key: Key the download was submitted with
+
+        Returns:
+            bool: True if submitting the key now joins the existing job
+        """
+        job = self._jobs.get(key)
+        return job is not None and not job.cancel_event.is_set()
+
+    def _running_per_chat(self):
+        counts = {}
+        for job in self._jobs.values():
+            if job.running:
+                for chat_id in job.chats:
+                    counts[chat_id] = counts.get(chat_id, 0) + 1
+        return counts
+
+    def _dispatch(self):
+        """Start pending jobs while there are free slots"""
+        while self._pending and self._running < self.max_concurrent:
+            running_per_chat = self._running_per_chat()
+
+            def _order(job):
+                fairness = min(running_per_chat.get(chat_id, 0) for chat_id in job.chats)
+                return job.priority, fairness, job.seq
+
+            job = min(self._pending, key=_order)
+            self._pending.remove(job)
+            job.running = True
+            self._running += 1
+            self.started += 1
+            job.context.run(asyncio.ensure_future, self._run(job))
+
+    async def _run(self, job):
+        tracer.record('download_wait', job.submitted, time.perf_counter())
+        try:
+            result = await job.func(job.cancel_event)
+            if job.cancel_event.is_set():
+                raise DownloadCancelled(f"Download cancelled: {job.key}")
+            job.future.set_result(result)
+            self.completed += 1
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            job.future.set_exception(DownloadCancelled(f"Download cancelled: {job.key}"))
+            raise
+        except Exception as e:
+            if job.cancel_event.is_set():
+                self.cancelled += 1
+                job.future.set_exception(DownloadCancelled(f"Download cancelled: {job.key}"))
+            else:
+                self.failed += 1
+                job.future.set_exception(e)
+        finally:
+            # Nobody may be waiting anymore; avoid "exception never retrieved" warnings
+            if job.future.done() and not job.future.cancelled():
+                job.future.exception()
+            self._running -= 1
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+            self._dispatch()
+
+    def _drop_chat(self, job, chat_id):
+        """Remove a chat's interest in a job and cancel it when nobody is left"""
+        job.chats.discard(chat_id)
+        if job.chats:
+            return
+
+        job.cancel_event.set()
+        if not job.running:
+            self._pending.remove(job)
+            del self._jobs[job.key]
+            self.cancelled += 1
+            job.future.set_exception(DownloadCancelled(f"Download cancelled: {job.key}"))
+            job.future.exception()
+        logger.info(f"Cancelled download: {job.key}")
+
+    def cancel(self, key, chat_id):
+        """
+        Withdraw a chat's request for one download
+
+        Args:
+            key: Key the download was submitted with
+            chat_id (int): Chat that no longer needs it
+        """
+        job = self._jobs.get(key)
+        if job is not None and chat_id in job.chats:
+            self._drop_chat(job, chat_id)
+
+    def cancel_chat(self, chat_id):
+        """
+        Withdraw every download request of a chat (e.g. on /stop)
+
+        Args:
+            chat_id (int): Chat whose downloads should be cancelled
+        """
+        for job in list(self._jobs.values()):
+            if chat_id in job.chats:
+                self._drop_chat(job, chat_id)
+
+    def stats(self):
+        """
+        Get scheduler state and counters
+
+        Returns:
+            dict: Queue sizes per priority and job counters
+        """
+        pending = {priority.name.lower(): 0 for priority in Priority}
+        for job in self._pending:
+            pending[Priority(job.priority).name.lower()] += 1
+
+        return {
+            'max_concurrent': self.max_concurrent,
+            'running': self._running,
+            'pending': pending,
+            'started': self.started,
+            'completed': self.completed,
+            'failed': self.failed,
+            'cancelled': self.cancelled,
+            'coalesced': self.coalesced,
+        }
+
+# Shared scheduler for all audio downloads
+download_scheduler = DownloadScheduler(Config.DOWNLOAD_CONCURRENCY)
+
+metrics.register_stats('download_scheduler', download_scheduler.stats, counters=(
+    'started', 'completed', 'failed', 'cancelled', 'coalesced'
+))
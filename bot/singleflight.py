@@ -0,0 +1,75 @@
+"""
+Request coalescing: concurrent calls for the same key share one in-flight result.
+"""
+import logging
+import asyncio
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    Runs at most one coroutine per key at a time; callers arriving while it
+    is running await the same result instead of starting their own
+    """
+    def __init__(self, name: str):
+        """
+        Initialize the coalescing group
+
+        Args:
+            name (str): Name used in logs and stats
+        """
+        self.name = name
+
+        # (event loop, key) -> running task
+        self._inflight = {}
+
+        # Counters
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key, func, *args):
+        """
+        Run func(*args) for a key, or join the run already in flight
+
+        Cancelling one caller does not cancel the shared run.
+
+        Args:
+            key: Deduplication key
+            func (callable): Coroutine function to run
+            *args: Arguments for the coroutine function
+
+        Returns:
+            Any: Result of the shared run
+        """
+        # Tasks are bound to a loop; the Flask app runs its own short-lived loops
+        flight_key = (asyncio.get_running_loop(), key)
+
+        task = self._inflight.get(flight_key)
+        if task is not None:
+            self.coalesced += 1
+            logger.info(f"Coalesced {self.name} request for: {key}")
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(func(*args))
+        self._inflight[flight_key] = task
+        self.started += 1
+
+        def _forget(done_task):
+            if self._inflight.get(flight_key) is done_task:
+                del self._inflight[flight_key]
+
+        task.add_done_callback(_forget)
+        return await asyncio.shield(task)
+
+    def stats(self):
+        """
+        Get coalescing counters
+
+        Returns:
+            dict: In-flight, started and coalesced counts
+        """
+        return {
+            'inflight': len(self._inflight),
+            'started': self.started,
+            'coalesced': self.coalesced,
+        }
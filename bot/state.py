@@ -0,0 +1,400 @@
+"""
+Compact per-chat player state: track records and queues.
+"""
+import time
+import random
+from collections import deque
+from itertools import islice
+
+class Track:
+    """A song that is playing or queued"""
+    __slots__ = ('title', 'duration', 'duration_seconds', 'video_url', 'thumbnail', 'query', 'file_path')
+
+    def __init__(self, title, duration, duration_seconds, video_url, thumbnail, query, file_path=None):
+        self.title = title
+        self.duration = duration
+        self.duration_seconds = duration_seconds
+        self.video_url = video_url
+        self.thumbnail = thumbnail
+        self.query = query
+        self.file_path = file_path
+
+    def to_dict(self):
+        """Get the track's fields as a dict for persistence"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a track from to_dict output
+
+        Args:
+            data (dict): Persisted track fields
+
+        Returns:
+            Track: New track
+        """
+        return cls(**{name: data.get(name) for name in cls.__slots__})
+
+    @classmethod
+    def from_video(cls, video, query=None):
+        """
+        Build a track from video details
+
+        Args:
+            video (dict): Video details from resolve_video, search or a playlist
+            query (str, optional): Query the user asked for; defaults to the video URL
+
+        Returns:
+            Track: New track
+        """
+        return cls(
+            video['title'],
+            video['duration'],
+            video.get('duration_seconds', 0),
+            video['video_url'],
+            video['thumbnail'],
+            query or video['video_url']
+        )
+
+    @classmethod
+    def placeholder(cls, query):
+        """
+        Build a track for a query that is not resolved yet
+
+        Args:
+            query (str): Query the user asked for
+
+        Returns:
+            Track: Track titled after the query until fill() is called
+        """
+        return cls(query, '…', 0, None, None, query)
+
+    def fill(self, video):
+        """
+        Fill in the details of a placeholder track
+
+        Args:
+            video (dict): Video details from resolve_video
+        """
+        self.title = video['title']
+        self.duration = video['duration']
+        self.duration_seconds = video.get('duration_seconds', 0)
+        self.video_url = video['video_url']
+        self.thumbnail = video['thumbnail']
+
+    @property
+    def resolved(self):
+        """Whether the track's video is known"""
+        return self.video_url is not None
+
+    @property
+    def source_query(self):
+        """Query used to fetch the audio: the video URL when known"""
+        return self.video_url or self.query
+
+class TrackQueue:
+    """
+    Upcoming tracks of a chat. Appending and taking the next track are O(1),
+    and the total duration is kept up to date as tracks come and go.
+    Operations on a track in the middle (by position or by track) walk the
+    deque up to it. Positions are 0-based.
+    """
+    __slots__ = ('_tracks', 'total_seconds')
+
+    def __init__(self, tracks=()):
+        self._tracks = deque()
+        self.total_seconds = 0
+        self.extend(tracks)
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __bool__(self):
+        return bool(self._tracks)
+
+    def __iter__(self):
+        return iter(self._tracks)
+
+    def __contains__(self, track):
+        return track in self._tracks
+
+    def append(self, track):
+        """
+        Add a track to the end of the queue
+
+        Args:
+            track (Track): Track to add
+        """
+        self._tracks.append(track)
+        self.total_seconds += track.duration_seconds or 0
+
+    def extend(self, tracks):
+        """Add tracks to the end of the queue"""
+        for track in tracks:
+            self.append(track)
+
+    def popleft(self):
+        """
+        Take the first track
+
+        Returns:
+            Track: First track
+
+        Raises:
+            IndexError: If the queue is empty
+        """
+        track = self._tracks.popleft()
+        self.total_seconds -= track.duration_seconds or 0
+        return track
+
+    def clear(self):
+        """Remove every track"""
+        self._tracks.clear()
+        self.total_seconds = 0
+
+    def index(self, track):
+        """
+        Get the position of a queued track
+
+        Raises:
+            ValueError: If the track is not queued
+        """
+        return self._tracks.index(track)
+
+    def remove(self, track):
+        """
+        Remove a queued track
+
+        Raises:
+            ValueError: If the track is not queued
+        """
+        self._tracks.remove(track)
+        self.total_seconds -= track.duration_seconds or 0
+
+    def remove_at(self, position):
+        """
+        Remove the track at a position
+
+        Args:
+            position (int): Position of the track
+
+        Returns:
+            Track: Removed track
+
+        Raises:
+            IndexError: If there is no track at the position
+        """
+        if not 0 <= position < len(self._tracks):
+            raise IndexError("Queue position out of range")
+        track = self._tracks[position]
+        del self._tracks[position]
+        self.total_seconds -= track.duration_seconds or 0
+        return track
+
+    def move(self, position, new_position):
+        """
+        Move a track to another position
+
+        Args:
+            position (int): Current position of the track
+            new_position (int): Position the track ends up at (clamped to the queue)
+
+        Returns:
+            Track: Moved track
+
+        Raises:
+            IndexError: If there is no track at position
+        """
+        if not 0 <= position < len(self._tracks):
+            raise IndexError("Queue position out of range")
+        track = self._tracks[position]
+        del self._tracks[position]
+        self._tracks.insert(max(0, min(new_position, len(self._tracks))), track)
+        return track
+
+    def shuffle(self):
+        """Put the tracks in random order"""
+        # Shuffling a list is O(n); shuffling the deque in place indexes into its middle
+        tracks = list(self._tracks)
+        random.shuffle(tracks)
+        self._tracks = deque(tracks)
+
+    def refresh(self, track, old_seconds):
+        """
+        Account for a change of a queued track's duration (e.g. a resolved placeholder)
+
+        Args:
+            track (Track): Track in this queue
+            old_seconds (int): Duration the track had when it was counted
+        """
+        self.total_seconds += (track.duration_seconds or 0) - (old_seconds or 0)
+
+    def page(self, start, size):
+        """
+        Get a slice of the queue without copying the rest
+
+        Args:
+            start (int): Position of the first track
+            size (int): Maximum number of tracks
+
+        Returns:
+            list: (position, track) pairs
+        """
+        return list(enumerate(islice(self._tracks, start, start + size), start))
+
+class ChatState:
+    """Playback state of one chat"""
+    __slots__ = (
+        'chat_id', 'queue', 'now_playing', 'paused_at', 'in_call', 'idle_timer',
+        'created_at', 'started_at', 'updated_at'
+    )
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.queue = TrackQueue()
+        self.now_playing = None
+        self.paused_at = None
+
+        # Whether the bot is in the chat's voice chat, and the pending leave while idle there
+        self.in_call = False
+        self.idle_timer = None
+
+        self.created_at = time.time()
+        self.started_at = None
+        self.updated_at = self.created_at
+
+    @property
+    def paused(self):
+        """Whether playback is paused"""
+        return self.paused_at is not None
+
+    @property
+    def is_playing(self):
+        """Whether a track is playing (or paused) in the chat"""
+        return self.now_playing is not None
+
+    def touch(self):
+        """Record a state change"""
+        self.updated_at = time.time()
+
+    def cancel_idle_timer(self):
+        """Cancel a pending leave of the voice chat"""
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+
+    def set_now_playing(self, track):
+        """
+        Mark a track as playing, or nothing when track is None
+
+        Args:
+            track (Track): Track that started playing
+        """
+        if track is not None:
+            self.cancel_idle_timer()
+        self.now_playing = track
+        self.paused_at = None
+        self.started_at = time.time() if track is not None else None
+        self.touch()
+
+    def pause(self):
+        """Record that playback was paused"""
+        if self.paused_at is None:
+            self.paused_at = time.time()
+            self.touch()
+
+    def resume(self):
+        """Record that playback was resumed; paused time does not count as played"""
+        if self.paused_at is not None:
+            if self.started_at is not None:
+                self.started_at += time.time() - self.paused_at
+            self.paused_at = None
+            self.touch()
+
+    def position(self, now=None):
+        """
+        Get how far into the current track playback is
+
+        Args:
+            now (float, optional): Time to compute the position at (default: now)
+
+        Returns:
+            float: Seconds played, 0 when nothing is playing
+        """
+        if self.started_at is None:
+            return 0.0
+        end = self.paused_at or now or time.time()
+        return max(0.0, end - self.started_at)
+
+    def enqueue(self, track):
+        """
+        Add a track to the end of the queue
+
+        Args:
+            track (Track): Track to add
+
+        Returns:
+            int: Position of the track in the queue (1-based)
+        """
+        self.queue.append(track)
+        self.touch()
+        return len(self.queue)
+
+    def next_track(self):
+        """
+        Take the next track from the queue
+
+        Returns:
+            Track: Next track or None if the queue is empty
+        """
+        if not self.queue:
+            return None
+        self.touch()
+        return self.queue.popleft()
+
+    def tracks(self):
+        """Get the playing track and all queued tracks"""
+        if self.now_playing is not None:
+            yield self.now_playing
+        yield from self.queue
+
+    def snapshot(self, include_queue=True):
+        """
+        Get the chat's playback state as plain data for persistence
+
+        Args:
+            include_queue (bool): Whether to include the queued tracks
+
+        Returns:
+            dict: Now-playing track, queue and playback timing
+        """
+        snapshot = {
+            'chat_id': self.chat_id,
+            'now_playing': self.now_playing.to_dict() if self.now_playing is not None else None,
+            'started_at': self.started_at,
+            'paused_at': self.paused_at,
+            'created_at': self.created_at,
+        }
+        if include_queue:
+            snapshot['queue'] = [track.to_dict() for track in self.queue]
+        return snapshot
+
+    @classmethod
+    def from_snapshot(cls, data):
+        """
+        Rebuild the queue of a chat from a snapshot
+
+        The now-playing track and timing are left to the caller, which has
+        to start playback again first.
+
+        Args:
+            data (dict): Output of snapshot()
+
+        Returns:
+            ChatState: State holding the snapshot's queue
+        """
+        state = cls(data['chat_id'])
+        state.queue.extend(Track.from_dict(track) for track in data.get('queue') or [])
+        state.created_at = data.get('created_at') or state.created_at
+        return state
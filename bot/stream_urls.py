@@ -0,0 +1,220 @@
+"""
+Cache of direct audio stream URLs for playback without downloading.
+"""
+import logging
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from bot.config import Config
+from bot.metrics import metrics
+from bot.extractor_pool import extractor_pool
+from bot.extractors import extractor_backend
+from bot.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Configure youtube-dl options for resolving a direct audio stream URL
+ytdl_stream_opts = {
+    'format': 'bestaudio[acodec=opus]/bestaudio/best',
+    'noplaylist': True,
+    'nocheckcertificate': True,
+    'ignoreerrors': False,
+    'quiet': True,
+    'no_warnings': True,
+    'source_address': '0.0.0.0',
+}
+
+# googlevideo URLs carry their expiry as "expire=<epoch>" (or "/expire/<epoch>/")
+EXPIRE_RE = re.compile(r'[?&/]expire[=/](\d+)')
+
+# Lifetime assumed for URLs without an expire parameter
+DEFAULT_URL_TTL = 3600
+
+class StreamUrl:
+    """A resolved direct audio URL and the headers needed to fetch it"""
+    __slots__ = ('video_id', 'url', 'headers', 'expires_at')
+
+    def __init__(self, video_id, url, headers, expires_at):
+        self.video_id = video_id
+        self.url = url
+        self.headers = headers
+        self.expires_at = expires_at
+
+    def seconds_left(self):
+        """Seconds until the URL expires"""
+        return self.expires_at - time.time()
+
+def parse_expiry(url):
+    """
+    Get the expiry time of a stream URL
+
+    Args:
+        url (str): Direct stream URL
+
+    Returns:
+        float: Unix timestamp when the URL stops working
+    """
+    match = EXPIRE_RE.search(url)
+    if match:
+        return float(match.group(1))
+    return time.time() + DEFAULT_URL_TTL
+
+def _extract_stream(video_url):
+    """
+    Blocking yt-dlp extraction of the audio stream URL, run on the extractor pool
+
+    Args:
+        video_url (str): YouTube video URL
+
+    Returns:
+        dict: Info dict of the selected audio format
+    """
+    with extractor_backend.create(ytdl_stream_opts) as ydl:
+        logger.info(f"Resolving stream URL for: {video_url}")
+        info = ydl.extract_info(video_url, download=False)
+        if 'entries' in info:
+            info = info['entries'][0]
+        return info
+
+class StreamUrlCache:
+    """
+    Resolves and caches direct audio URLs per video id, refreshing the URLs
+    of playing and queued songs before they expire
+    """
+    def __init__(self, maxsize: int, refresh_margin: float):
+        """
+        Initialize the cache
+
+        Args:
+            maxsize (int): Maximum number of cached URLs
+            refresh_margin (float): Refresh URLs with less than this many seconds left
+        """
+        self.maxsize = max(1, maxsize)
+        self.refresh_margin = refresh_margin
+        self._urls = OrderedDict()
+        self._flight = SingleFlight("stream-url")
+        self._refresher = None
+
+        # Callables returning video ids whose URLs should be kept fresh
+        self._in_use_providers = []
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.refreshed = 0
+        self.failures = 0
+
+    def register_in_use(self, provider):
+        """
+        Register a callable returning video ids of playing and queued songs
+
+        Args:
+            provider (callable): Returns an iterable of video ids
+        """
+        self._in_use_providers.append(provider)
+
+    def _store(self, video_id, info):
+        stream_url = StreamUrl(video_id, info['url'], info.get('http_headers') or {}, parse_expiry(info['url']))
+        self._urls[video_id] = stream_url
+        self._urls.move_to_end(video_id)
+        while len(self._urls) > self.maxsize:
+            self._urls.popitem(last=False)
+        return stream_url
+
+    async def _resolve(self, video_id, video_url):
+        info = await extractor_pool.run(_extract_stream, video_url)
+        if not info or not info.get('url'):
+            raise ValueError(f"No direct audio URL for {video_id}")
+        return self._store(video_id, info)
+
+    async def get(self, video):
+        """
+        Get a direct audio URL for a video that stays valid for at least the refresh margin
+
+        Args:
+            video (dict): Video details from resolve_video
+
+        Returns:
+            StreamUrl: Resolved URL or None if error
+        """
+        self._ensure_refresher()
+        video_id = video['id']
+
+        stream_url = self._urls.get(video_id)
+        if stream_url is not None and stream_url.seconds_left() > self.refresh_margin:
+            self._urls.move_to_end(video_id)
+            self.hits += 1
+            return stream_url
+
+        self.misses += 1
+        try:
+            # A fresh extraction already selected a format with a URL
+            info = video.get('info')
+            if info and info.get('url') and not info.get('requested_formats'):
+                return self._store(video_id, info)
+
+            return await self._flight.run(video_id, self._resolve, video_id, video['video_url'])
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Error resolving stream URL: {e}")
+            return None
+
+    def invalidate(self, video_id):
+        """
+        Drop a URL that failed so the next request resolves a new one
+
+        Args:
+            video_id (str): YouTube video id
+        """
+        self._urls.pop(video_id, None)
+
+    def _ensure_refresher(self):
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.ensure_future(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        """Re-resolve URLs of songs in use shortly before they expire"""
+        while True:
+            await asyncio.sleep(60)
+
+            wanted = set()
+            for provider in self._in_use_providers:
+                try:
+                    wanted.update(provider())
+                except Exception as e:
+                    logger.error(f"Error collecting videos in use: {e}")
+
+            for video_id, stream_url in list(self._urls.items()):
+                if video_id not in wanted or stream_url.seconds_left() > self.refresh_margin:
+                    continue
+                try:
+                    await self._flight.run(
+                        video_id, self._resolve, video_id,
+                        f"https://www.youtube.com/watch?v={video_id}"
+                    )
+                    self.refreshed += 1
+                    logger.info(f"Refreshed stream URL for: {video_id}")
+                except Exception as e:
+                    self.failures += 1
+                    logger.error(f"Error refreshing stream URL for {video_id}: {e}")
+
+    def stats(self):
+        """
+        Get cache counters
+
+        Returns:
+            dict: Size, hit/miss, refresh and failure counts
+        """
+        return {
+            'size': len(self._urls),
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshed': self.refreshed,
+            'failures': self.failures,
+        }
+
+# Shared cache used by the music player in direct playback mode
+stream_url_cache = StreamUrlCache(Config.INFO_CACHE_SIZE, Config.STREAM_URL_REFRESH_MARGIN)
+
+metrics.register_stats('stream_urls', stream_url_cache.stats, counters=('hits', 'misses', 'refreshed', 'failures'))
@@ -0,0 +1,245 @@
+"""
+Lightweight span tracing of the /play pipeline: one trace per request, slow traces kept for the web page.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from bot.config import Config
+from bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Trace and span depth of the running request; copied into tasks and to_thread calls
+_current_trace = ContextVar('current_trace', default=None)
+_current_depth = ContextVar('current_depth', default=0)
+
+STAGE_LATENCY = metrics.histogram('trace_stage_seconds', 'Duration of traced /play stages', ('stage',))
+
+class Span:
+    """A timed stage of a trace"""
+    __slots__ = ('name', 'start', 'end', 'depth', 'error')
+
+    def __init__(self, name, start, end=None, depth=0):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.depth = depth
+        self.error = None
+
+    @property
+    def duration(self):
+        """Seconds the span took, None while it is open"""
+        return None if self.end is None else self.end - self.start
+
+class Trace:
+    """The spans of one request"""
+    __slots__ = ('trace_id', 'name', 'attrs', 'started_at', 'start', 'end', 'spans', 'error')
+
+    def __init__(self, name, attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.spans = []
+        self.error = None
+
+    @property
+    def duration(self):
+        """Seconds the request took, None while it runs"""
+        return None if self.end is None else self.end - self.start
+
+    def to_dict(self):
+        """
+        Get the trace as plain data for the web page
+
+        Returns:
+            dict: Trace fields and spans with millisecond offsets from the trace start
+        """
+        spans = sorted(self.spans, key=lambda span: span.start)
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'attrs': dict(self.attrs),
+            'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at)),
+            'duration_ms': round((self.duration or 0) * 1000, 1),
+            'error': self.error,
+            'spans': [
+                {
+                    'name': span.name,
+                    'depth': span.depth,
+                    'offset_ms': round((span.start - self.start) * 1000, 1),
+                    'duration_ms': round(span.duration * 1000, 1) if span.end is not None else None,
+                    'error': span.error,
+                }
+                for span in spans
+            ],
+        }
+
+class Tracer:
+    """
+    Records traces of requests and the spans opened while they run. Spans
+    find their trace through a context variable, so stages running in other
+    tasks or threads of the same request join it without passing ids around.
+    Finished traces feed the per-stage latency histogram; slow ones are kept
+    in a ring buffer.
+    """
+    def __init__(self, slow_seconds: float, keep: int):
+        """
+        Initialize the tracer
+
+        Args:
+            slow_seconds (float): Traces taking at least this long are kept
+            keep (int): Number of slow traces kept
+        """
+        self.slow_seconds = slow_seconds
+        self._slow = deque(maxlen=max(1, keep))
+        self._lock = threading.Lock()
+
+        # Set once the bot runs in this process; a web-only process never records traces
+        self.active = False
+
+        # Counters
+        self.traces = 0
+        self.slow_traces = 0
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        """
+        Trace a request for the duration of a with block
+
+        Args:
+            name (str): Request name, also recorded as a stage
+            **attrs: Details shown with the trace on the public traces page
+
+        Yields:
+            Trace: The new trace
+        """
+        trace = Trace(name, attrs)
+        trace_token = _current_trace.set(trace)
+        depth_token = _current_depth.set(1)
+        try:
+            yield trace
+        except Exception as e:
+            trace.error = str(e)
+            raise
+        finally:
+            _current_depth.reset(depth_token)
+            _current_trace.reset(trace_token)
+            self._finish(trace)
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Time a stage of the current trace; does nothing outside a trace
+
+        Args:
+            name (str): Stage name
+        """
+        trace = _current_trace.get()
+        if trace is None or trace.end is not None:
+            yield
+            return
+
+        depth = _current_depth.get()
+        span = Span(name, time.perf_counter(), depth=depth)
+        trace.spans.append(span)
+        token = _current_depth.set(depth + 1)
+        try:
+            yield
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            _current_depth.reset(token)
+            span.end = time.perf_counter()
+
+    def record(self, name: str, start: float, end: float):
+        """
+        Add a stage that was timed separately to the current trace
+
+        Args:
+            name (str): Stage name
+            start (float): time.perf_counter() at the start of the stage
+            end (float): time.perf_counter() at the end of the stage
+        """
+        trace = _current_trace.get()
+        if trace is not None and trace.end is None:
+            trace.spans.append(Span(name, start, end, _current_depth.get()))
+
+    @staticmethod
+    def current_trace_id():
+        """Get the id of the running trace, or None"""
+        trace = _current_trace.get()
+        return trace.trace_id if trace is not None else None
+
+    def _finish(self, trace):
+        """Close a trace, record its stage durations and keep it if slow"""
+        trace.end = time.perf_counter()
+        STAGE_LATENCY.observe(trace.duration, stage=trace.name)
+        for span in trace.spans:
+            if span.end is not None:
+                STAGE_LATENCY.observe(span.duration, stage=span.name)
+
+        with self._lock:
+            self.traces += 1
+            if trace.duration < self.slow_seconds:
+                return
+            self.slow_traces += 1
+            self._slow.append(trace)
+
+        stages = ", ".join(
+            f"{span.name} {span.duration * 1000:.0f}ms" for span in trace.spans if span.end is not None
+        )
+        logger.warning(f"Slow {trace.name} trace {trace.trace_id}: {trace.duration * 1000:.0f}ms ({stages})")
+
+    def slow_traces_list(self):
+        """
+        Get the kept slow traces, newest first
+
+        Returns:
+            list: Trace dicts (see Trace.to_dict)
+        """
+        with self._lock:
+            traces = list(self._slow)
+        return [trace.to_dict() for trace in reversed(traces)]
+
+    def stage_percentiles(self):
+        """
+        Get the latency percentiles of every traced stage
+
+        Returns:
+            dict: stage -> dict with count, avg, p50, p95 and p99 in milliseconds
+        """
+        stages = {}
+        for (stage,) in STAGE_LATENCY.label_values():
+            summary = STAGE_LATENCY.summary(stage=stage)
+            stages[stage] = {
+                key: (value if key == 'count' else round(value * 1000, 1))
+                for key, value in summary.items()
+            }
+        return stages
+
+    def stats(self):
+        """
+        Get trace counters
+
+        Returns:
+            dict: Finished, slow and kept trace counts
+        """
+        with self._lock:
+            return {
+                'traces': self.traces,
+                'slow': self.slow_traces,
+                'kept': len(self._slow),
+            }
+
+# Shared tracer of the /play pipeline
+tracer = Tracer(Config.TRACE_SLOW_SECONDS, Config.TRACE_BUFFER_SIZE)
+
+metrics.register_stats('tracing', tracer.stats, counters=('traces', 'slow'))
@@ -5,7 +5,18 @@ import logging
 import os
 import yt_dlp as youtube_dl
 import asyncio
-import tempfile
+import re
+import time
+from urllib.parse import urlparse, parse_qs
+from bot.config import Config
+from bot.cache import TTLCache
+from bot.audio_cache import audio_cache
+from bot.extractor_pool import extractor_pool
+from bot.extractors import extractor_backend
+from bot.singleflight import SingleFlight
+from bot.scheduler import download_scheduler, Priority
+from bot.metrics import metrics
+from bot.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +32,29 @@ ytdl_opts = {
     'source_address': '0.0.0.0',
 }
 
-# Configure youtube-dl options for downloading
+# Configure youtube-dl options for flat playlist extraction (ids and titles only)
+ytdl_playlist_opts = {
+    'extract_flat': 'in_playlist',
+    'noplaylist': False,
+    'playlistend': Config.PLAYLIST_MAX_TRACKS,
+    'nocheckcertificate': True,
+    'ignoreerrors': True,
+    'quiet': True,
+    'no_warnings': True,
+    'source_address': '0.0.0.0',
+}
+
+# Configure youtube-dl options for flat multi-result search
+ytdl_search_opts = {
+    'extract_flat': 'in_playlist',
+    'nocheckcertificate': True,
+    'ignoreerrors': True,
+    'quiet': True,
+    'no_warnings': True,
+    'source_address': '0.0.0.0',
+}
+
+# Configure youtube-dl options for downloading (MP3 transcode)
 ytdl_download_opts = {
     'format': 'bestaudio/best',
     'outtmpl': '%(id)s.%(ext)s',
@@ -39,6 +72,450 @@ ytdl_download_opts = {
     }],
 }
 
+# Configure youtube-dl options for downloading the native audio stream
+# (Opus/WebM or M4A as served by YouTube, no postprocessing)
+ytdl_native_download_opts = {
+    'format': 'bestaudio[ext=webm]/bestaudio[ext=m4a]/bestaudio/best',
+    'outtmpl': '%(id)s.%(ext)s',
+    'noplaylist': True,
+    'nocheckcertificate': True,
+    'ignoreerrors': False,
+    'quiet': True,
+    'no_warnings': True,
+    'default_search': 'auto',
+    'source_address': '0.0.0.0',
+}
+
+# Audio format of downloaded files: 'mp3' (transcode) or 'native' (no re-encode)
+AUDIO_FORMAT = Config.AUDIO_FORMAT
+
+def get_download_opts(audio_format=AUDIO_FORMAT):
+    """
+    Get a copy of the yt-dlp download options for an audio format
+
+    Args:
+        audio_format (str): 'mp3' or 'native'
+
+    Returns:
+        dict: yt-dlp options
+    """
+    if audio_format == 'native':
+        return ytdl_native_download_opts.copy()
+    return ytdl_download_opts.copy()
+
+def downloaded_file_path(info, temp_dir, audio_format=AUDIO_FORMAT):
+    """
+    Get the path of the file produced by a download
+
+    Args:
+        info (dict): Info dict returned by the download
+        temp_dir (str): Directory the file was downloaded to
+        audio_format (str): 'mp3' or 'native'
+
+    Returns:
+        str: Path of the downloaded audio file
+    """
+    if audio_format == 'mp3':
+        return os.path.join(temp_dir, f"{info['id']}.mp3")
+
+    for download in info.get('requested_downloads') or []:
+        if download.get('filepath'):
+            return download['filepath']
+    return os.path.join(temp_dir, f"{info['id']}.{info.get('ext', 'webm')}")
+
+def _extract_info(query):
+    """
+    Blocking yt-dlp metadata extraction, run on the extractor pool
+
+    Args:
+        query (str): YouTube search query or URL
+
+    Returns:
+        dict: Extracted info of the first matching video or None
+    """
+    with extractor_backend.create(ytdl_opts) as ydl:
+        logger.info(f"Extracting info for query: {query}")
+        info = ydl.extract_info(query, download=False)
+
+        # Handle playlist (take first entry)
+        if 'entries' in info:
+            if not info['entries']:
+                return None
+            info = info['entries'][0]
+
+        return info
+
+# Metadata caches: normalized query -> video id, video id -> video details
+query_cache = TTLCache(Config.INFO_CACHE_SIZE, Config.INFO_CACHE_TTL)
+info_cache = TTLCache(Config.INFO_CACHE_SIZE, Config.INFO_CACHE_TTL)
+
+# Search results: (normalized query, limit) -> list of video details
+search_cache = TTLCache(Config.INFO_CACHE_SIZE, Config.INFO_CACHE_TTL)
+
+# In-flight request coalescing for metadata lookups (downloads are
+# coalesced by the download scheduler)
+metadata_flight = SingleFlight("metadata")
+
+# Running progressive downloads by video id
+progressive_downloads = {}
+progressive_flight_stats = {'started': 0, 'coalesced': 0}
+
+# Latency and outcome metrics of extractions and downloads
+EXTRACT_LATENCY = metrics.histogram('extract_seconds', 'yt-dlp metadata extraction time', ('kind',))
+DOWNLOAD_LATENCY = metrics.histogram('download_seconds', 'Audio download time', ('mode',))
+DOWNLOADS = metrics.counter('downloads_total', 'Audio downloads by outcome', ('mode', 'result'))
+AUDIO_CACHE_LOOKUPS = metrics.counter('audio_cache_lookups_total', 'Audio cache lookups before downloading', ('result',))
+
+YOUTUBE_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+def extract_video_id(query):
+    """
+    Get the YouTube video id from a URL
+
+    Args:
+        query (str): YouTube URL
+
+    Returns:
+        str: Video id or None if the query is not a recognizable video URL
+    """
+    try:
+        parsed = urlparse(query.strip())
+    except ValueError:
+        return None
+
+    host = (parsed.hostname or '').lower()
+    video_id = None
+    if host == 'youtu.be':
+        video_id = parsed.path.lstrip('/').split('/')[0]
+    elif host.endswith('youtube.com'):
+        if parsed.path == '/watch':
+            video_id = parse_qs(parsed.query).get('v', [None])[0]
+        elif parsed.path.startswith(('/shorts/', '/embed/', '/live/')):
+            video_id = parsed.path.split('/')[2]
+
+    if video_id and YOUTUBE_ID_RE.match(video_id):
+        return video_id
+    return None
+
+def is_playlist_url(query):
+    """
+    Check whether a query is a YouTube playlist URL
+
+    Watch URLs that only carry a list parameter still play the single video.
+
+    Args:
+        query (str): YouTube search query or URL
+
+    Returns:
+        bool: True for playlist URLs
+    """
+    try:
+        parsed = urlparse(query.strip())
+    except ValueError:
+        return False
+
+    host = (parsed.hostname or '').lower()
+    return (
+        host.endswith('youtube.com')
+        and parsed.path == '/playlist'
+        and bool(parse_qs(parsed.query).get('list'))
+    )
+
+def normalize_query(query):
+    """
+    Normalize a search query so equivalent requests share a cache entry
+
+    Args:
+        query (str): YouTube search query or URL
+
+    Returns:
+        str: Normalized cache key
+    """
+    video_id = extract_video_id(query)
+    if video_id:
+        return f"id:{video_id}"
+    return " ".join(query.lower().split())
+
+def _video_details(info):
+    """
+    Build the cached video details from an extracted info dict
+
+    Args:
+        info (dict): Info dict returned by yt-dlp
+
+    Returns:
+        dict: Video id, title, formatted duration, thumbnail and URL
+    """
+    duration_seconds = int(info.get('duration') or 0)
+
+    # Format duration as MM:SS
+    minutes, seconds = divmod(duration_seconds, 60)
+
+    return {
+        'id': info['id'],
+        'title': info['title'],
+        'duration': f"{minutes}:{seconds:02d}",
+        'duration_seconds': duration_seconds,
+        'thumbnail': info.get('thumbnail', ''),
+        'video_url': info.get('webpage_url', ''),
+    }
+
+def _flat_entry_details(entry):
+    """
+    Build video details from a flat playlist entry
+
+    Args:
+        entry (dict): Flat entry returned by yt-dlp
+
+    Returns:
+        dict: Video details without the full info dict
+    """
+    video_id = entry['id']
+    thumbnails = entry.get('thumbnails') or []
+    thumbnail = thumbnails[-1].get('url', '') if thumbnails else f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
+
+    return _video_details({
+        'id': video_id,
+        'title': entry.get('title') or video_id,
+        'duration': entry.get('duration'),
+        'thumbnail': thumbnail,
+        'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+    })
+
+def invalidate_video_info(query=None, video_id=None):
+    """
+    Drop cached metadata for a query and/or a video id
+
+    Args:
+        query (str, optional): Query whose cached resolution should be dropped
+        video_id (str, optional): Video whose cached details should be dropped
+    """
+    if query is not None:
+        key = normalize_query(query)
+        cached_id = query_cache.pop(key)
+        video_id = video_id or cached_id
+    if video_id is not None:
+        info_cache.pop(video_id)
+
+def clear_info_cache():
+    """Drop all cached metadata"""
+    query_cache.clear()
+    info_cache.clear()
+    search_cache.clear()
+
+def get_info_cache_stats():
+    """
+    Get metadata cache counters
+
+    Returns:
+        dict: Stats for the query and video caches
+    """
+    return {
+        'queries': query_cache.stats(),
+        'videos': info_cache.stats(),
+        'searches': search_cache.stats(),
+    }
+
+def get_coalescing_stats():
+    """
+    Get request coalescing counters
+
+    Returns:
+        dict: Stats for metadata lookups and downloads
+    """
+    return {
+        'metadata': metadata_flight.stats(),
+        'download': {'coalesced': download_scheduler.coalesced},
+        'progressive': dict(progressive_flight_stats, inflight=len(progressive_downloads)),
+    }
+
+async def resolve_video(query):
+    """
+    Resolve a query to video details, using the metadata cache when possible
+
+    Freshly extracted results also carry the full yt-dlp info dict under
+    'info' so the download step can reuse it instead of extracting again.
+
+    Args:
+        query (str): YouTube search query or URL
+
+    Returns:
+        dict: Video details (see _video_details) or None if error
+    """
+    try:
+        key = normalize_query(query)
+
+        # Serve repeated requests from the metadata cache; URLs already carry the video id
+        video_id = key[3:] if key.startswith('id:') else query_cache.get(key)
+        details = info_cache.get(video_id) if video_id else None
+
+        if details is not None:
+            logger.info(f"Metadata cache hit for query: {query}")
+            return details
+
+        # Concurrent lookups for the same query share one extraction
+        return await metadata_flight.run(key, _resolve_uncached, query, key)
+
+    except Exception as e:
+        logger.error(f"Error getting video info: {e}")
+        return None
+
+async def _resolve_uncached(query, key):
+    """
+    Extract video details for a query and store them in the metadata cache
+
+    Args:
+        query (str): YouTube search query or URL
+        key (str): Normalized query
+
+    Returns:
+        dict: Video details including the full info dict, or None if not found
+    """
+    # Run the extraction on the extractor pool to keep the event loop free
+    with EXTRACT_LATENCY.time(kind='video'), tracer.span('extract'):
+        info = await extractor_pool.run(_extract_info, query)
+    if not info:
+        return None
+
+    details = _video_details(info)
+    info_cache.set(details['id'], details)
+    query_cache.set(key, details['id'])
+    logger.info(f"Found video: {details['title']}")
+
+    return dict(details, info=info)
+
+def _extract_playlist(url):
+    """
+    Blocking flat playlist extraction, run on the extractor pool
+
+    Args:
+        url (str): YouTube playlist URL
+
+    Returns:
+        dict: Flat playlist info or None
+    """
+    with extractor_backend.create(ytdl_playlist_opts) as ydl:
+        logger.info(f"Extracting playlist: {url}")
+        return ydl.extract_info(url, download=False)
+
+async def get_playlist_entries(url):
+    """
+    Get the tracks of a playlist with a single flat extraction
+
+    Only ids, titles and durations are fetched; full metadata and audio are
+    resolved later when each track is about to play. The entries are also
+    stored in the metadata cache so that later lookup is free.
+
+    Args:
+        url (str): YouTube playlist URL
+
+    Returns:
+        tuple: (playlist_title, list of video details) or None if error
+    """
+    try:
+        with EXTRACT_LATENCY.time(kind='playlist'), tracer.span('extract_playlist'):
+            info = await extractor_pool.run(_extract_playlist, url)
+        if not info:
+            return None
+
+        entries = []
+        for entry in info.get('entries') or []:
+            if not entry or not entry.get('id'):
+                continue
+            details = _flat_entry_details(entry)
+            info_cache.set(details['id'], details)
+            entries.append(details)
+
+        logger.info(f"Found playlist with {len(entries)} tracks: {info.get('title')}")
+        return info.get('title') or 'Playlist', entries
+
+    except Exception as e:
+        logger.error(f"Error getting playlist: {e}")
+        return None
+
+def _extract_search(query, limit):
+    """
+    Blocking flat YouTube search, run on the extractor pool
+
+    Args:
+        query (str): Search terms
+        limit (int): Number of results
+
+    Returns:
+        dict: Flat search result info or None
+    """
+    with extractor_backend.create(ytdl_search_opts) as ydl:
+        logger.info(f"Searching YouTube for {limit} results: {query}")
+        return ydl.extract_info(f"ytsearch{limit}:{query}", download=False)
+
+async def search(query, limit=Config.SEARCH_RESULTS):
+    """
+    Search YouTube and return several lightweight results in one call
+
+    Results come from a flat extraction (no per-video requests), are cached
+    by query, and seed the metadata cache so playing one of them is cheap.
+    A video URL returns that single video.
+
+    Args:
+        query (str): YouTube search query or URL
+        limit (int): Maximum number of results
+
+    Returns:
+        list: Video details (without the full info dict), or None if error
+    """
+    try:
+        if extract_video_id(query):
+            video = await resolve_video(query)
+            if not video:
+                return None
+            video = dict(video)
+            video.pop('info', None)
+            return [video]
+
+        key = (normalize_query(query), limit)
+        results = search_cache.get(key)
+        if results is not None:
+            logger.info(f"Search cache hit for query: {query}")
+            return results
+
+        # Concurrent identical searches share one extraction
+        return await metadata_flight.run(('search', key), _search_uncached, query, limit, key)
+
+    except Exception as e:
+        logger.error(f"Error searching YouTube: {e}")
+        return None
+
+async def _search_uncached(query, limit, key):
+    """
+    Run a flat search and store the results in the search and metadata caches
+
+    Args:
+        query (str): Search terms
+        limit (int): Number of results
+        key (tuple): Search cache key
+
+    Returns:
+        list: Video details
+    """
+    with EXTRACT_LATENCY.time(kind='search'):
+        info = await extractor_pool.run(_extract_search, query, limit)
+
+    results = []
+    for entry in (info or {}).get('entries') or []:
+        if not entry or not entry.get('id'):
+            continue
+        details = _flat_entry_details(entry)
+        info_cache.set(details['id'], details)
+        results.append(details)
+
+    # The top hit is what a plain lookup of the same query resolves to
+    if results:
+        query_cache.set(key[0], results[0]['id'])
+
+    search_cache.set(key, results)
+    logger.info(f"Found {len(results)} search results for: {query}")
+    return results
+
 async def get_video_info(query):
     """
     Get video information from YouTube
@@ -49,82 +526,379 @@ async def get_video_info(query):
     Returns:
         tuple: (title, duration, thumbnail_url, video_url) or None if error
     """
-    try:
-        with youtube_dl.YoutubeDL(ytdl_opts) as ydl:
-            logger.info(f"Extracting info for query: {query}")
-            info = ydl.extract_info(query, download=False)
-            
-            # Handle playlist (take first entry)
-            if 'entries' in info:
-                if not info['entries']:
-                    return None
-                info = info['entries'][0]
-                
-            # Get video details
-            title = info['title']
-            duration_seconds = info.get('duration', 0)
-            thumbnail = info.get('thumbnail', '')
-            video_url = info.get('webpage_url', '')
-            
-            # Format duration as MM:SS
-            minutes, seconds = divmod(duration_seconds, 60)
-            duration = f"{minutes}:{seconds:02d}"
-            
-            logger.info(f"Found video: {title}")
-            return title, duration, thumbnail, video_url
-            
-    except Exception as e:
-        logger.error(f"Error getting video info: {e}")
+    video = await resolve_video(query)
+    if not video:
         return None
 
-async def download_and_extract_audio(query):
+    return video['title'], video['duration'], video['thumbnail'], video['video_url']
+
+def _cancel_hook(cancel_event):
+    """
+    Build a yt-dlp progress hook that aborts the download once cancelled
+
+    Args:
+        cancel_event (threading.Event): Set by the download scheduler on cancel
+
+    Returns:
+        callable: Progress hook
+    """
+    def _hook(status):
+        if cancel_event.is_set():
+            raise youtube_dl.utils.DownloadCancelled()
+    return _hook
+
+async def download_and_extract_audio(query, video=None, priority=Priority.NOW_PLAYING, chat_id=None):
     """
     Download and extract audio from a YouTube video
     
     Args:
         query (str): YouTube search query or URL
+        video (dict, optional): Details already returned by resolve_video for
+            this query; its extracted info is reused instead of resolving again
+        priority (Priority): Scheduling priority of the download
+        chat_id (int, optional): Chat the download is for, so it can be cancelled
     
     Returns:
         tuple: (audio_file_path, title, duration, thumbnail_url) or None if error
     """
     try:
-        # First, get video info to show details to the user
-        video_info = await get_video_info(query)
-        if not video_info:
+        # Resolve the query unless the caller already did
+        if video is None:
+            video = await resolve_video(query)
+        if not video:
+            return None
+
+        # Reuse a previously downloaded file for this video
+        audio_file = audio_cache.lookup(video['id'], AUDIO_FORMAT)
+        AUDIO_CACHE_LOOKUPS.inc(result='hit' if audio_file else 'miss')
+        if audio_file:
+            logger.info(f"Audio cache hit: {audio_file}")
+        else:
+            # Concurrent downloads of the same video share one scheduled download
+            audio_file = await download_scheduler.submit(
+                (video['id'], AUDIO_FORMAT),
+                lambda cancel_event: _download_audio(video, cancel_event),
+                priority,
+                chat_id
+            )
+        if not audio_file:
             return None
+
+        return audio_file, video['title'], video['duration'], video['thumbnail']
+        
+    except Exception as e:
+        logger.error(f"Error downloading audio: {e}")
+        return None
+
+def cancel_download(query, chat_id):
+    """
+    Withdraw a chat's request for the download of a video
+
+    The download is only cancelled if no other chat still needs it.
+
+    Args:
+        query (str): YouTube URL the download was requested for
+        chat_id (int): Chat that no longer needs it
+    """
+    video_id = extract_video_id(query or '')
+    if video_id:
+        download_scheduler.cancel((video_id, AUDIO_FORMAT), chat_id)
+
+async def _download_audio(video, cancel_event):
+    """
+    Download the audio of a resolved video into the audio cache
+
+    Args:
+        video (dict): Details returned by resolve_video
+        cancel_event (threading.Event): Set when the download should abort
+
+    Returns:
+        str: Path of the cached audio file or None if the download failed
+    """
+    resolved_info = video.get('info')
+
+    # Another job may have finished this file while we were queued
+    audio_file = audio_cache.lookup(video['id'], AUDIO_FORMAT)
+    if audio_file:
+        return audio_file
+    
+    # Download into a private directory inside the cache
+    temp_dir = audio_cache.make_temp_dir()
+    
+    # Set the output template to the temp directory
+    download_opts = get_download_opts()
+    download_opts['outtmpl'] = os.path.join(temp_dir, '%(id)s.%(ext)s')
+    # When yt-dlp reports the download finished, postprocessing (the MP3 transcode) starts
+    downloaded_at = []
+
+    def _finished_hook(status):
+        if status.get('status') == 'finished' and not downloaded_at:
+            downloaded_at.append(time.perf_counter())
+
+    download_opts['progress_hooks'] = [_cancel_hook(cancel_event), _finished_hook]
+    
+    # Run the download in a separate thread to not block the main event loop
+    def _download():
+        with extractor_backend.create(download_opts) as ydl:
+            if resolved_info is not None:
+                # Reuse the formats from the metadata extraction (no extra YouTube request)
+                return ydl.process_ie_result(resolved_info, download=True)
+
+            info = ydl.extract_info(video['video_url'], download=True)
+            # Handle playlist (take first entry)
+            if 'entries' in info:
+                info = info['entries'][0]
+            return info
             
-        title, duration, thumbnail, video_url = video_info
+    try:
+        # Run the download function in a thread pool
+        logger.info(f"Downloading audio for: {video['title']}")
+        started = time.perf_counter()
+        with DOWNLOAD_LATENCY.time(mode='download'):
+            info = await asyncio.to_thread(_download)
+        finished = time.perf_counter()
+        fetched = downloaded_at[0] if downloaded_at else finished
+        tracer.record('download', started, fetched)
+        if fetched < finished:
+            tracer.record('postprocess', fetched, finished)
         
-        # Create a temporary directory to store the audio file
-        temp_dir = tempfile.mkdtemp()
+        # Get the path of the downloaded file
+        downloaded_file = downloaded_file_path(info, temp_dir)
         
-        # Set the output template to the temp directory
-        download_opts = ytdl_download_opts.copy()
-        download_opts['outtmpl'] = os.path.join(temp_dir, '%(id)s.%(ext)s')
+        if not os.path.exists(downloaded_file):
+            logger.error(f"Downloaded file not found: {downloaded_file}")
+            DOWNLOADS.inc(mode='download', result='failed')
+            return None
+
+        # Move the finished file into the cache atomically
+        audio_file = audio_cache.store(video['id'], AUDIO_FORMAT, downloaded_file)
+        DOWNLOADS.inc(mode='download', result='ok')
+    except Exception:
+        DOWNLOADS.inc(mode='download', result='failed')
+        raise
+    finally:
+        audio_cache.remove_temp_dir(temp_dir)
         
-        # Run the download in a separate thread to not block the main event loop
+    logger.info(f"Audio downloaded: {audio_file}")
+    return audio_file
+
+class ProgressiveDownload:
+    """
+    Native audio download running in the background whose file can be
+    played while it is still being written
+    """
+    def __init__(self, video, path, complete=False):
+        """
+        Initialize the progressive download
+
+        Args:
+            video (dict): Video details from resolve_video
+            path (str): File the audio is written to
+            complete (bool): Whether the file is already complete (cache hit)
+        """
+        self.video = video
+        self.path = path
+        self.complete = complete
+        self._task = None
+        self._callbacks = []
+
+        # Scheduler job shared by every chat streaming this download
+        self.key = ('stream', video['id'])
+        self._download_opts = None
+
+    @property
+    def done(self):
+        """Whether the download has finished, successfully or not"""
+        return self._task is None or self._task.done()
+
+    def buffered_bytes(self):
+        """Get the number of bytes written so far"""
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def add_done_callback(self, callback):
+        """
+        Call a function with the final file path once the download completes
+
+        Args:
+            callback (callable): Called with the cached file path
+        """
+        if self.complete:
+            callback(self.path)
+        else:
+            self._callbacks.append(callback)
+
+    def release(self, chat_id):
+        """
+        Withdraw a chat's interest in the download
+
+        The download keeps running for the other chats streaming it and is
+        aborted at its next progress update once no chat is left.
+
+        Args:
+            chat_id (int): Chat that no longer plays this download
+        """
+        download_scheduler.cancel(self.key, chat_id)
+
+    def join(self, chat_id):
+        """
+        Register a chat that streams this download with its scheduler job
+
+        The job is only cancelled once every chat streaming it withdrew
+        (e.g. with /stop), so one chat cannot cut the file off for another.
+
+        Args:
+            chat_id (int): Chat joining the download
+        """
+        waiter = download_scheduler.enqueue(self.key, self._job, Priority.NOW_PLAYING, chat_id)
+        # The first chat's _schedule task reports the outcome; just retrieve it here
+        waiter.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+    async def wait_for_buffer(self, min_bytes, timeout):
+        """
+        Wait until enough audio has been written to start playback
+
+        Args:
+            min_bytes (int): Bytes that must be on disk
+            timeout (float): Seconds to wait at most
+
+        Returns:
+            bool: True if playback can start, False if the download failed or timed out
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self.done:
+            if self.buffered_bytes() >= min_bytes:
+                return True
+            if loop.time() >= deadline:
+                logger.warning(f"Timed out buffering audio for: {self.video['title']}")
+                return False
+            await asyncio.sleep(0.1)
+        return self.complete
+
+    async def wait_complete(self):
+        """
+        Wait for the download to finish
+
+        Returns:
+            bool: True if the complete file is available at self.path
+        """
+        if self._task is not None:
+            await asyncio.shield(self._task)
+        return self.complete
+
+    async def _schedule(self, waiter, temp_dir):
+        """Wait for the scheduled download and clean up after it"""
+        try:
+            await waiter
+        except Exception as e:
+            logger.error(f"Progressive download did not complete: {e}")
+        finally:
+            self._callbacks.clear()
+            audio_cache.remove_temp_dir(temp_dir)
+
+    async def _job(self, cancel_event):
+        """Scheduler job: download the file and move it into the audio cache when complete"""
+        download_opts = self._download_opts
+        resolved_info = self.video.get('info')
+
+        def _progress_hook(status):
+            if cancel_event.is_set():
+                raise youtube_dl.utils.DownloadCancelled()
+
+        download_opts['progress_hooks'] = [_progress_hook]
+
         def _download():
-            with youtube_dl.YoutubeDL(download_opts) as ydl:
-                info = ydl.extract_info(video_url, download=True)
-                # Handle playlist (take first entry)
+            with extractor_backend.create(download_opts) as ydl:
+                if resolved_info is not None:
+                    return ydl.process_ie_result(resolved_info, download=True)
+
+                info = ydl.extract_info(self.video['video_url'], download=True)
                 if 'entries' in info:
                     info = info['entries'][0]
                 return info
-                
-        # Run the download function in a thread pool
-        logger.info(f"Downloading audio for: {title}")
-        info = await asyncio.to_thread(_download)
-        
-        # Get the path of the downloaded file
-        audio_file = os.path.join(temp_dir, f"{info['id']}.mp3")
-        
-        if not os.path.exists(audio_file):
-            logger.error(f"Downloaded file not found: {audio_file}")
+
+        try:
+            with DOWNLOAD_LATENCY.time(mode='progressive'):
+                info = await asyncio.to_thread(_download)
+            self.path = audio_cache.store(self.video['id'], 'native', self.path, ext=info.get('ext'))
+            self.complete = True
+            DOWNLOADS.inc(mode='progressive', result='ok')
+            logger.info(f"Progressive download complete: {self.path}")
+
+            for callback in self._callbacks:
+                try:
+                    callback(self.path)
+                except Exception as e:
+                    logger.error(f"Error in download callback: {e}")
+        except Exception as e:
+            DOWNLOADS.inc(mode='progressive', result='failed')
+            logger.error(f"Error in progressive download: {e}")
+            raise
+
+async def start_progressive_download(query, video=None, chat_id=None):
+    """
+    Start downloading the native audio of a video in the background
+
+    The file is written in place (no .part file) so it can be streamed
+    while it grows; once complete it is moved into the audio cache.
+
+    Args:
+        query (str): YouTube search query or URL
+        video (dict, optional): Details already returned by resolve_video
+        chat_id (int, optional): Chat the download is for, so it can be cancelled
+
+    Returns:
+        ProgressiveDownload: Running (or already complete) download, or None if error
+    """
+    try:
+        if video is None:
+            video = await resolve_video(query)
+        if not video:
             return None
-            
-        logger.info(f"Audio downloaded: {audio_file}")
-        return audio_file, title, duration, thumbnail
-        
+
+        # A complete file in either format can be played right away
+        cached = audio_cache.lookup(video['id'], 'native') or audio_cache.lookup(video['id'], AUDIO_FORMAT)
+        AUDIO_CACHE_LOOKUPS.inc(result='hit' if cached else 'miss')
+        if cached:
+            logger.info(f"Audio cache hit: {cached}")
+            return ProgressiveDownload(video, cached, complete=True)
+
+        # Join a progressive download of the same video that is still running
+        running = progressive_downloads.get(video['id'])
+        if running is not None and not running.done and download_scheduler.active(running.key):
+            running.join(chat_id)
+            progressive_flight_stats['coalesced'] += 1
+            logger.info(f"Coalesced progressive download for: {video['id']}")
+            return running
+
+        progressive_flight_stats['started'] += 1
+        temp_dir = audio_cache.make_temp_dir()
+        download = ProgressiveDownload(video, os.path.join(temp_dir, f"{video['id']}.stream"))
+
+        download_opts = get_download_opts('native')
+        download_opts['outtmpl'] = download.path
+        download_opts['nopart'] = True
+        download._download_opts = download_opts
+
+        # Register the chat with the scheduler job before any other chat can join it
+        logger.info(f"Starting progressive download for: {video['title']}")
+        waiter = download_scheduler.enqueue(download.key, download._job, Priority.NOW_PLAYING, chat_id)
+        download._task = asyncio.create_task(download._schedule(waiter, temp_dir))
+        progressive_downloads[video['id']] = download
+
+        def _forget(_):
+            if progressive_downloads.get(video['id']) is download:
+                del progressive_downloads[video['id']]
+
+        download._task.add_done_callback(_forget)
+        return download
+
     except Exception as e:
-        logger.error(f"Error downloading audio: {e}")
+        logger.error(f"Error starting progressive download: {e}")
         return None
+
+metrics.register_stats('metadata_cache', get_info_cache_stats, counters=('*.hits', '*.misses', '*.evictions'))
+metrics.register_stats('coalescing', get_coalescing_stats, counters=('*.started', '*.coalesced'))
@@ -49,6 +49,12 @@ def run_telegram_bot():
                     await client.start()
                     
                 logger.info("Bot is now running!")
+
+                # Start the player and resume the queues saved before the last restart
+                from bot.helpers import music_player
+                if music_player is not None:
+                    await music_player.start()
+                    await music_player.restore_state()
                 
                 # Instead of using client.idle(), we'll create our own idle function
                 # to keep the bot running until interrupted
@@ -62,6 +68,12 @@ def run_telegram_bot():
             except Exception as e:
                 logger.error(f"Error during bot runtime: {e}")
             finally:
+                # Save the latest queues and disconnect the assistants before shutting down
+                from bot.helpers import music_player
+                if music_player is not None:
+                    await music_player.save_state()
+                    await music_player.shutdown()
+
                 # Stop the client if it's still connected
                 if client.is_connected:
                     await client.stop()
@@ -0,0 +1,120 @@
+"""
+Shared test setup: run the bot modules against the offline fake extractor backend.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Must be set before bot modules read the configuration
+_scratch = tempfile.mkdtemp(prefix="bot-tests-")
+os.environ["EXTRACTOR_BACKEND"] = "fake"
+os.environ["FAKE_EXTRACT_LATENCY"] = "0.05"
+os.environ["FAKE_DOWNLOAD_LATENCY"] = "0.5"
+os.environ["FAKE_TRACK_SECONDS"] = "2"
+os.environ["FAKE_AUDIO_DIR"] = os.path.join(_scratch, "fake_audio")
+os.environ["AUDIO_CACHE_DIR"] = os.path.join(_scratch, "downloads")
+os.environ["PERSIST_STATE"] = "false"
+
+@pytest.fixture(scope="session")
+def run():
+    """
+    Run coroutines on one event loop shared by the whole session
+
+    The bot's module-level caches, flights and scheduler outlive a single
+    test, so every test drives them from the same loop.
+    """
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+
+    # Stop background loops such as the audio cache reaper
+    pending = asyncio.all_tasks(loop)
+    for task in pending:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+    loop.close()
+
+@pytest.fixture
+def backend():
+    """The fake extractor backend used by bot.ytdl"""
+    from bot.extractors import extractor_backend
+    return extractor_backend
+
+class FakeCalls:
+    """PyTgCalls stand-in that records what the player asks of it"""
+    def __init__(self, client):
+        self.client = client
+        self.handler = None
+
+        # (method, chat_id) of every call, and chats whose voice chat was joined
+        self.log = []
+        self.joined = set()
+
+        # method -> exception raised by its next call
+        self.failures = {}
+
+    def on_update(self):
+        def _register(handler):
+            self.handler = handler
+            return handler
+        return _register
+
+    async def start(self):
+        pass
+
+    def _record(self, method, chat_id):
+        self.log.append((method, chat_id))
+        error = self.failures.pop(method, None)
+        if error is not None:
+            raise error
+
+    async def join_group_call(self, chat_id, stream=None, stream_type=None):
+        self._record('join_group_call', chat_id)
+        self.joined.add(chat_id)
+
+    async def change_stream(self, chat_id, stream):
+        self._record('change_stream', chat_id)
+
+    async def leave_call(self, chat_id):
+        self._record('leave_call', chat_id)
+        self.joined.discard(chat_id)
+
+    async def pause(self, chat_id):
+        self._record('pause', chat_id)
+
+    async def resume(self, chat_id):
+        self._record('resume', chat_id)
+
+    async def change_volume_call(self, chat_id, volume):
+        self._record('change_volume_call', chat_id)
+
+    def calls_of(self, method):
+        """Get the chats a method was called for, in order"""
+        return [chat_id for name, chat_id in self.log if name == method]
+
+class FakeClient:
+    """Pyrogram client stand-in; the bot's own client is the only assistant"""
+    is_connected = False
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+@pytest.fixture
+def player(monkeypatch):
+    """A MusicPlayer whose assistant is a FakeCalls"""
+    import bot.assistants
+    from bot.music_player import MusicPlayer
+
+    monkeypatch.setattr(bot.assistants, "PyTgCalls", FakeCalls)
+    return MusicPlayer(FakeClient())
+
+@pytest.fixture
+def calls(player):
+    """The FakeCalls of the player's assistant"""
+    return player.assistants.assistants[0].calls
@@ -0,0 +1,35 @@
+"""
+Tests for the extractor backends.
+"""
+import threading
+import pytest
+from bot.extractors import ExtractorBackend, FakeBackend, fake_video_id
+
+def test_backend_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        ExtractorBackend()
+
+def test_fake_backend_resolves_search_to_stable_video(backend):
+    with backend.create({'quiet': True}) as ydl:
+        first = ydl.extract_info("some song", download=False)
+        second = ydl.extract_info("  Some   Song ", download=False)
+
+    assert first['id'] == fake_video_id("some song#0")
+    assert second['id'] == first['id']
+    assert first['duration'] == backend.track_seconds
+
+def test_fake_backend_counts_from_many_threads(tmp_path):
+    backend = FakeBackend(0, 0, 1, str(tmp_path))
+
+    def _extract():
+        for _ in range(200):
+            with backend.create({}) as ydl:
+                ydl.extract_info("counter test", download=False)
+
+    threads = [threading.Thread(target=_extract) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert backend.stats()['extractions'] == 8 * 200
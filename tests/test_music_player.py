@@ -0,0 +1,36 @@
+"""
+Tests for the music player, driven through a fake PyTgCalls and the fake extractor backend.
+"""
+import pytest
+from bot.assistants import NoAssistantAvailable
+
+def test_read_only_commands_do_not_place_the_chat(run, player):
+    with pytest.raises(NoAssistantAvailable):
+        player._calls(-100)
+    for command in (player.pause, player.resume, player.skip):
+        assert run(command(-100)).startswith("❌")
+
+    assert player.assistants.get(-100) is None
+    assert player.assistants.stats()['chats'] == 0
+
+def test_play_places_the_chat_and_joins(run, player, calls):
+    run(player.play(-101, "placed song", None))
+
+    assert player.assistants.get(-101) is not None
+    assert calls.calls_of('join_group_call')[-1] == -101
+    assert player.chats[-101].now_playing.title == "Placed Song (1)"
+
+    run(player.stop(-101))
+    assert player.assistants.get(-101) is None
+
+def test_failed_cold_start_leaves_the_call_joined_by_the_voice_check(run, player, calls):
+    async def _broken_fetch(query, video=None, chat_id=None):
+        raise RuntimeError("fetch failed")
+    player._fetch_audio = _broken_fetch
+
+    assert run(player.play(-102, "broken song", None)).startswith("❌")
+
+    assert calls.calls_of('join_group_call') == [-102]
+    assert calls.calls_of('leave_call') == [-102]
+    assert player.assistants.get(-102) is None
+    assert -102 not in player.chats
@@ -0,0 +1,135 @@
+"""
+Tests for resolving, downloading and coalescing through the fake extractor backend.
+"""
+import asyncio
+import os
+from bot.scheduler import download_scheduler
+from bot.ytdl import (
+    AUDIO_FORMAT, resolve_video, download_and_extract_audio, cancel_download,
+    start_progressive_download
+)
+
+def test_resolve_video_is_cached(run, backend):
+    extractions = backend.extractions
+    video = run(resolve_video("cached resolve"))
+    again = run(resolve_video("cached resolve"))
+
+    assert video['title'] == "Cached Resolve (1)"
+    assert again['id'] == video['id']
+    assert backend.extractions == extractions + 1
+
+def test_concurrent_resolves_share_one_extraction(run, backend):
+    async def _resolve_all():
+        return await asyncio.gather(*(resolve_video("coalesced resolve") for _ in range(5)))
+
+    extractions = backend.extractions
+    videos = run(_resolve_all())
+
+    assert len({video['id'] for video in videos}) == 1
+    assert backend.extractions == extractions + 1
+
+def test_download_is_served_from_the_audio_cache(run, backend):
+    downloads = backend.downloads
+    first = run(download_and_extract_audio("cached download"))
+    second = run(download_and_extract_audio("cached download"))
+
+    assert os.path.exists(first[0])
+    assert second[0] == first[0]
+    assert backend.downloads == downloads + 1
+
+def test_concurrent_downloads_share_one_job(run, backend):
+    async def _download_all():
+        return await asyncio.gather(*(
+            download_and_extract_audio("shared download", chat_id=chat_id) for chat_id in (1, 2, 3)
+        ))
+
+    downloads = backend.downloads
+    results = run(_download_all())
+
+    assert len({result[0] for result in results}) == 1
+    assert backend.downloads == downloads + 1
+
+def test_download_survives_one_chat_withdrawing(run, backend):
+    video = run(resolve_video("withdrawn download"))
+
+    async def _withdraw_one():
+        first = asyncio.ensure_future(download_and_extract_audio(video['video_url'], video, chat_id=1))
+        second = asyncio.ensure_future(download_and_extract_audio(video['video_url'], video, chat_id=2))
+        await asyncio.sleep(0.1)
+        cancel_download(video['video_url'], 1)
+        return await first, await second
+
+    first, second = run(_withdraw_one())
+
+    # The job is shared, so the chat that withdrew still gets the finished file
+    assert second is not None and os.path.exists(second[0])
+    assert first == second
+
+def test_download_aborts_when_every_chat_withdraws(run, backend):
+    video = run(resolve_video("abandoned download"))
+
+    async def _withdraw_all():
+        downloads = [
+            asyncio.ensure_future(download_and_extract_audio(video['video_url'], video, chat_id=chat_id))
+            for chat_id in (1, 2)
+        ]
+        await asyncio.sleep(0.1)
+        download_scheduler.cancel((video['id'], AUDIO_FORMAT), 1)
+        download_scheduler.cancel((video['id'], AUDIO_FORMAT), 2)
+        return await asyncio.gather(*downloads)
+
+    aborted = backend.aborted
+    assert run(_withdraw_all()) == [None, None]
+    assert backend.aborted == aborted + 1
+
+def test_progressive_download_coalesces(run, backend):
+    async def _start_twice():
+        first = await start_progressive_download("coalesced stream", chat_id=1)
+        second = await start_progressive_download("coalesced stream", chat_id=2)
+        return first, second, await first.wait_complete()
+
+    downloads = backend.downloads
+    first, second, complete = run(_start_twice())
+
+    assert second is first
+    assert complete and os.path.exists(first.path)
+    assert backend.downloads == downloads + 1
+
+def test_progressive_download_survives_stop_in_one_chat(run):
+    async def _stop_one():
+        download = await start_progressive_download("stopped stream", chat_id=1)
+        await start_progressive_download("stopped stream", chat_id=2)
+        await asyncio.sleep(0.1)
+        # /stop in the chat that started the download
+        download_scheduler.cancel_chat(1)
+        return download, await download.wait_complete()
+
+    download, complete = run(_stop_one())
+
+    assert complete and os.path.exists(download.path)
+
+def test_progressive_download_survives_release_by_one_chat(run):
+    async def _release_one():
+        download = await start_progressive_download("released stream", chat_id=1)
+        await start_progressive_download("released stream", chat_id=2)
+        await asyncio.sleep(0.1)
+        # Buffer timeout in one chat
+        download.release(2)
+        return download, await download.wait_complete()
+
+    download, complete = run(_release_one())
+
+    assert complete and os.path.exists(download.path)
+
+def test_progressive_download_aborts_when_every_chat_releases(run, backend):
+    async def _release_all():
+        download = await start_progressive_download("released everywhere", chat_id=1)
+        await start_progressive_download("released everywhere", chat_id=2)
+        await asyncio.sleep(0.1)
+        download.release(1)
+        download.release(2)
+        return await download.wait_complete()
+
+    aborted = backend.aborted
+    assert run(_release_all()) is False
+    assert backend.aborted == aborted + 1